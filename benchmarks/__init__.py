@@ -0,0 +1,9 @@
+'''Benchmarks for the kcam hot paths.
+
+Run the whole suite from the top of the repository with:
+
+    python -m benchmarks
+
+Results are written as JSON to `benchmarks/results/<commit>.json`, and
+a previous result file can be compared against the current run with
+`--compare`.  See `python -m benchmarks --help` for options.'''
@@ -0,0 +1,84 @@
+import argparse
+import importlib
+import logging
+import sys
+
+from pathlib import Path
+
+from benchmarks import runner
+
+LOG = logging.getLogger(__name__)
+
+SUITES = ['observer', 'taskmanager', 'html', 'thumbnail', 'dates']
+
+
+def parse_args():
+    p = argparse.ArgumentParser(prog='python -m benchmarks')
+    p.add_argument('--output-dir', '-o',
+                   default=str(Path(__file__).parent / 'results'))
+    p.add_argument('--compare', '-c', metavar='RESULTS',
+                   help='compare with a previous results file')
+    p.add_argument('--threshold', type=float, default=0.1,
+                   help='relative slowdown reported as a regression')
+    p.add_argument('--sizes', '-s',
+                   type=lambda v: [int(x) for x in v.split(',')],
+                   default=[1000, 10000, 100000],
+                   help='event counts for the html benchmarks')
+    p.add_argument('--workers', '-w', type=int, default=4)
+    p.add_argument('--timeout', type=int, default=300)
+    p.add_argument('--quick', '-q', action='store_true',
+                   help='fewer iterations and only the smallest size')
+    p.add_argument('--verbose', '-v', action='store_true')
+    p.add_argument('suites', nargs='*',
+                   help='benchmarks to run (default: all of %s)' %
+                   ', '.join(SUITES))
+    args = p.parse_args()
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        p.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level='DEBUG' if args.verbose else 'INFO',
+        format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
+    if not args.verbose:
+        logging.getLogger('kcam').setLevel('WARNING')
+
+    if args.quick:
+        args.sizes = args.sizes[:1]
+
+    # load this first, in case it is about to be overwritten
+    baseline = runner.load(args.compare) if args.compare else None
+
+    results = runner.Results()
+    for name in args.suites or SUITES:
+        LOG.info('running %s benchmarks', name)
+        suite = importlib.import_module('benchmarks.bench_%s' % name)
+        suite.run(results, args)
+
+    path = results.save(args.output_dir)
+    LOG.info('wrote results to %s', path)
+
+    if baseline is not None:
+        report = runner.compare(baseline, dict(results=results.results),
+                                threshold=args.threshold)
+
+        regressions = 0
+        for name, before, after, change, regressed in report:
+            print('{:<40} {:>12.6g} {:>12.6g} {:>+8.1%}{}'.format(
+                name, before, after, change,
+                '  REGRESSION' if regressed else ''))
+            regressions += regressed
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+'''Parsing event times from event directory paths'''
+
+import datetime
+
+from pathlib import Path
+
+from kcam.util import date_from_path
+
+from benchmarks.runner import timed
+
+
+def run(results, options):
+    count = 1000 if options.quick else 10000
+    start = datetime.datetime(2020, 1, 1)
+    paths = [Path((start + datetime.timedelta(minutes=i))
+                  .strftime('%Y/%m/%d/%H:%M:%S'))
+             for i in range(count)]
+
+    times = timed(lambda: [date_from_path(path) for path in paths])
+    results.record('util.date_from_path', count / min(times), 'paths/s')
@@ -0,0 +1,75 @@
+'''UpdateEventHTML and UpdateEventListHTML with large event indexes.
+
+The event index is filled directly with `size` events, twenty minutes
+apart.  Only a sample of the events has a directory containing media,
+since that is all UpdateEventHTML needs.'''
+
+import datetime
+import tempfile
+
+from pathlib import Path
+
+from kcam.eventindex import EventIndex, format_time
+from kcam.tasks import UpdateEventHTML, UpdateEventListHTML
+
+from benchmarks.runner import timed
+
+EVENT_INTERVAL = datetime.timedelta(minutes=20)
+SAMPLE = 100
+MEDIA = ['image-1.jpg', 'image-1-thumb.jpg',
+         'image-2.jpg', 'image-2-thumb.jpg',
+         'video-1.mp4']
+
+
+def event_times(size):
+    start = datetime.datetime(2020, 1, 1)
+    return [start + EVENT_INTERVAL * i for i in range(size)]
+
+
+def populate(datadir, events):
+    index = EventIndex(datadir)
+
+    with index.connection() as conn:
+        conn.executemany(
+            'INSERT INTO events (path, event, images, videos) '
+            'VALUES (?, ?, 2, 1)',
+            ((event.strftime('%Y/%m/%d/%H:%M:%S'), format_time(event))
+             for event in events))
+
+    sample = events[-SAMPLE:]
+    for event in sample:
+        path = datadir / event.strftime('%Y/%m/%d/%H:%M:%S')
+        path.mkdir(parents=True)
+        for name in MEDIA:
+            (path / name).write_bytes(b'x' * 1024)
+
+    return sample
+
+
+def run(results, options):
+    for size in options.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            datadir = Path(tmpdir)
+            events = event_times(size)
+            sample = populate(datadir, events)
+
+            task = UpdateEventHTML()
+            args = [{'datadir': tmpdir,
+                     'event': event,
+                     'path': str(datadir /
+                                 event.strftime('%Y/%m/%d/%H:%M:%S'))}
+                    for event in sample]
+            times = timed(lambda: [task(arg) for arg in args], repeat=3)
+            results.record_times('html.event.%d' % size,
+                                 [t / len(args) for t in times],
+                                 per='event')
+
+            task = UpdateEventListHTML()
+            times = timed(lambda: task({'datadir': tmpdir}),
+                          repeat=1 if size >= 100000 else 3)
+            results.record_times('html.eventlist.full.%d' % size, times)
+
+            times = timed(lambda: task({'datadir': tmpdir,
+                                        'event': events[-1]}))
+            results.record_times('html.eventlist.incremental.%d' % size,
+                                 times)
@@ -0,0 +1,52 @@
+'''Observable.notify_observers fan-out throughput'''
+
+import functools
+
+from kcam import observer
+
+from benchmarks.runner import timed
+
+FANOUT = [1, 10, 100]
+
+
+def noop(arg):
+    pass
+
+
+def run(results, options):
+    deliveries = 20000 if options.quick else 200000
+
+    for count in FANOUT:
+        notifications = deliveries // count
+        subject = observer.Observable()
+        for i in range(count):
+            # each observer needs its own callback, since observers
+            # are keyed on the callback
+            subject.add_observer(None, callback=functools.partial(noop))
+
+        times = timed(
+            lambda: [subject.notify_observers(i)
+                     for i in range(notifications)])
+        results.record('observer.notify.inline.%d' % count,
+                       notifications * count / min(times), 'deliveries/s')
+
+        subject.clear_observers()
+
+    # queued dispatch only measures the cost to the notifier, which
+    # is what the camera and sensor threads see.
+    for count in FANOUT:
+        notifications = deliveries // count
+        dispatcher = functools.partial(observer.QueuedDispatcher,
+                                       maxsize=notifications, policy='drop')
+        subject = observer.Observable()
+        for i in range(count):
+            subject.add_observer(None, callback=functools.partial(noop),
+                                 dispatcher=dispatcher)
+
+        times = timed(
+            lambda: [subject.notify_observers(i)
+                     for i in range(notifications)])
+        results.record('observer.notify.queued.%d' % count,
+                       notifications * count / min(times), 'deliveries/s')
+
+        subject.clear_observers()
@@ -0,0 +1,67 @@
+'''TaskManager throughput with stubbed tasks.
+
+The task graph has the same shape as the one kcam builds in
+`KCam.create_taskmanager`, but every task returns immediately, so this
+measures the overhead of scheduling and supervision rather than the
+work itself.'''
+
+import tempfile
+import time
+
+from pathlib import Path
+
+from kcam.taskmanager import TaskManager
+
+
+class StubTask(object):
+    def __call__(self, arg):
+        return True
+
+
+class StubSinkTask(StubTask):
+    def merge(self, arglist):
+        return arglist[-1]
+
+
+def build(workers):
+    tm = TaskManager(workers=workers, ramp_interval=0, niceness=0)
+    tm.add_task(StubTask(), name='encode', limit=1, priority=10)
+    tm.add_task(StubTask(), name='thumbnails', priority=10)
+    tm.add_task(StubTask(), name='index',
+                requires=['encode', 'thumbnails'])
+    tm.add_task(StubTask(), name='event_html',
+                requires=['encode', 'thumbnails'])
+    tm.add_task(StubSinkTask(), name='eventlist_html',
+                requires=['index', 'event_html'],
+                window=0, sink=True)
+    return tm
+
+
+def run(results, options):
+    count = 50 if options.quick else 500
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tm = build(options.workers)
+        tm.start()
+
+        start = time.perf_counter()
+        for i in range(count):
+            tm.update({'datadir': tmpdir,
+                       'path': str(Path(tmpdir) / ('event-%d' % i))})
+
+        deadline = time.monotonic() + options.timeout
+        while time.monotonic() < deadline:
+            counts = tm.jobs.counts()
+            if counts.get('done', 0) + counts.get('failed', 0) >= count:
+                break
+            time.sleep(0.01)
+
+        elapsed = time.perf_counter() - start
+        stats = tm.stats()
+        tm.stop()
+        tm.join()
+
+    done = tm.jobs.counts().get('done', 0)
+    results.record('taskmanager.events_per_minute', done * 60 / elapsed,
+                   'events/min', events=count, completed=done,
+                   workers=tm.workers, sink_runs=stats['sink_runs'])
@@ -0,0 +1,42 @@
+'''Thumbnail generation for full resolution camera stills'''
+
+import tempfile
+
+from pathlib import Path
+
+from kcam import thumbnail
+from kcam.tasks import thumbnail_path
+
+from benchmarks.runner import timed
+
+RESOLUTION = (1920, 1080)
+
+
+def make_image(path, resolution):
+    from PIL import Image, ImageFilter
+
+    # noise makes the image about as hard to compress as a photo
+    image = Image.effect_noise(resolution, 64).filter(ImageFilter.SMOOTH)
+    image.convert('RGB').save(str(path), 'JPEG', quality=85)
+
+
+def run(results, options):
+    if thumbnail.Image is None:
+        results.skip('thumbnail', 'Pillow is not available')
+        return
+
+    count = 5 if options.quick else 20
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        images = [Path(tmpdir) / ('image-%d.jpg' % i) for i in range(count)]
+        for image in images:
+            make_image(image, RESOLUTION)
+
+        thumbnailer = thumbnail.Thumbnailer(180, 240)
+        times = timed(lambda: [thumbnailer.generate(image,
+                                                    thumbnail_path(image))
+                               for image in images], repeat=3)
+
+    results.record_times('thumbnail.generate',
+                         [t / count for t in times], per='image',
+                         resolution='%dx%d' % RESOLUTION)
@@ -0,0 +1,139 @@
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+from pathlib import Path
+
+LOG = logging.getLogger(__name__)
+
+
+def timed(func, repeat=5, number=1):
+    '''Call `func` `number` times in each of `repeat` rounds, and
+    return the time per call for each round'''
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+
+    return times
+
+
+def git(*args):
+    try:
+        return subprocess.check_output(
+            ('git',) + args, stderr=subprocess.DEVNULL,
+            cwd=str(Path(__file__).parent)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Results(object):
+    '''Collect benchmark measurements.
+
+    Each measurement has a name, a value, a unit, and whether a
+    `higher` or `lower` value is better, which is what `compare` uses
+    to decide whether a change is a regression.'''
+
+    def __init__(self):
+        self.results = {}
+        self.skipped = {}
+        self.commit = git('rev-parse', 'HEAD')
+        self.dirty = bool(git('status', '--porcelain',
+                              '--untracked-files=no'))
+        self.started = datetime.datetime.now()
+
+    def record(self, name, value, unit, better='higher', **extra):
+        LOG.info('%s: %.6g %s', name, value, unit)
+        self.results[name] = dict(value=value, unit=unit, better=better,
+                                  **extra)
+
+    def record_times(self, name, times, **extra):
+        '''Record the best of several timings along with their
+        spread'''
+
+        self.record(name, min(times), 's', better='lower',
+                    median=statistics.median(times),
+                    rounds=len(times), **extra)
+
+    def skip(self, suite, reason):
+        LOG.warning('skipping %s: %s', suite, reason)
+        self.skipped[suite] = reason
+
+    def metadata(self):
+        return dict(
+            commit=self.commit,
+            dirty=self.dirty,
+            started=self.started.isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            cpu_count=os.cpu_count(),
+        )
+
+    def filename(self):
+        name = (self.commit[:12] if self.commit
+                else self.started.strftime('%Y%m%d%H%M%S'))
+        return name + ('-dirty' if self.dirty else '') + '.json'
+
+    def save(self, outdir):
+        '''Write the results to a file named for the current commit.
+        Results already saved for the same commit by a run of other
+        benchmarks are kept.'''
+
+        outdir = Path(outdir)
+        outdir.mkdir(parents=True, exist_ok=True)
+        path = outdir / self.filename()
+
+        results, skipped = {}, {}
+        if path.is_file():
+            previous = load(path)
+            results.update(previous['results'])
+            skipped.update(previous.get('skipped', {}))
+
+        results.update(self.results)
+        skipped.update(self.skipped)
+
+        with path.open('w') as fd:
+            json.dump(dict(metadata=self.metadata(),
+                           results=results,
+                           skipped=skipped),
+                      fd, indent=2, sort_keys=True)
+
+        return path
+
+
+def load(path):
+    with open(str(path)) as fd:
+        return json.load(fd)
+
+
+def compare(old, new, threshold=0.1):
+    '''Compare two sets of results, returning a list of (name, old
+    value, new value, relative change, regressed) tuples for the
+    benchmarks that appear in both.  A positive change is always an
+    improvement.'''
+
+    report = []
+    for name, result in sorted(new['results'].items()):
+        if name not in old['results']:
+            continue
+
+        before = old['results'][name]['value']
+        after = result['value']
+        if not before:
+            continue
+
+        change = (after - before) / before
+        if result['better'] == 'lower':
+            change = -change
+
+        report.append((name, before, after, change, change < -threshold))
+
+    return report
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import datetime
+import json
+import logging
+import urllib.parse
+
+from pathlib import PurePosixPath
+
+from kcam.eventindex import format_time, parse_time
+from kcam.tasks import thumbnail_path
+
+LOG = logging.getLogger(__name__)
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def url(relpath, name=None):
+    path = '/' + relpath + '/'
+    if name is not None:
+        path += name
+
+    return urllib.parse.quote(path)
+
+
+def encode_cursor(event, path):
+    data = json.dumps([format_time(event), path]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        event, path = json.loads(data.decode())
+        return parse_time(event), path
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise BadRequest('invalid cursor')
+
+
+def parse_datetime(value, name):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest('invalid {}: {}'.format(name, value))
+
+
+class EventAPI(object):
+    '''A JSON view of the event index.
+
+    - `events` lists events in a time range, newest first unless
+      `order=asc`.  Each response includes a `next` cursor for
+      fetching the following page, which (unlike an offset) takes the
+      same time to fetch however far into the listing it is.
+    - `event` describes one event and its media
+    - `days` counts the events on each day
+
+    Everything is read from the event index; nothing here touches the
+    event directories.'''
+
+    default_limit = 50
+    max_limit = 500
+
+    def __init__(self, index):
+        self.index = index
+
+    def version(self):
+        return self.index.version()
+
+    def route(self, parts, query):
+        '''Return a function that produces the response for an api
+        path (split into its components), or raise NotFound'''
+
+        if parts == ['events']:
+            return lambda: self.events(**self.events_args(query))
+        elif parts == ['days']:
+            return lambda: self.days(**self.range_args(query))
+        elif len(parts) == 5 and parts[0] == 'events':
+            return lambda: self.event('/'.join(parts[1:]))
+
+        raise NotFound()
+
+    def range_args(self, query):
+        return dict(
+            start=(parse_datetime(query['start'], 'start')
+                   if 'start' in query else None),
+            end=(parse_datetime(query['end'], 'end')
+                 if 'end' in query else None),
+        )
+
+    def events_args(self, query):
+        args = self.range_args(query)
+
+        try:
+            args['limit'] = int(query.get('limit', self.default_limit))
+        except ValueError:
+            raise BadRequest('invalid limit')
+        if not 1 <= args['limit'] <= self.max_limit:
+            raise BadRequest('limit must be between 1 and %d' %
+                             self.max_limit)
+
+        order = query.get('order', 'desc')
+        if order not in ['asc', 'desc']:
+            raise BadRequest('order must be asc or desc')
+        args['reverse'] = order == 'desc'
+
+        if 'cursor' in query:
+            args['after'] = decode_cursor(query['cursor'])
+
+        return args
+
+    def summary(self, event):
+        info = dict(
+            id=event['path'],
+            time=event['event'].isoformat(),
+            duration=event['duration'],
+            images=event['images'],
+            videos=event['videos'],
+            size=event['size'],
+            url=url(event['path']),
+            api=urllib.parse.quote('/api/events/' + event['path']),
+        )
+
+        if 'cover' in event:
+            info['cover'] = (url(event['path'], event['cover'])
+                             if event['cover'] else None)
+
+        return info
+
+    def events(self, start=None, end=None, after=None, limit=None,
+               reverse=True):
+        limit = limit if limit else self.default_limit
+
+        # fetch one extra event to find out if there is another page
+        rows = self.index.page(start=start, end=end, after=after,
+                               limit=limit + 1, reverse=reverse)
+        more = len(rows) > limit
+        rows = rows[:limit]
+
+        return dict(
+            events=[self.summary(row) for row in rows],
+            next=(encode_cursor(rows[-1]['event'], rows[-1]['path'])
+                  if more else None),
+        )
+
+    def event(self, relpath):
+        event = self.index.event(relpath)
+        if event is None:
+            raise NotFound()
+
+        media = self.index.media(relpath)
+        thumbs = set(item['name'] for item in media
+                     if item['kind'] == 'thumb')
+
+        info = self.summary(event)
+        info['media'] = []
+        for item in media:
+            if item['kind'] == 'thumb':
+                continue
+
+            # the same information get_media_info provides the event
+            # page with
+            thumb = thumbnail_path(PurePosixPath(item['name'])).name
+            info['media'].append(dict(
+                name=item['name'],
+                kind=item['kind'],
+                size=item['size'],
+                mtime=datetime.datetime.fromtimestamp(
+                    item['mtime']).isoformat(),
+                duration=item['duration'],
+                url=url(relpath, item['name']),
+                thumb=url(relpath, thumb) if thumb in thumbs else None,
+            ))
+
+        return info
+
+    def days(self, start=None, end=None):
+        days = []
+        for day, count in self.index.days(start=start, end=end):
+            end_of_day = day + datetime.timedelta(days=1)
+            days.append(dict(
+                day=day.date().isoformat(),
+                count=count,
+                events='/api/events?' + urllib.parse.urlencode(dict(
+                    start=day.date().isoformat(),
+                    end=end_of_day.date().isoformat())),
+            ))
+
+        return dict(days=days)
@@ -1,14 +1,21 @@
 import datetime
+import itertools
 import logging
-import picamera
-import queue
 import threading
+import time
 
 from pathlib import Path
 
+from kcam import hardware
 from kcam import observer
+from kcam.eventindex import EventIndex
+from kcam.muxer import StreamingMuxer
+from kcam.prebuffer import PreEventBuffer
+from kcam.stillwriter import StillWriter
+from kcam.util import Latency
 
 LOG = logging.getLogger(__name__)
+picamera = hardware.picamera()
 
 
 def fmt_path(path, timestamp=None):
@@ -18,27 +25,55 @@ def fmt_path(path, timestamp=None):
     return path.format(timestamp=timestamp)
 
 
+class NullOutput(object):
+    '''An output that throws away whatever is written to it'''
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
 class Camera(observer.Observable, threading.Thread):
+    '''Record video and still images while there is activity.
+
+    The camera thread sleeps on an event until it is woken by a change
+    in activity (see `update`) or by `stop`, so that a capture starts
+    and ends as soon as it is asked to.  During a capture, still images
+    are taken on a separate thread.'''
+
     default_res_x = 800
     default_res_y = 600
     default_lead_time = 10
+    default_lead_bytes = PreEventBuffer.default_max_bytes
     default_datadir = '.'
     default_eventdir = '{timestamp:%Y/%m/%d/%H:%M:%S}'
     default_imagename = 'img-{timestamp:%H:%M:%S}-{{counter}}.jpg'
     default_videoname = 'vid-{timestamp:%H:%M:%S}.h264'
     default_interval = 2
     default_flip = False
+    default_stream_mp4 = True
+    default_async_stills = True
+    default_burst_count = 5
+    default_burst_interval = 0.2
 
     def __init__(self,
                  res_x=None,
                  res_y=None,
                  lead_time=None,
+                 lead_bytes=None,
                  datadir=None,
                  eventdir=None,
                  imagename=None,
                  videoname=None,
                  interval=None,
                  flip=None,
+                 stream_mp4=None,
+                 async_stills=None,
+                 still_buffers=None,
+                 burst_count=None,
+                 burst_interval=None,
                  **kwargs):
 
         super(Camera, self).__init__(**kwargs)
@@ -47,51 +82,94 @@ class Camera(observer.Observable, threading.Thread):
         res_y = res_y if res_y else self.default_res_y
         flip = flip if flip is not None else self.default_flip
         lead_time = lead_time if lead_time is not None else self.default_lead_time
+        lead_bytes = lead_bytes if lead_bytes else self.default_lead_bytes
 
         self.datadir = Path(datadir if datadir else self.default_datadir)
         self.eventdir = Path(eventdir if eventdir else self.default_eventdir)
         self.imagename = imagename if imagename else self.default_imagename
         self.videoname = videoname if videoname else self.default_videoname
         self.interval = interval if interval else self.default_interval
+        self.stream_mp4 = (stream_mp4 if stream_mp4 is not None
+                           else self.default_stream_mp4)
+        self.async_stills = (async_stills if async_stills is not None
+                             else self.default_async_stills)
+        self.burst_count = (burst_count if burst_count is not None
+                            else self.default_burst_count)
+        self.burst_interval = (burst_interval if burst_interval
+                               else self.default_burst_interval)
+        self.burst = 0
+        self.index = EventIndex(self.datadir)
 
         self.camera = picamera.PiCamera()
         self.camera.resolution = (res_x, res_y)
         self.camera.hflip = self.camera.vflip = flip
-        self.stream = picamera.PiCameraCircularIO(
-            self.camera, seconds=lead_time)
+        self.stream = PreEventBuffer(
+            self.camera, seconds=lead_time, max_bytes=lead_bytes)
 
         self.recording = False
-        self.control = queue.Queue()
+        self.capturing = observer.Value(False)
+        self.active = False
+        self.wakeup = threading.Event()
         self.flag_stop = False
+        self.activity_changed = None
+
+        self.stills = StillWriter(buffers=still_buffers)
+        self.stills_wakeup = threading.Event()
+        self.stills_running = False
+        self.discard = NullOutput()
+
+        self.start_latency = Latency()
+        self.stop_latency = Latency()
 
     def stop(self):
         self.flag_stop = True
-        self.control.put('stop')
+        self.wakeup.set()
 
     def run(self):
         LOG.info('start camera thread')
+        self.stills.start()
         self.camera.start_recording(self.stream, format='h264')
 
         while not self.flag_stop:
-            msg = self.control.get()
-            LOG.debug('received msg in run: %s', msg)
-
-            if msg == 'stop':
-                break
-            elif msg == 'active' and not self.recording:
+            if self.active:
                 self.start_capture()
-            else:
-                LOG.error('unexpected message in queue: %s', msg)
+                continue
+
+            self.wakeup.wait()
+            self.wakeup.clear()
 
         self.camera.stop_recording()
+        self.stills.stop()
+        self.stills.join()
         LOG.info('stop camera thread')
 
+    def stats(self):
+        '''Return statistics for the camera.  `start_latency` is the
+        time from activity starting to video being recorded, and
+        `stop_latency` the time from activity ending to the video file
+        being closed.'''
+
+        return dict(prebuffer=self.stream.stats(),
+                    stills=self.stills.stats(),
+                    start_latency=self.start_latency.stats(),
+                    stop_latency=self.stop_latency.stats())
+
     def update(self, active):
         LOG.debug('received notification: %s', active)
-        if active and not self.recording:
-            self.control.put('active')
-        elif not active and self.recording:
-            self.control.put('idle')
+        active = bool(active)
+        if active != self.active:
+            self.activity_changed = time.monotonic()
+            self.active = active
+            self.wakeup.set()
+
+    def handle_motion(self, value):
+        '''Capture a burst of images when motion is detected during
+        a capture'''
+
+        if value and self.recording and self.burst_count:
+            LOG.debug('starting burst of %d images', self.burst_count)
+            self.burst = self.burst_count
+            self.stills_wakeup.set()
 
     def create_eventdir(self, timestamp=None):
         path = Path(fmt_path(str(self.datadir / self.eventdir), timestamp))
@@ -100,39 +178,112 @@ class Camera(observer.Observable, threading.Thread):
 
         return path
 
+    def open_video(self, path):
+        '''Open the output for a captured video.  When streaming to
+        mp4, the video is muxed as it is recorded.'''
+
+        if self.stream_mp4:
+            return StreamingMuxer(path.with_suffix('.mp4'),
+                                  framerate=float(self.camera.framerate))
+
+        return path.open('wb')
+
+    def wait_for_image(self):
+        '''Wait until it is time for the next image.  Returns False if
+        the capture should stop.'''
+
+        if self.burst:
+            self.burst -= 1
+            timeout = self.burst_interval
+        else:
+            timeout = self.interval
+
+        self.stills_wakeup.wait(timeout)
+        self.stills_wakeup.clear()
+
+        return self.stills_running
+
+    def capture_stills(self, imagepath):
+        '''Take still images until stills_running is cleared'''
+
+        LOG.debug('start capturing images')
+        if self.async_stills:
+            self.camera.capture_sequence(
+                self.image_outputs(imagepath), use_video_port=True)
+        else:
+            for img in self.camera.capture_continuous(
+                    str(imagepath), use_video_port=True):
+                if not self.wait_for_image():
+                    break
+        LOG.debug('stop capturing images')
+
+    def image_outputs(self, imagepath):
+        '''Generate in-memory outputs for capture_sequence.  Once the
+        camera has filled a buffer, it is passed to the still writer
+        so that taking images never waits for the disk.'''
+
+        imagepath = str(imagepath)
+
+        for counter in itertools.count(1):
+            buf = self.stills.get_buffer()
+            requested = time.monotonic()
+            yield buf if buf is not None else self.discard
+
+            if buf is not None:
+                self.stills.put(buf, imagepath.format(counter=counter),
+                                latency=time.monotonic() - requested)
+
+            if not self.wait_for_image():
+                break
+
     def start_capture(self):
         LOG.info('starting capture')
 
         self.recording = True
+        self.capturing.set(True)
         event = datetime.datetime.now()
 
         path = self.create_eventdir(event)
+        self.index.add_event(path, event)
         videoname = fmt_path(self.videoname, event)
         videopath = path / videoname
         imagename = fmt_path(self.imagename, event)
         imagepath = path / imagename
 
-        with videopath.open('wb') as fd:
+        with self.open_video(videopath) as fd:
             self.stream.copy_to(fd)
             self.camera.split_recording(fd)
+            self.start_latency.add(time.monotonic() - self.activity_changed)
 
-            for img in self.camera.capture_continuous(
-                    str(imagepath), use_video_port=True):
+            self.stills_running = True
+            self.stills_wakeup.clear()
+            stills = threading.Thread(target=self.capture_stills,
+                                      args=(imagepath,),
+                                      name='camera-stills')
+            stills.start()
+
+            while self.active and not self.flag_stop:
+                self.wakeup.wait()
+                self.wakeup.clear()
 
-                try:
-                    msg = self.control.get(timeout=self.interval)
-                    if msg in ['idle', 'stop']:
-                        LOG.debug('received message in start_capture: %s', msg)
-                        break
-                except queue.Empty:
-                    continue
+            stopped = (time.monotonic() if self.active
+                       else self.activity_changed)
+            self.stills_running = False
+            self.stills_wakeup.set()
+            stills.join()
 
-            self.stream.seek(0)
-            self.stream.truncate()
+            self.stream.clear()
             self.camera.split_recording(self.stream)
 
+        self.stop_latency.add(time.monotonic() - stopped)
+
         self.recording = False
+        self.capturing.set(False)
+        duration = (datetime.datetime.now() - event).total_seconds()
+        self.index.add_event(path, event, duration=duration)
+
         LOG.info('finished capture')
         self.notify_observers(dict(datadir=self.datadir,
                                    event=event,
-                                   path=path))
+                                   path=path,
+                                   duration=duration))
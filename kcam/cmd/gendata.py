@@ -0,0 +1,97 @@
+import datetime
+
+from kcam.common import Application
+from kcam.gendata import DataGenerator
+
+
+def size_argument(value):
+    '''Parse a size such as 200k or 5M'''
+
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    if value[-1:].lower() in units:
+        return int(float(value[:-1]) * units[value[-1:].lower()])
+
+    return int(value)
+
+
+class GenerateDataApplication(Application):
+    uses_gpio = False
+
+    def create_overrides(self):
+        overrides = super(GenerateDataApplication, self).create_overrides()
+
+        overrides.update({
+            'datadir': ('DEFAULT', 'datadir'),
+        })
+
+        return overrides
+
+    def create_parser(self):
+        p = super(GenerateDataApplication, self).create_parser()
+
+        p.add_argument('--datadir', '-D')
+
+        g = p.add_argument_group('Event options')
+        g.add_argument('--events', '-n',
+                       default=1000,
+                       type=int)
+        g.add_argument('--start',
+                       type=lambda v: datetime.datetime.strptime(
+                           v, '%Y-%m-%d'),
+                       help='date of the first event (YYYY-MM-DD)')
+        g.add_argument('--interval',
+                       type=float,
+                       help='average seconds between events')
+        g.add_argument('--seed',
+                       default=0,
+                       type=int)
+        g.add_argument('--no-index',
+                       action='store_false',
+                       dest='index')
+
+        g = p.add_argument_group('Media options')
+        g.add_argument('--images', type=int)
+        g.add_argument('--videos', type=int)
+        g.add_argument('--h264',
+                       default=0,
+                       type=int)
+        g.add_argument('--no-thumbnails',
+                       action='store_false',
+                       dest='thumbnails')
+        g.add_argument('--media',
+                       choices=['sparse', 'real'],
+                       default='sparse')
+        g.add_argument('--image-size', type=size_argument)
+        g.add_argument('--video-size', type=size_argument)
+
+        return p
+
+    def main(self):
+        generator = DataGenerator(
+            self.config.get('DEFAULT', 'datadir'),
+            start=self.args.start,
+            interval=self.args.interval,
+            images=self.args.images,
+            videos=self.args.videos,
+            h264=self.args.h264,
+            thumbnails=self.args.thumbnails,
+            media=self.args.media,
+            image_size=self.args.image_size,
+            video_size=self.args.video_size,
+            seed=self.args.seed,
+            index=self.args.index,
+        )
+
+        count = generator.generate(self.args.events)
+        print('created {} events in {}'.format(count, generator.datadir))
+
+
+app = GenerateDataApplication()
+
+
+def main():
+    app.run()
+
+
+if __name__ == '__main__':
+    main()
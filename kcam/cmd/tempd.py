@@ -1,5 +1,7 @@
 import signal
 
+from pathlib import Path
+
 from kcam.common import Application
 from kcam.metrics import MetricConnection
 from kcam.sensors.temperature import TemperatureSensor
@@ -42,13 +44,24 @@ class SensorApplication(Application):
         return p
 
     def main(self):
+        spooldir = self.config['metrics'].get('metrics_spool_dir')
+        spool = str(Path(spooldir) / 'tempd.spool') if spooldir else None
+
         self.metrics = MetricConnection(
             host=self.config['metrics'].get('metrics_host'),
             port=self.config['metrics'].getint('metrics_port'),
             database=self.config['metrics'].get('metrics_database'),
             username=self.config['metrics'].get('metrics_username'),
             password=self.config['metrics'].get('metrics_password'),
+            batch_size=self.config['metrics'].getint('metrics_batch_size'),
+            flush_interval=self.config['metrics'].getfloat(
+                'metrics_flush_interval'),
+            buffer_size=self.config['metrics'].getint('metrics_buffer_size'),
+            spool=spool,
+            timeout=self.config['metrics'].getfloat('metrics_timeout'),
         )
+        for thread in self.metrics.threads:
+            thread.start()
 
         self.temp_sensor = TemperatureSensor(
             self.config.getint('sensor:temperature', 'temperature_pin'),
@@ -65,6 +78,9 @@ class SensorApplication(Application):
         except KeyboardInterrupt:
             self.temp_sensor.stop()
             self.temp_sensor.join()
+            for thread in self.metrics.threads:
+                thread.stop()
+            self.metrics.writer.join()
 
 app = SensorApplication()
 
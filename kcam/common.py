@@ -2,11 +2,13 @@ import argparse
 import configparser
 import logging
 
-from RPi import GPIO
-
+from kcam import hardware
 from kcam.defaults import DEFAULTS
 
-GPIO.setmode(GPIO.BCM)
+
+def init_gpio():
+    GPIO = hardware.gpio()
+    GPIO.setmode(GPIO.BCM)
 
 
 def KeyValueArgument(value):
@@ -18,6 +20,10 @@ def KeyValueArgument(value):
 
 
 class Application(object):
+    # Commands that do not touch the hardware set this to False, so
+    # that they also run on machines without RPi.GPIO.
+    uses_gpio = True
+
     def __init__(self):
         self.parser = self.create_parser()
         self.config = self.create_config()
@@ -26,6 +32,9 @@ class Application(object):
     def run(self, args=None):
         self.args = self.parse_args(args=args)
 
+        if self.uses_gpio:
+            init_gpio()
+
         self.configure_logging()
         self.parse_config()
         self.process_overrides()
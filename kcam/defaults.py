@@ -3,6 +3,7 @@ from pathlib import Path
 
 DEFAULTS = dict(
     datadir='.',
+    jobstore='%(datadir)s/.kcam-jobs.sqlite',
     statefile=str(Path(os.environ['HOME']) / '.kcam_arm_state'),
     det_led_pin='24',
     act_led_pin='25',
@@ -14,4 +15,11 @@ DEFAULTS = dict(
     temperature_pin='12',
     buzzer_pwm_path='/sys/class/pwm/pwmchip0/pwm1',
     buzzer_enable='true',
+    metrics_dispatch_policy='drop',
+    metrics_queue_size='100',
+    metrics_batch_size='100',
+    metrics_flush_interval='5',
+    metrics_buffer_size='10000',
+    metrics_spool_dir=str(Path(os.environ['HOME']) / '.kcam_metrics_spool'),
+    metrics_timeout='10',
 )
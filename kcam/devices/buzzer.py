@@ -40,7 +40,7 @@ class Buzzer(object):
         freq, duration = float(freq), float(duration)
         LOG.debug('play %f for %f seconds', freq, duration)
 
-        if freq == 0:
+        if freq == 0 or not self.enable:
             time.sleep(duration)
             return
 
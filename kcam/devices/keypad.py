@@ -1,13 +1,14 @@
-import evdev
 import logging
 import threading
 import time
 
 from collections import defaultdict
 
+from kcam import hardware
 from kcam import observer
 
 LOG = logging.getLogger(__name__)
+evdev = hardware.evdev()
 
 keymap = {
     'KEY_0': '0',
@@ -1,8 +1,9 @@
 import logging
 
-from RPi import GPIO
+from kcam import hardware
 
 LOG = logging.getLogger(__name__)
+GPIO = hardware.gpio()
 
 
 class LED(object):
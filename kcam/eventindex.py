@@ -0,0 +1,443 @@
+import datetime
+import logging
+import os
+import sqlite3
+import time
+
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+from kcam import mp4
+from kcam.util import date_from_path
+
+LOG = logging.getLogger(__name__)
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Stored as the database user_version once the index has been
+# populated from the data directory.  Increase this when a change to
+# the schema requires existing indexes to be rebuilt.
+SCHEMA_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    path TEXT PRIMARY KEY,
+    event TEXT NOT NULL,
+    duration REAL,
+    images INTEGER NOT NULL DEFAULT 0,
+    videos INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    updated REAL
+);
+
+CREATE INDEX IF NOT EXISTS events_event ON events (event);
+CREATE INDEX IF NOT EXISTS events_event_path ON events (event, path);
+
+CREATE TABLE IF NOT EXISTS media (
+    event_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL,
+    PRIMARY KEY (event_path, name)
+);
+
+CREATE TABLE IF NOT EXISTS rendered (
+    path TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    updated REAL
+);
+'''
+
+
+def media_kind(name):
+    '''Classify a file in an event directory, or return None if it is
+    not media'''
+
+    stem, ext = os.path.splitext(name)
+    if ext == '.jpg':
+        return 'thumb' if stem.endswith('-thumb') else 'image'
+    elif ext == '.mp4':
+        return 'video'
+    elif ext == '.h264':
+        return 'h264'
+
+
+def format_time(when):
+    return when.strftime(TIME_FORMAT)
+
+
+def parse_time(when):
+    return datetime.datetime.strptime(when, TIME_FORMAT)
+
+
+class EventIndex(object):
+
+    '''A persistent index of the events in a data directory.
+
+    The index is an SQLite database stored in the data directory.  It
+    records the time of each event along with the media files it
+    contains, so that listing events does not require walking the
+    entire data directory.  Event paths are stored relative to the
+    data directory.'''
+
+    default_filename = '.kcam-index.sqlite'
+    event_depth = 4
+
+    def __init__(self, datadir, filename=None):
+        self.datadir = Path(datadir)
+        self.path = self.datadir / (filename if filename
+                                    else self.default_filename)
+        self.initialized = False
+
+    @contextmanager
+    def connection(self):
+        if not self.initialized:
+            self.datadir.mkdir(parents=True, exist_ok=True)
+
+        with closing(sqlite3.connect(str(self.path), timeout=30)) as conn:
+            if not self.initialized:
+                # the journal mode is stored in the database, so this
+                # only needs to happen once
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                self.initialized = True
+
+            with conn:
+                yield conn
+
+    def relpath(self, path):
+        path = Path(path)
+        try:
+            return str(path.relative_to(self.datadir))
+        except ValueError:
+            return str(path)
+
+    def add_event(self, path, event, duration=None):
+        '''Record a new (or updated) event'''
+
+        relpath = self.relpath(path)
+        LOG.debug('adding event %s to index', relpath)
+
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO events (path, event, updated) '
+                'VALUES (?, ?, ?)',
+                (relpath, format_time(event), time.time()))
+
+            if duration is not None:
+                conn.execute(
+                    'UPDATE events SET duration = ?, updated = ? '
+                    'WHERE path = ?',
+                    (duration, time.time(), relpath))
+
+    def scan_event(self, path, event=None, conn=None):
+        '''Update the media information for a single event'''
+
+        if conn is None:
+            with self.connection() as conn:
+                return self.scan_event(path, event=event, conn=conn)
+
+        relpath = self.relpath(path)
+        if event is None:
+            event = date_from_path(Path(relpath))
+
+        # durations are only read again from files that have changed
+        known = {name: (size, mtime, duration)
+                 for name, size, mtime, duration in conn.execute(
+                     'SELECT name, size, mtime, duration FROM media '
+                     'WHERE event_path = ?', (relpath,))}
+
+        LOG.debug('scanning event %s', relpath)
+        media = []
+        for entry in os.scandir(str(self.datadir / relpath)):
+            kind = media_kind(entry.name)
+            if kind is None or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            duration = None
+            if kind == 'video':
+                size, mtime, duration = known.get(entry.name,
+                                                  (None, None, None))
+                if (size, mtime) != (stat.st_size, stat.st_mtime):
+                    duration = mp4.duration(entry.path)
+
+            media.append((relpath, entry.name, kind,
+                          stat.st_size, stat.st_mtime, duration))
+
+        images = sum(1 for m in media if m[2] == 'image')
+        videos = sum(1 for m in media if m[2] in ('video', 'h264'))
+        size = sum(m[3] for m in media)
+
+        self._store_event(conn, relpath, event, media,
+                          images, videos, size)
+
+    def _store_event(self, conn, relpath, event, media,
+                     images, videos, size):
+        conn.execute(
+            'INSERT OR IGNORE INTO events (path, event) VALUES (?, ?)',
+            (relpath, format_time(event)))
+        conn.execute(
+            'UPDATE events SET images = ?, videos = ?, size = ?, '
+            'updated = ? WHERE path = ?',
+            (images, videos, size, time.time(), relpath))
+        conn.execute('DELETE FROM media WHERE event_path = ?', (relpath,))
+        conn.executemany(
+            'INSERT INTO media (event_path, name, kind, size, mtime, '
+            'duration) VALUES (?, ?, ?, ?, ?, ?)', media)
+
+    def remove_event(self, path):
+        relpath = self.relpath(path)
+        with self.connection() as conn:
+            conn.execute('DELETE FROM media WHERE event_path = ?',
+                         (relpath,))
+            conn.execute('DELETE FROM rendered WHERE path = ?', (relpath,))
+            conn.execute('DELETE FROM events WHERE path = ?', (relpath,))
+
+    def events(self, start=None, end=None, offset=None, limit=None,
+               reverse=False):
+        '''Return a sorted list of (event, path) tuples for events
+        in the range [start, end)'''
+
+        query = 'SELECT event, path FROM events'
+        where, params = [], []
+
+        if start is not None:
+            where.append('event >= ?')
+            params.append(format_time(start))
+        if end is not None:
+            where.append('event < ?')
+            params.append(format_time(end))
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+
+        query += ' ORDER BY event DESC' if reverse else ' ORDER BY event'
+
+        if limit is not None:
+            query += ' LIMIT ? OFFSET ?'
+            params.extend([limit, offset if offset else 0])
+
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [(parse_time(event), self.datadir / path)
+                for event, path in rows]
+
+    def page(self, start=None, end=None, after=None, limit=50,
+             reverse=True):
+        '''Return up to `limit` events in the range [start, end) as
+        dictionaries, newest first if `reverse` is set.
+
+        `after` is the (event, path) of the last event on the previous
+        page.  Pages are located using the (event, path) index rather
+        than an offset, so every page takes the same time to fetch.'''
+
+        query = (
+            'SELECT path, event, duration, images, videos, size, '
+            '(SELECT MIN(name) FROM media '
+            'WHERE media.event_path = events.path '
+            "AND kind = 'thumb') FROM events")
+        where, params = [], []
+
+        if start is not None:
+            where.append('event >= ?')
+            params.append(format_time(start))
+        if end is not None:
+            where.append('event < ?')
+            params.append(format_time(end))
+        if after is not None:
+            where.append('(event, path) %s (?, ?)' % ('<' if reverse
+                                                      else '>'))
+            params.extend([format_time(after[0]), after[1]])
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+
+        order = 'DESC' if reverse else 'ASC'
+        query += ' ORDER BY event {0}, path {0} LIMIT ?'.format(order)
+        params.append(limit)
+
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [dict(path=path, event=parse_time(event), duration=duration,
+                     images=images, videos=videos, size=size, cover=cover)
+                for path, event, duration, images, videos, size, cover
+                in rows]
+
+    def event(self, path):
+        '''Return a dictionary describing a single event, or None if
+        it is not in the index'''
+
+        relpath = self.relpath(path)
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT event, duration, images, videos, size '
+                'FROM events WHERE path = ?', (relpath,)).fetchone()
+
+        if row is None:
+            return None
+
+        event, duration, images, videos, size = row
+        return dict(path=relpath, event=parse_time(event),
+                    duration=duration, images=images, videos=videos,
+                    size=size)
+
+    def media(self, path):
+        '''Return the media recorded for an event, ordered by
+        modification time'''
+
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT name, kind, size, mtime, duration FROM media '
+                'WHERE event_path = ? ORDER BY mtime, name',
+                (self.relpath(path),)).fetchall()
+
+        return [dict(name=name, kind=kind, size=size, mtime=mtime,
+                     duration=duration)
+                for name, kind, size, mtime, duration in rows]
+
+    def position(self, event):
+        '''Return the number of events that happened before `event`'''
+
+        with self.connection() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM events WHERE event < ?',
+                (format_time(event),)).fetchone()[0]
+
+    def months(self):
+        '''Return a sorted list of (first day of month, event count)'''
+
+        with self.connection() as conn:
+            rows = conn.execute(
+                'SELECT substr(event, 1, 7) AS month, COUNT(*) '
+                'FROM events GROUP BY month ORDER BY month').fetchall()
+
+        return [(datetime.datetime.strptime(month, '%Y-%m'), count)
+                for month, count in rows]
+
+    def days(self, start=None, end=None):
+        '''Return a sorted list of (day, event count) for days in the
+        range [start, end)'''
+
+        query = 'SELECT substr(event, 1, 10) AS day, COUNT(*) FROM events'
+        where, params = [], []
+
+        if start is not None:
+            where.append('event >= ?')
+            params.append(format_time(start))
+        if end is not None:
+            where.append('event < ?')
+            params.append(format_time(end))
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+
+        query += ' GROUP BY day ORDER BY day'
+
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [(datetime.datetime.strptime(day, '%Y-%m-%d'), count)
+                for day, count in rows]
+
+    def signatures(self):
+        '''Return a dictionary mapping event paths to the signature of
+        the media their index.html was last rendered from'''
+
+        with self.connection() as conn:
+            return dict(conn.execute('SELECT path, signature FROM rendered'))
+
+    def set_signatures(self, signatures):
+        '''Record the signatures of newly rendered events, given as
+        (path, signature) tuples'''
+
+        now = time.time()
+        with self.connection() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO rendered (path, signature, updated) '
+                'VALUES (?, ?, ?)',
+                ((self.relpath(path), signature, now)
+                 for path, signature in signatures))
+
+    def version(self):
+        '''Return a value that changes whenever events are added,
+        updated or removed'''
+
+        with self.connection() as conn:
+            return conn.execute(
+                'SELECT COUNT(*), MAX(updated) FROM events').fetchone()
+
+    def count(self):
+        with self.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def discover(self):
+        '''Walk the data directory and yield (event, relpath) for each
+        event directory'''
+
+        for root, dirs, files in os.walk(str(self.datadir)):
+            relpath = Path(root).relative_to(self.datadir)
+            if len(relpath.parts) != self.event_depth:
+                continue
+
+            # there is nothing interesting below an event directory
+            dirs[:] = []
+
+            try:
+                event = date_from_path(relpath)
+            except ValueError:
+                LOG.warning('ignoring unrecognized directory %s', relpath)
+                continue
+
+            yield event, relpath
+
+    def is_complete(self):
+        '''Return True if the index has been populated from the data
+        directory with the current schema'''
+
+        if not self.path.exists():
+            return False
+
+        with self.connection() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+        return version >= SCHEMA_VERSION
+
+    def backfill(self):
+        '''Rebuild the index if it has never been populated from the
+        data directory.  Returns the number of events indexed, or None
+        if the index was already complete.'''
+
+        if self.is_complete():
+            return None
+
+        return self.rebuild()
+
+    def rebuild(self):
+        '''Re-create the index from the contents of the data
+        directory'''
+
+        LOG.info('rebuilding event index for %s', self.datadir)
+        found = set()
+
+        with self.connection() as conn:
+            for event, relpath in self.discover():
+                self.scan_event(relpath, event=event, conn=conn)
+                found.add(str(relpath))
+
+            known = set(row[0] for row in
+                        conn.execute('SELECT path FROM events'))
+            for relpath in known - found:
+                LOG.debug('removing missing event %s', relpath)
+                conn.execute('DELETE FROM media WHERE event_path = ?',
+                             (relpath,))
+                conn.execute('DELETE FROM rendered WHERE path = ?',
+                             (relpath,))
+                conn.execute('DELETE FROM events WHERE path = ?',
+                             (relpath,))
+
+            conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+        LOG.info('indexed %d events', len(found))
+        return len(found)
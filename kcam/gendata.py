@@ -0,0 +1,172 @@
+import datetime
+import io
+import logging
+import os
+import random
+import subprocess
+
+from pathlib import Path
+
+from kcam.eventindex import EventIndex
+
+LOG = logging.getLogger(__name__)
+
+# the same layout that Camera uses for events
+EVENTDIR = '{timestamp:%Y/%m/%d/%H:%M:%S}'
+IMAGENAME = 'img-{timestamp:%H:%M:%S}-{counter}.jpg'
+VIDEONAME = 'vid-{timestamp:%H:%M:%S}'
+
+
+def real_jpeg(resolution):
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize(resolution).convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='jpeg', quality=75)
+    return buf.getvalue()
+
+
+def real_video(resolution, seconds, fmt):
+    width, height = resolution
+    return subprocess.check_output([
+        'ffmpeg', '-nostats', '-loglevel', 'error',
+        '-f', 'lavfi',
+        '-i', 'testsrc=size=%dx%d:rate=10' % (width, height),
+        '-t', str(seconds),
+        '-c:v', 'libx264', '-preset', 'ultrafast',
+        '-movflags', 'frag_keyframe+empty_moov',
+        '-f', fmt, '-'], stderr=subprocess.DEVNULL)
+
+
+class DataGenerator(object):
+
+    '''Fill a data directory with synthetic events.
+
+    Events are spread from `start` onwards at intervals of about
+    `interval` seconds.  Each event gets `images` JPEG images (and a
+    thumbnail for each, if `thumbnails` is set), `videos` mp4 files and
+    `h264` raw video files, named the way Camera names them.  With
+    `media='sparse'` the files are sparse placeholders of the sizes
+    given by `image_size` and `video_size`; with `media='real'` they
+    contain small valid images and video (video requires ffmpeg).
+
+    File modification times are set from the event time, and all the
+    randomness comes from `seed`, so the same arguments always produce
+    the same tree.'''
+
+    default_start = datetime.datetime(2020, 1, 1)
+    default_interval = 1800
+    default_images = 10
+    default_videos = 1
+    default_image_size = 200 * 1024
+    default_video_size = 5 * 1024 * 1024
+    default_resolution = (320, 240)
+
+    def __init__(self, datadir,
+                 start=None,
+                 interval=None,
+                 images=None,
+                 videos=None,
+                 h264=0,
+                 thumbnails=True,
+                 media='sparse',
+                 image_size=None,
+                 video_size=None,
+                 seed=0,
+                 index=True):
+        self.datadir = Path(datadir)
+        self.start = start if start else self.default_start
+        self.interval = interval if interval else self.default_interval
+        self.images = images if images is not None else self.default_images
+        self.videos = videos if videos is not None else self.default_videos
+        self.h264 = h264
+        self.thumbnails = thumbnails
+        self.image_size = (image_size if image_size
+                           else self.default_image_size)
+        self.video_size = (video_size if video_size
+                           else self.default_video_size)
+        self.index = EventIndex(self.datadir) if index else None
+        self.random = random.Random(seed)
+
+        if media not in ['sparse', 'real']:
+            raise ValueError('unknown media type: %s' % media)
+
+        self.media = media
+        self.content = {}
+        if media == 'real':
+            self.load_content()
+
+    def load_content(self):
+        self.content['image'] = real_jpeg(self.default_resolution)
+        self.content['thumb'] = real_jpeg((90, 120))
+
+        for fmt, ext in [('mp4', 'mp4'), ('h264', 'h264')]:
+            try:
+                self.content[ext] = real_video(self.default_resolution,
+                                               2, fmt)
+            except (OSError, subprocess.CalledProcessError) as err:
+                LOG.warning('unable to create %s video with ffmpeg (%s); '
+                            'using placeholders', ext, err)
+
+    def event_times(self, count):
+        '''Yield `count` event times, between 0.5 and 1.5 times
+        `interval` apart'''
+
+        when = self.start
+        for i in range(count):
+            yield when
+            step = self.random.uniform(0.5, 1.5) * self.interval
+            when += datetime.timedelta(seconds=max(1, int(step)))
+
+    def write(self, path, kind, size, mtime):
+        content = self.content.get(kind)
+
+        with path.open('wb') as fd:
+            if content is not None:
+                fd.write(content)
+            else:
+                fd.truncate(size)
+
+        os.utime(str(path), (mtime, mtime))
+
+    def create_event(self, event):
+        path = self.datadir / EVENTDIR.format(timestamp=event)
+        path.mkdir(parents=True, exist_ok=True)
+        mtime = event.timestamp()
+
+        for counter in range(1, self.images + 1):
+            image = path / IMAGENAME.format(timestamp=event, counter=counter)
+            size = int(self.image_size * self.random.uniform(0.8, 1.2))
+            self.write(image, 'image', size, mtime + counter)
+
+            if self.thumbnails:
+                thumb = image.parent / (image.stem + '-thumb.jpg')
+                self.write(thumb, 'thumb', size // 20, mtime + counter)
+
+        videos = [('mp4', i) for i in range(self.videos)]
+        videos += [('h264', i) for i in range(self.h264)]
+        for ext, i in videos:
+            name = VIDEONAME.format(timestamp=event)
+            if i:
+                name += '-%d' % i
+            size = int(self.video_size * self.random.uniform(0.5, 1.5))
+            self.write(path / (name + '.' + ext), ext, size, mtime + i)
+
+        return path
+
+    def generate(self, count):
+        '''Create `count` events, and return the number created'''
+
+        LOG.info('generating %d events in %s', count, self.datadir)
+        events = list(self.event_times(count))
+
+        for i, event in enumerate(events):
+            self.create_event(event)
+            if i % 1000 == 999:
+                LOG.info('created %d of %d events', i + 1, count)
+
+        if self.index is not None:
+            LOG.info('indexing events')
+            self.index.rebuild()
+
+        return len(events)
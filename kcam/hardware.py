@@ -0,0 +1,46 @@
+'''Select the modules used to talk to the hardware.
+
+Normally these are RPi.GPIO, picamera, evdev and Adafruit_DHT.  If the
+KCAM_HARDWARE environment variable is set to "sim", simulated versions
+from kcam.sim are used instead, so that kcam can run on a machine
+without any of the Raspberry Pi hardware.'''
+
+import importlib
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+
+BACKENDS = {
+    'gpio': ('RPi.GPIO', 'kcam.sim.gpio'),
+    'picamera': ('picamera', 'kcam.sim.picamera'),
+    'evdev': ('evdev', 'kcam.sim.evdev'),
+    'dht': ('Adafruit_DHT', 'kcam.sim.dht'),
+}
+
+
+def simulated():
+    return os.environ.get('KCAM_HARDWARE') == 'sim'
+
+
+def load(name):
+    real, sim = BACKENDS[name]
+    module = sim if simulated() else real
+    LOG.debug('using %s for %s', module, name)
+    return importlib.import_module(module)
+
+
+def gpio():
+    return load('gpio')
+
+
+def picamera():
+    return load('picamera')
+
+
+def evdev():
+    return load('evdev')
+
+
+def dht():
+    return load('dht')
@@ -0,0 +1,528 @@
+import asyncio
+import collections
+import datetime
+import email.utils
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import socket
+import threading
+import urllib.parse
+
+from http import HTTPStatus
+from pathlib import Path
+
+from kcam import api
+from kcam.rebuild import event_signature, template_signature
+from kcam.tasks import UpdateEventHTML, UpdateEventListHTML
+from kcam.util import date_from_path
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.h264': 'video/h264',
+    '.jpg': 'image/jpeg',
+    '.html': 'text/html; charset=utf-8',
+    '.json': 'application/json',
+}
+
+RE_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None, message=None):
+        super(HTTPError, self).__init__(message if message
+                                        else status.phrase)
+        self.status = status
+        self.headers = headers if headers else {}
+        self.message = message
+
+
+class Request(object):
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+
+        url = urllib.parse.urlsplit(target)
+        self.path = urllib.parse.unquote(url.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+
+    @classmethod
+    def parse(cls, data):
+        lines = data.decode('iso-8859-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST)
+
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HTTPError(HTTPStatus.BAD_REQUEST)
+            headers[name.strip().lower()] = value.strip()
+
+        return cls(method, target, version, headers)
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+
+        return connection != 'close'
+
+
+class Response(object):
+    def __init__(self, status=HTTPStatus.OK, headers=None, body=b'',
+                 file=None, offset=0, count=0):
+        self.status = status
+        self.headers = headers if headers else {}
+        self.body = body
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    @property
+    def length(self):
+        return self.count if self.file is not None else len(self.body)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def http_date(when):
+    return email.utils.formatdate(when, usegmt=True)
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def not_modified(request, etag, mtime=None):
+    '''Evaluate If-None-Match and If-Modified-Since'''
+
+    if 'if-none-match' in request.headers:
+        tags = [tag.strip() for tag in
+                request.headers['if-none-match'].split(',')]
+        return etag in tags or '*' in tags
+
+    if mtime is not None and 'if-modified-since' in request.headers:
+        since = parse_http_date(request.headers['if-modified-since'])
+        return since is not None and int(mtime) <= since
+
+    return False
+
+
+def parse_range(value, size):
+    '''Parse a single byte range, returning (offset, count).  Returns
+    None for ranges we do not handle, in which case the whole file is
+    sent, and raises HTTPError if the range cannot be satisfied.'''
+
+    match = RE_RANGE.match(value.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # the last `end` bytes
+        count = min(int(end), size)
+        return size - count, count
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise HTTPError(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                        {'Content-Range': 'bytes */%d' % size})
+
+    return start, end - start + 1
+
+
+class PageCache(object):
+    '''A least recently used cache of rendered pages.
+
+    Entries are stored along with the version of the data they were
+    rendered from, and are only returned for the same version.'''
+
+    default_size = 128
+
+    def __init__(self, size=None):
+        self.size = size if size else self.default_size
+        self.pages = collections.OrderedDict()
+        self.mutex = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self.mutex:
+            entry = self.pages.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+
+            self.pages.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, page):
+        with self.mutex:
+            self.pages[key] = (version, page)
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+
+    def stats(self):
+        return dict(pages=len(self.pages), hits=self.hits,
+                    misses=self.misses)
+
+
+class Page(object):
+    def __init__(self, body, content_type=None):
+        self.body = body.encode('utf-8')
+        self.content_type = (content_type if content_type
+                             else CONTENT_TYPES['.html'])
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()[:20]
+
+
+class Pages(object):
+    '''Render the pages that UpdateEventHTML and UpdateEventListHTML
+    would otherwise write to the data directory, and the responses of
+    the JSON event api under /api/'''
+
+    def __init__(self, datadir, templatedir=None, cache_size=None):
+        self.datadir = Path(datadir)
+        self.cache = PageCache(cache_size)
+        self.event_html = UpdateEventHTML(templatedir=templatedir)
+        self.listing = UpdateEventListHTML(templatedir=templatedir)
+        self.listing.setup(self.datadir)
+        self.api = api.EventAPI(self.listing.index)
+        self.templates = template_signature(templatedir)
+
+    def route(self, path, query):
+        '''Return a (cache key, version, render function) tuple for
+        the page at `path`, or None if `path` is not a page'''
+
+        parts = [part for part in path.split('/') if part]
+        if parts and parts[-1] == 'index.html':
+            parts.pop()
+
+        if parts and parts[0] == 'api':
+            return self.api_route(parts[1:], query)
+
+        try:
+            if not parts:
+                return 'recent', self.listing_version(), (
+                    lambda: self.listing_page(self.listing.recent_page()))
+            elif len(parts) == 2 and parts[0] == 'pages':
+                page = int(parts[1].replace('.html', ''))
+                if not 1 <= page <= self.listing.page_count():
+                    raise HTTPError(HTTPStatus.NOT_FOUND)
+                return ('page', page), self.listing_version(), (
+                    lambda: self.listing_page(
+                        self.listing.numbered_page(page)))
+            elif len(parts) == 2:
+                month = datetime.datetime.strptime('/'.join(parts), '%Y/%m')
+                return ('month', month), self.listing_version(), (
+                    lambda: self.listing_page(
+                        self.listing.month_page(month)))
+            elif len(parts) == 3:
+                day = datetime.datetime.strptime('/'.join(parts), '%Y/%m/%d')
+                return ('day', day), self.listing_version(), (
+                    lambda: self.listing_page(self.listing.day_page(day)))
+            elif len(parts) == 4:
+                return self.event_route(Path(*parts))
+        except ValueError:
+            pass
+
+        return None
+
+    def listing_version(self):
+        return self.listing.index.version()
+
+    def listing_page(self, page):
+        template, context = page
+        return Page(self.listing.html(template, context))
+
+    def event_route(self, relpath):
+        event = date_from_path(relpath)
+        path = self.datadir / relpath
+        if not path.is_dir():
+            return None
+
+        version = event_signature(path, self.templates)
+        return ('event', str(relpath)), version, (
+            lambda: Page(self.event_html.render(path, event,
+                                                str(self.datadir))))
+
+    def api_route(self, parts, query):
+        try:
+            response = self.api.route(parts, query)
+        except api.NotFound:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        key = ('api', tuple(parts), tuple(sorted(query.items())))
+        return key, self.api.version(), (
+            lambda: Page(json.dumps(response()), CONTENT_TYPES['.json']))
+
+    def render(self, path, query=None):
+        '''Return the Page for `path`, rendering it if it is not in the
+        cache'''
+
+        route = self.route(path, query if query else {})
+        if route is None:
+            return None
+
+        key, version, render = route
+        page = self.cache.get(key, version)
+        if page is None:
+            try:
+                page = render()
+            except api.NotFound:
+                raise HTTPError(HTTPStatus.NOT_FOUND)
+            except api.BadRequest as err:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, message=str(err))
+
+            self.cache.put(key, version, page)
+
+        return page
+
+
+class HTTPServer(threading.Thread):
+    '''Serve the event pages and media from a data directory.
+
+    Pages are rendered on demand from the event index and kept in an
+    LRU cache, so nothing needs to be written to the data directory
+    when an event is recorded.  Media files are sent with sendfile,
+    and support range requests (for seeking in videos) and
+    conditional requests using ETag and Last-Modified.'''
+
+    default_address = ''
+    default_port = 8080
+    default_keepalive = 15
+    default_max_header_size = 16384
+
+    def __init__(self, datadir,
+                 address=None,
+                 port=None,
+                 templatedir=None,
+                 cache_size=None,
+                 keepalive=None,
+                 **kwargs):
+        kwargs.setdefault('daemon', True)
+        super(HTTPServer, self).__init__(**kwargs)
+
+        self.datadir = Path(datadir).resolve()
+        self.address = address if address else self.default_address
+        self.port = port if port is not None else self.default_port
+        self.keepalive = keepalive if keepalive else self.default_keepalive
+        self.pages = Pages(self.datadir, templatedir=templatedir,
+                           cache_size=cache_size)
+
+        self.requests = 0
+        self.bytes_sent = 0
+        self.loop = None
+        self.stopped = None
+        self.ready = threading.Event()
+
+        # bind now, so that a port conflict is reported at startup
+        self.sock = socket.create_server((self.address, self.port))
+        self.server_address = self.sock.getsockname()
+
+    def stop(self):
+        self.ready.wait(5)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def run(self):
+        LOG.info('starting http server on %s:%d',
+                 self.address or '*', self.server_address[1])
+        asyncio.run(self.serve())
+        LOG.info('stopped http server')
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+
+        server = await asyncio.start_server(
+            self.handle_connection, sock=self.sock,
+            limit=self.default_max_header_size)
+        self.ready.set()
+
+        async with server:
+            await self.stopped.wait()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'), self.keepalive)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 'GET', self.error_response(
+                        HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE))
+                    break
+
+                try:
+                    request = Request.parse(data)
+                except HTTPError as err:
+                    await self.send(writer, 'GET', self.error_response(
+                        err.status))
+                    break
+
+                response = await self.respond(request)
+                keep_alive = request.keep_alive
+                response.headers['Connection'] = (
+                    'keep-alive' if keep_alive else 'close')
+
+                try:
+                    await self.send(writer, request.method, response)
+                finally:
+                    response.close()
+
+                LOG.debug('%s %s %d', request.method, request.target,
+                          response.status)
+                if not keep_alive:
+                    break
+        except (ConnectionError, OSError) as err:
+            LOG.debug('connection error: %s', err)
+        finally:
+            writer.close()
+
+    async def respond(self, request):
+        self.requests += 1
+
+        if request.method not in ['GET', 'HEAD']:
+            return self.error_response(HTTPStatus.METHOD_NOT_ALLOWED,
+                                       {'Allow': 'GET, HEAD'})
+
+        try:
+            page = await self.loop.run_in_executor(
+                None, self.pages.render, request.path, request.query)
+            if page is not None:
+                return self.page_response(request, page)
+
+            return self.file_response(request)
+        except HTTPError as err:
+            return self.error_response(err.status, err.headers, err.message)
+        except Exception:
+            LOG.exception('failed to handle request for %s', request.target)
+            return self.error_response(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def error_response(self, status, headers=None, message=None):
+        headers = dict(headers) if headers else {}
+        headers['Content-Type'] = 'text/plain; charset=utf-8'
+        return Response(status, headers, '{} {}\n'.format(
+            status.value, message if message else status.phrase).encode())
+
+    def page_response(self, request, page):
+        headers = {
+            'ETag': page.etag,
+            'Cache-Control': 'no-cache',
+        }
+
+        if not_modified(request, page.etag):
+            return Response(HTTPStatus.NOT_MODIFIED, headers)
+
+        headers['Content-Type'] = page.content_type
+        return Response(HTTPStatus.OK, headers, page.body)
+
+    def resolve(self, path):
+        '''Map a request path to a file in the data directory'''
+
+        parts = [part for part in path.split('/') if part]
+        if any(part.startswith('.') for part in parts):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        target = self.datadir.joinpath(*parts)
+        try:
+            target.resolve().relative_to(self.datadir)
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        if not target.is_file():
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        return target
+
+    def file_response(self, request):
+        path = self.resolve(request.path)
+        fd = path.open('rb')
+
+        try:
+            stat = os.fstat(fd.fileno())
+            size = stat.st_size
+            etag = '"%x-%x"' % (stat.st_mtime_ns, size)
+            content_type = CONTENT_TYPES.get(
+                path.suffix, mimetypes.guess_type(path.name)[0] or
+                'application/octet-stream')
+
+            headers = {
+                'ETag': etag,
+                'Last-Modified': http_date(stat.st_mtime),
+                'Accept-Ranges': 'bytes',
+                'Cache-Control': 'public, max-age=3600',
+            }
+
+            if not_modified(request, etag, stat.st_mtime):
+                fd.close()
+                return Response(HTTPStatus.NOT_MODIFIED, headers)
+
+            headers['Content-Type'] = content_type
+            status, offset, count = HTTPStatus.OK, 0, size
+
+            if ('range' in request.headers and
+                    request.headers.get('if-range', etag) == etag):
+                byte_range = parse_range(request.headers['range'], size)
+                if byte_range is not None:
+                    offset, count = byte_range
+                    status = HTTPStatus.PARTIAL_CONTENT
+                    headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                        offset, offset + count - 1, size)
+        except BaseException:
+            fd.close()
+            raise
+
+        return Response(status, headers, file=fd, offset=offset, count=count)
+
+    async def send(self, writer, method, response):
+        head = ['HTTP/1.1 %d %s' % (response.status.value,
+                                    response.status.phrase),
+                'Server: kcam',
+                'Date: %s' % http_date(None)]
+
+        if response.status != HTTPStatus.NOT_MODIFIED:
+            head.append('Content-Length: %d' % response.length)
+
+        head.extend('%s: %s' % item for item in response.headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('iso-8859-1'))
+
+        if method != 'HEAD':
+            if response.file is not None and response.count:
+                await writer.drain()
+                await self.loop.sendfile(writer.transport, response.file,
+                                         response.offset, response.count)
+                self.bytes_sent += response.count
+            elif response.body:
+                writer.write(response.body)
+                self.bytes_sent += len(response.body)
+
+        await writer.drain()
+
+    def stats(self):
+        return dict(requests=self.requests, bytes_sent=self.bytes_sent,
+                    **self.pages.cache.stats())
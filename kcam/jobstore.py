@@ -0,0 +1,282 @@
+import json
+import logging
+import pickle
+import sqlite3
+import time
+
+from pathlib import Path
+
+from kcam import observer
+
+LOG = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    args BLOB NOT NULL,
+    status TEXT NOT NULL,
+    completed TEXT NOT NULL DEFAULT '[]',
+    resubmitted INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_attempt);
+'''
+
+
+def job_key(args):
+    '''Return the key used to deduplicate submissions.  Pipeline
+    arguments are normally a single dictionary describing an event,
+    which we identify by its path.'''
+
+    if len(args) == 1 and isinstance(args[0], dict) and 'path' in args[0]:
+        return str(args[0]['path'])
+
+    return repr(args)
+
+
+class Job(object):
+    def __init__(self, key, args, completed, attempts):
+        self.key = key
+        self.args = args
+        self.completed = set(completed)
+        self.attempts = attempts
+
+    def __str__(self):
+        return '<Job %s>' % (self.key,)
+
+
+class JobStore(observer.Synchronization):
+
+    '''Record the progress of pipeline jobs in an SQLite database.
+
+    Each job records the steps of the pipeline that have completed,
+    so that after a restart unfinished jobs resume where they left
+    off.  Failed jobs are retried with exponential backoff, up to
+    `max_attempts` times.  Cancelled jobs are never retried, but may
+    be submitted again.  Submitting a job for an event that is
+    already queued updates the existing job rather than adding a new
+    one.
+
+    With the default path of `:memory:` nothing survives a restart,
+    but the behaviour is otherwise the same.'''
+
+    default_path = ':memory:'
+    default_backoff = 30
+    default_max_backoff = 3600
+    default_max_attempts = 5
+    default_keep_done = 7 * 24 * 3600
+
+    def __init__(self, path=None,
+                 backoff=None,
+                 max_backoff=None,
+                 max_attempts=None,
+                 keep_done=None,
+                 **kwargs):
+        super(JobStore, self).__init__(**kwargs)
+
+        self.path = str(path) if path else self.default_path
+        self.backoff = backoff if backoff else self.default_backoff
+        self.max_backoff = (max_backoff if max_backoff
+                            else self.default_max_backoff)
+        self.max_attempts = (max_attempts if max_attempts
+                             else self.default_max_attempts)
+        self.keep_done = keep_done if keep_done else self.default_keep_done
+
+        self.deduplicated = 0
+
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, timeout=30,
+                                    check_same_thread=False)
+        if self.path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    @observer.synchronized
+    def submit(self, args):
+        '''Queue a job.  Returns False if the submission was merged
+        with an existing job.'''
+
+        key = job_key(args)
+        now = time.time()
+        blob = pickle.dumps(args)
+
+        with self.conn:
+            row = self.conn.execute(
+                'SELECT status FROM jobs WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                LOG.debug('queueing job %s', key)
+                self.conn.execute(
+                    'INSERT INTO jobs (key, args, status, created, updated) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, blob, STATUS_PENDING, now, now))
+                return True
+
+            status = row[0]
+            if status == STATUS_PENDING:
+                LOG.debug('job %s is already queued', key)
+                self.conn.execute(
+                    'UPDATE jobs SET args = ?, updated = ? WHERE key = ?',
+                    (blob, now, key))
+                self.deduplicated += 1
+                return False
+            elif status == STATUS_RUNNING:
+                # run the pipeline again once the current run finishes
+                LOG.debug('job %s is running; marking for resubmission',
+                          key)
+                self.conn.execute(
+                    'UPDATE jobs SET args = ?, resubmitted = 1, updated = ? '
+                    'WHERE key = ?',
+                    (blob, now, key))
+                self.deduplicated += 1
+                return False
+            else:
+                LOG.debug('requeueing job %s', key)
+                self.conn.execute(
+                    'UPDATE jobs SET args = ?, status = ?, completed = ?, '
+                    'attempts = 0, next_attempt = 0, last_error = NULL, '
+                    'updated = ? WHERE key = ?',
+                    (blob, STATUS_PENDING, '[]', now, key))
+                return True
+
+    @observer.synchronized
+    def recover(self):
+        '''Requeue jobs that were running when we last stopped, and
+        forget old completed jobs'''
+
+        now = time.time()
+        with self.conn:
+            cur = self.conn.execute(
+                'UPDATE jobs SET status = ?, updated = ? WHERE status = ?',
+                (STATUS_PENDING, now, STATUS_RUNNING))
+            if cur.rowcount:
+                LOG.warning('resuming %d interrupted jobs', cur.rowcount)
+
+            self.conn.execute(
+                'DELETE FROM jobs WHERE status = ? AND updated < ?',
+                (STATUS_DONE, now - self.keep_done))
+
+    @observer.synchronized
+    def next_job(self):
+        '''Claim the oldest job that is ready to run, or return None'''
+
+        now = time.time()
+        with self.conn:
+            row = self.conn.execute(
+                'SELECT key, args, completed, attempts FROM jobs '
+                'WHERE status = ? AND next_attempt <= ? '
+                'ORDER BY created LIMIT 1',
+                (STATUS_PENDING, now)).fetchone()
+
+            if row is None:
+                return None
+
+            key, blob, completed, attempts = row
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, updated = ? WHERE key = ?',
+                (STATUS_RUNNING, now, key))
+
+        return Job(key, pickle.loads(blob), json.loads(completed), attempts)
+
+    @observer.synchronized
+    def next_wakeup(self):
+        '''Return the time at which the next pending job is ready'''
+
+        row = self.conn.execute(
+            'SELECT MIN(next_attempt) FROM jobs WHERE status = ?',
+            (STATUS_PENDING,)).fetchone()
+
+        return row[0]
+
+    @observer.synchronized
+    def complete_step(self, job, step):
+        job.completed.add(step)
+        with self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET completed = ?, updated = ? WHERE key = ?',
+                (json.dumps(sorted(job.completed)), time.time(), job.key))
+
+    @observer.synchronized
+    def finish(self, job):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET status = CASE resubmitted '
+                '  WHEN 1 THEN ? ELSE ? END, '
+                'completed = CASE resubmitted '
+                '  WHEN 1 THEN ? ELSE completed END, '
+                'resubmitted = 0, attempts = 0, last_error = NULL, '
+                'updated = ? WHERE key = ?',
+                (STATUS_PENDING, STATUS_DONE, '[]', now, job.key))
+
+    @observer.synchronized
+    def release(self, job):
+        '''Return a job to the queue without counting an attempt'''
+
+        with self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, updated = ? WHERE key = ?',
+                (STATUS_PENDING, time.time(), job.key))
+
+    @observer.synchronized
+    def fail(self, job, error):
+        now = time.time()
+        attempts = job.attempts + 1
+
+        if attempts >= self.max_attempts:
+            LOG.error('job %s failed after %d attempts: %s',
+                      job.key, attempts, error)
+            status = STATUS_FAILED
+            next_attempt = 0
+        else:
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            LOG.warning('job %s failed (attempt %d): %s; retrying in %ds',
+                        job.key, attempts, error, delay)
+            status = STATUS_PENDING
+            next_attempt = now + delay
+
+        with self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, attempts = ?, next_attempt = ?, '
+                'resubmitted = 0, last_error = ?, updated = ? WHERE key = ?',
+                (status, attempts, next_attempt, str(error), now, job.key))
+
+    @observer.synchronized
+    def cancel(self, key):
+        '''Stop a pending or running job from being run (again).
+        Returns False if there was no such job.'''
+
+        with self.conn:
+            cur = self.conn.execute(
+                'UPDATE jobs SET status = ?, resubmitted = 0, '
+                'next_attempt = 0, last_error = ?, updated = ? '
+                'WHERE key = ? AND status IN (?, ?)',
+                (STATUS_CANCELLED, 'cancelled', time.time(), str(key),
+                 STATUS_PENDING, STATUS_RUNNING))
+
+        if cur.rowcount:
+            LOG.info('cancelled job %s', key)
+
+        return cur.rowcount > 0
+
+    @observer.synchronized
+    def counts(self):
+        '''Return the number of jobs in each state'''
+
+        rows = self.conn.execute(
+            'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+
+        return dict(rows)
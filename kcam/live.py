@@ -0,0 +1,293 @@
+import http.server
+import io
+import logging
+import socketserver
+import threading
+
+LOG = logging.getLogger(__name__)
+
+PAGE = b'''<!DOCTYPE html>
+<html>
+<head><title>kcam live</title></head>
+<body>
+<img src="/stream.mjpg">
+</body>
+</html>
+'''
+
+
+class TooManyClients(Exception):
+    pass
+
+
+class StreamUnavailable(Exception):
+    pass
+
+
+class FrameBroadcaster(object):
+    '''Share the most recent frame from a picamera MJPEG encoder with
+    any number of readers.
+
+    Each completed frame is published as a single immutable bytes
+    object which every client sends as-is, so the cost of encoding
+    does not depend on the number of clients.  Clients always receive
+    the latest frame; a client that cannot keep up skips frames rather
+    than queueing them.'''
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+        self.closed = False
+
+    def write(self, data):
+        # each jpeg begins with a start of image marker
+        if data.startswith(b'\xff\xd8') and self.buffer.tell():
+            self.publish(self.buffer.getvalue())
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def publish(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def reopen(self):
+        with self.condition:
+            self.closed = False
+            self.frame = None
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+    def wait_for_frame(self, after=0, timeout=None):
+        '''Wait for a frame newer than sequence number `after`.
+        Returns a tuple of (sequence, frame), or (after, None) on
+        timeout or when the broadcaster is closed.'''
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (self.frame is not None and
+                                        self.sequence > after),
+                timeout=timeout)
+
+            if self.closed or self.frame is None or self.sequence <= after:
+                return after, None
+
+            return self.sequence, self.frame
+
+
+class LiveRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, fmt, *args):
+        LOG.debug('%s - %s', self.address_string(), fmt % args)
+
+    def do_GET(self):
+        if self.path in ['/', '/index.html']:
+            self.send_content(PAGE, 'text/html')
+        elif self.path == '/stream.mjpg':
+            self.send_stream()
+        elif self.path == '/snapshot.jpg':
+            self.send_snapshot()
+        else:
+            self.send_error(404)
+
+    def send_content(self, content, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_snapshot(self):
+        live = self.server.live
+
+        try:
+            with live.client():
+                seq, frame = live.broadcaster.wait_for_frame(
+                    timeout=live.frame_timeout)
+        except TooManyClients:
+            self.send_error(503, 'too many clients')
+            return
+        except StreamUnavailable:
+            self.send_error(503, 'live view unavailable')
+            return
+
+        if frame is None:
+            self.send_error(503, 'no frame available')
+            return
+
+        self.send_content(frame, 'image/jpeg')
+
+    def send_stream(self):
+        live = self.server.live
+
+        try:
+            with live.client():
+                self.send_frames(live)
+        except TooManyClients:
+            self.send_error(503, 'too many clients')
+        except StreamUnavailable:
+            self.send_error(503, 'live view unavailable')
+
+    def send_frames(self, live):
+        try:
+            self.send_response(200)
+            self.send_header('Age', '0')
+            self.send_header('Cache-Control', 'no-cache, private')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Content-Type',
+                             'multipart/x-mixed-replace; boundary=FRAME')
+            self.end_headers()
+
+            seq = 0
+            while not live.flag_stop:
+                seq, frame = live.broadcaster.wait_for_frame(
+                    seq, timeout=live.frame_timeout)
+                if frame is None:
+                    break
+
+                self.wfile.write(b'--FRAME\r\n')
+                self.wfile.write(b'Content-Type: image/jpeg\r\n')
+                self.wfile.write(b'Content-Length: %d\r\n\r\n' % len(frame))
+                self.wfile.write(frame)
+                self.wfile.write(b'\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class LiveServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ClientContext(object):
+    def __init__(self, live):
+        self.live = live
+
+    def __enter__(self):
+        self.live.add_client()
+        return self
+
+    def __exit__(self, *args):
+        self.live.remove_client()
+
+
+class LiveView(threading.Thread):
+    '''Serve a live MJPEG stream from a camera splitter port.
+
+    The camera only encodes the stream while at least one client is
+    connected, and a single encoder output is shared by all clients.'''
+
+    default_address = ''
+    default_port = 8081
+    default_res_x = 320
+    default_res_y = 240
+    default_quality = 50
+    default_max_clients = 10
+    default_splitter_port = 3
+    default_frame_timeout = 10
+
+    def __init__(self, camera=None,
+                 address=None,
+                 port=None,
+                 res_x=None,
+                 res_y=None,
+                 quality=None,
+                 max_clients=None,
+                 splitter_port=None,
+                 frame_timeout=None,
+                 **kwargs):
+        kwargs.setdefault('daemon', True)
+        super(LiveView, self).__init__(**kwargs)
+
+        self.camera = camera
+        self.address = address if address else self.default_address
+        self.port = port if port is not None else self.default_port
+        self.res_x = res_x if res_x else self.default_res_x
+        self.res_y = res_y if res_y else self.default_res_y
+        self.quality = quality if quality else self.default_quality
+        self.max_clients = (max_clients if max_clients
+                            else self.default_max_clients)
+        self.splitter_port = (splitter_port if splitter_port
+                              else self.default_splitter_port)
+        self.frame_timeout = (frame_timeout if frame_timeout
+                              else self.default_frame_timeout)
+
+        self.broadcaster = FrameBroadcaster()
+        self.mutex = threading.Lock()
+        self.clients = 0
+        self.flag_stop = False
+
+        self.server = LiveServer((self.address, self.port),
+                                 LiveRequestHandler)
+        self.server.live = self
+
+    def client(self):
+        return ClientContext(self)
+
+    def add_client(self):
+        with self.mutex:
+            if self.clients >= self.max_clients:
+                raise TooManyClients()
+
+            # only count the client once the stream is running, so a
+            # failure here does not leave a client that never leaves
+            if self.clients == 0:
+                try:
+                    self.start_stream()
+                except Exception as err:
+                    LOG.error('failed to start live stream: %s', err)
+                    self.broadcaster.close()
+                    raise StreamUnavailable(str(err))
+
+            self.clients += 1
+
+    def remove_client(self):
+        with self.mutex:
+            self.clients -= 1
+            if self.clients == 0:
+                self.stop_stream()
+
+    def start_stream(self):
+        LOG.info('starting live stream')
+        self.broadcaster.reopen()
+        if self.camera is not None:
+            self.camera.start_recording(self.broadcaster, format='mjpeg',
+                                        resize=(self.res_x, self.res_y),
+                                        quality=self.quality,
+                                        splitter_port=self.splitter_port)
+
+    def stop_stream(self):
+        LOG.info('stopping live stream')
+        if self.camera is not None:
+            self.camera.stop_recording(splitter_port=self.splitter_port)
+        self.broadcaster.close()
+
+    def stop(self):
+        self.flag_stop = True
+        self.broadcaster.close()
+        self.server.shutdown()
+
+    def run(self):
+        LOG.info('starting live view on %s:%d',
+                 self.address or '*', self.server.server_address[1])
+        self.server.serve_forever()
+        self.server.server_close()
+        LOG.info('stopped live view')
+
+    def stats(self):
+        return dict(clients=self.clients,
+                    frames=self.broadcaster.sequence)
@@ -1,11 +1,10 @@
 import argparse
 import configparser
+import functools
 import logging
-import os
 import signal
 
 from pathlib import Path
-from RPi import GPIO
 
 from kcam.camera import Camera
 from kcam.defaults import DEFAULTS
@@ -13,18 +12,29 @@ from kcam.devices.blink import Blink
 from kcam.devices.buzzer import Buzzer
 from kcam.devices.keypad import Keypad
 from kcam.devices.led import LED
+from kcam.eventindex import EventIndex
+from kcam.httpd import HTTPServer
+from kcam.jobstore import JobStore
+from kcam.live import LiveView
 from kcam.metrics import MetricConnection
+from kcam.rebuild import Rebuild
 from kcam.sensors.activity import ActivitySensor
 from kcam.sensors.gpio import GPIOSensor
+from kcam.sensors.motion import VideoMotionSensor, parse_zones
+from kcam.sim import Script
 from kcam.taskmanager import TaskManager
 from kcam.tasks import (EncodeVideo,
                         GenerateThumbnails,
+                        IndexEvent,
                         UpdateEventHTML,
-                        UpdateEventListHTML)
+                        UpdateEventListHTML,
+                        init_templates)
+from kcam import hardware
+from kcam import observer
 from kcam import tunes
-from kcam.util import date_from_path
 
 LOG = logging.getLogger(__name__)
+GPIO = hardware.gpio()
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
 
@@ -41,9 +51,14 @@ class KCam(object):
         'pins',
         'keypad',
         'buzzer',
+        'postprocess',
         'sensor:motion',
         'sensor:door',
         'sensor:activity',
+        'sensor:video_motion',
+        'live',
+        'httpd',
+        'simulation',
     ]
 
     def __init__(self, config):
@@ -59,7 +74,11 @@ class KCam(object):
         self.create_metrics()
         self.create_sensors()
         self.create_camera()
+        self.create_video_motion_sensor()
+        self.create_live_view()
+        self.create_httpd()
         self.create_keypad()
+        self.create_simulation()
 
         self.statefile = Path(self.config.get('DEFAULT', 'statefile'))
 
@@ -71,14 +90,91 @@ class KCam(object):
     def create_buzzer(self):
         self.buzzer = Buzzer(
             self.config.get('buzzer', 'buzzer_pwm_path'),
-            enable=self.config['buzzer'].getboolean('buzzer_enable'),
+            enable=(self.config['buzzer'].getboolean('buzzer_enable') and
+                    not hardware.simulated()),
         )
 
     def create_taskmanager(self):
-        self.postprocess = TaskManager()
+        cfg = self.config['postprocess']
+
+        self.postprocess = TaskManager(
+            workers=cfg.getint('postprocess_workers'),
+            initializer=init_templates,
+            jobstore=JobStore(self.config.get('DEFAULT', 'jobstore')),
+            capture_workers=cfg.getint('capture_workers'),
+            capture_priority=cfg.getint('capture_priority'),
+            ramp_interval=cfg.getfloat('capture_ramp_interval'),
+            max_load=cfg.getfloat('postprocess_max_load'),
+            niceness=cfg.getint('postprocess_nice'))
         self.threads.append(self.postprocess)
-        self.postprocess.add_task((EncodeVideo(), GenerateThumbnails()))
-        self.postprocess.add_task((UpdateEventHTML(), UpdateEventListHTML()))
+
+        # encoding is mostly i/o, so by default there is little point
+        # in running more than one at a time.
+        self.postprocess.add_task(EncodeVideo(), name='encode',
+                                  limit=cfg.getint('encode_limit', 1),
+                                  timeout=cfg.getint('encode_timeout', 600),
+                                  priority=10)
+        self.postprocess.add_task(GenerateThumbnails(), name='thumbnails',
+                                  limit=cfg.getint('thumbnails_limit'),
+                                  timeout=cfg.getint('thumbnails_timeout',
+                                                     300),
+                                  priority=10)
+        self.postprocess.add_task(IndexEvent(), name='index',
+                                  timeout=cfg.getint('index_timeout', 60),
+                                  requires=['encode', 'thumbnails'])
+
+        # the http server renders pages on demand, so unless asked to
+        # there is no need to write them to the data directory.
+        if not self.static_html():
+            return
+
+        self.postprocess.add_task(UpdateEventHTML(), name='event_html',
+                                  limit=cfg.getint('event_html_limit'),
+                                  timeout=cfg.getint('event_html_timeout',
+                                                     60),
+                                  requires=['encode', 'thumbnails'])
+        self.postprocess.add_task(UpdateEventListHTML(),
+                                  name='eventlist_html',
+                                  requires=['index', 'event_html'],
+                                  timeout=cfg.getint('eventlist_html_timeout',
+                                                     300),
+                                  window=cfg.getfloat('eventlist_html_window',
+                                                      5),
+                                  sink=True)
+
+    def static_html(self):
+        cfg = self.config['httpd']
+        return (not cfg.getboolean('httpd_enable', False) or
+                cfg.getboolean('httpd_static_html', False))
+
+    def create_httpd(self):
+        cfg = self.config['httpd']
+        if not cfg.getboolean('httpd_enable', False):
+            self.httpd = None
+            return
+
+        self.httpd = HTTPServer(
+            self.config.get('DEFAULT', 'datadir'),
+            address=cfg.get('httpd_address'),
+            port=cfg.getint('httpd_port'),
+            cache_size=cfg.getint('httpd_cache_size'),
+            keepalive=cfg.getint('httpd_keepalive'),
+        )
+        self.threads.append(self.httpd)
+
+    def create_simulation(self):
+        '''When running with simulated hardware, play back a script of
+        sensor and keypad events'''
+
+        script = self.config['simulation'].get('simulation_script')
+        if not hardware.simulated() or not script:
+            return
+
+        LOG.warning('using simulated hardware with script %s', script)
+        self.threads.append(Script.from_file(
+            script,
+            loop=self.config['simulation'].getboolean('simulation_loop',
+                                                      False)))
 
     def create_buttons(self):
         self.arm_btn = GPIOSensor(
@@ -99,11 +195,37 @@ class KCam(object):
         self.arm_led = LED(self.config.getint('pins', 'arm_led_pin'))
 
     def create_metrics(self):
+        spooldir = self.config['metrics'].get('metrics_spool_dir')
+        spool = str(Path(spooldir) / 'kcam.spool') if spooldir else None
+
         self.metrics = MetricConnection(
             host=self.config['metrics'].get('host'),
             port=self.config['metrics'].get('port'),
             database=self.config['metrics'].get('database'),
+            batch_size=self.config['metrics'].getint('metrics_batch_size'),
+            flush_interval=self.config['metrics'].getfloat(
+                'metrics_flush_interval'),
+            buffer_size=self.config['metrics'].getint('metrics_buffer_size'),
+            spool=spool,
+            timeout=self.config['metrics'].getfloat('metrics_timeout'),
         )
+        self.threads.extend(self.metrics.threads)
+
+        # Metric writes involve a round trip to the metrics server, so
+        # by default they are delivered from a per-observer queue
+        # rather than on the thread that is reporting the event.
+        policy = self.config['metrics'].get('metrics_dispatch_policy')
+        if policy == 'inline':
+            self.metrics_dispatcher = None
+        else:
+            self.metrics_dispatcher = functools.partial(
+                observer.QueuedDispatcher,
+                maxsize=self.config['metrics'].getint('metrics_queue_size'),
+                policy=policy)
+
+    def add_metric_observer(self, observable, name):
+        observable.add_observer(self.metrics.create_observer(name),
+                                dispatcher=self.metrics_dispatcher)
 
     def create_keypad(self):
         self.keypad = Keypad(
@@ -123,13 +245,13 @@ class KCam(object):
             self.config.getint('sensor:motion', 'motion_pin'),
             pull_up=True)
         self.motion_sensor.add_observer(self.det_led, self.det_led.set)
-        self.motion_sensor.add_observer(self.metrics.create_observer('motion'))
+        self.add_metric_observer(self.motion_sensor, 'motion')
         self.threads.append(self.motion_sensor)
 
         self.door_sensor = GPIOSensor(
             self.config.getint('sensor:door', 'door_pin'),
             pull_up=True)
-        self.door_sensor.add_observer(self.metrics.create_observer('door'))
+        self.add_metric_observer(self.door_sensor, 'door')
         self.threads.append(self.door_sensor)
 
         self.activity_sensor = ActivitySensor(
@@ -139,25 +261,83 @@ class KCam(object):
             cooldown=self.config['sensor:activity'].getint('activity_cooldown'),
         )
         self.activity_sensor.add_observer(self.act_led, self.act_led.set)
-        self.activity_sensor.add_observer(self.metrics.create_observer('activity'))
-        self.activity_sensor.stopwatch.add_observer(
-            self.metrics.create_observer('activity_duration'))
+        self.add_metric_observer(self.activity_sensor, 'activity')
+        self.add_metric_observer(self.activity_sensor.stopwatch,
+                                 'activity_duration')
 
     def create_camera(self):
         self.camera = Camera(
             res_x=self.config['camera'].getint('camera_res_x'),
             res_y=self.config['camera'].getint('camera_res_y'),
             lead_time=self.config['camera'].getint('camera_lead_time'),
+            lead_bytes=self.config['camera'].getint('camera_lead_bytes'),
             datadir=self.config.get('DEFAULT', 'datadir'),
             eventdir=self.config['camera'].get('camera_eventdir'),
             imagename=self.config['camera'].get('camera_imagename'),
             videoname=self.config['camera'].get('camera_videoname'),
             interval=self.config['camera'].getint('camera_interval'),
             flip=self.config['camera'].getboolean('camera_flip'),
+            stream_mp4=self.config['camera'].getboolean('camera_stream_mp4'),
+            async_stills=self.config['camera'].getboolean(
+                'camera_async_stills'),
+            still_buffers=self.config['camera'].getint('camera_still_buffers'),
+            burst_count=self.config['camera'].getint('camera_burst_count'),
+            burst_interval=self.config['camera'].getfloat(
+                'camera_burst_interval'),
         )
         self.threads.append(self.camera)
         self.camera.add_observer(self.postprocess)
+        self.camera.capturing.add_observer(self.postprocess,
+                                           self.postprocess.set_capturing)
         self.activity_sensor.add_observer(self.camera)
+        self.motion_sensor.add_observer(self.camera, self.camera.handle_motion)
+
+    def create_video_motion_sensor(self):
+        cfg = self.config['sensor:video_motion']
+        if not cfg.getboolean('video_motion_enable', False):
+            self.video_motion_sensor = None
+            return
+
+        zones = cfg.get('video_motion_zones')
+        self.video_motion_sensor = VideoMotionSensor(
+            self.camera.camera,
+            res_x=cfg.getint('video_motion_res_x'),
+            res_y=cfg.getint('video_motion_res_y'),
+            fps=cfg.getfloat('video_motion_fps'),
+            threshold=cfg.getint('video_motion_threshold'),
+            min_area=cfg.getfloat('video_motion_min_area'),
+            background_rate=cfg.getfloat('video_motion_background_rate'),
+            zones=parse_zones(zones) if zones else None,
+        )
+        self.video_motion_sensor.add_observer(self.det_led, self.det_led.set)
+        self.video_motion_sensor.add_observer(self.camera,
+                                              self.camera.handle_motion)
+        self.add_metric_observer(self.video_motion_sensor, 'video_motion')
+        self.threads.append(self.video_motion_sensor)
+
+    def create_live_view(self):
+        cfg = self.config['live']
+        if not cfg.getboolean('live_enable', False):
+            self.live = None
+            return
+
+        self.live = LiveView(
+            self.camera.camera,
+            address=cfg.get('live_address'),
+            port=cfg.getint('live_port'),
+            res_x=cfg.getint('live_res_x'),
+            res_y=cfg.getint('live_res_y'),
+            quality=cfg.getint('live_quality'),
+            max_clients=cfg.getint('live_max_clients'),
+        )
+        self.threads.append(self.live)
+
+    def motion_sensors(self):
+        sensors = [self.motion_sensor]
+        if self.video_motion_sensor is not None:
+            sensors.append(self.video_motion_sensor)
+
+        return sensors
 
     def arm(self):
         if self.armed:
@@ -165,7 +345,8 @@ class KCam(object):
 
         self.armed = True
         self.arm_led.on()
-        self.motion_sensor.add_observer(self.activity_sensor)
+        for sensor in self.motion_sensors():
+            sensor.add_observer(self.activity_sensor)
         self.buzzer.play(pairs(tunes.TUNE_ARMED))
         self.update_arm_state()
         LOG.warning('armed')
@@ -176,7 +357,8 @@ class KCam(object):
 
         self.armed = False
         self.arm_led.off()
-        self.motion_sensor.delete_observer(self.activity_sensor)
+        for sensor in self.motion_sensors():
+            sensor.delete_observer(self.activity_sensor)
         self.buzzer.play(pairs(tunes.TUNE_DISARMED))
         self.update_arm_state()
         LOG.warning('disarmed')
@@ -220,8 +402,17 @@ class KCam(object):
         with self.statefile.open('w') as fd:
             fd.write('armed' if self.armed else 'disarmed')
 
+    def backfill_index(self):
+        # Events recorded before the index existed would otherwise be
+        # missing from the event list, since the camera only adds the
+        # events it captures.
+        index = EventIndex(self.config.get('DEFAULT', 'datadir'))
+        index.backfill()
+
     def run(self):
         LOG.info('kcam starting up')
+        self.backfill_index()
+
         for thread in self.threads:
             thread.start()
 
@@ -260,7 +451,7 @@ def KeyValueArgument(value):
         raise argparse.ArgumentError('values must of the form <key>=<value>')
 
 
-def parse_args():
+def parse_args(add_arguments=None):
     p = argparse.ArgumentParser()
 
     p.add_argument('--config', '-f',
@@ -283,13 +474,16 @@ def parse_args():
                    default=[],
                    type=KeyValueArgument)
 
+    if add_arguments is not None:
+        add_arguments(p)
+
     p.set_defaults(loglevel='WARNING')
 
     return p.parse_args()
 
 
-def process_cli():
-    args = parse_args()
+def process_cli(add_arguments=None):
+    args = parse_args(add_arguments=add_arguments)
     logging.basicConfig(level=args.loglevel)
     config = configparser.ConfigParser(defaults=DEFAULTS)
     config.read(args.config)
@@ -305,30 +499,31 @@ def process_cli():
     return args, config
 
 
+def update_html_arguments(p):
+    g = p.add_argument_group('Update options')
+    g.add_argument('--jobs', '-j',
+                   type=int,
+                   help='number of processes (default: one per cpu)')
+    g.add_argument('--force',
+                   action='store_true',
+                   help='render events even if they have not changed')
+    g.add_argument('--progress-interval',
+                   type=float,
+                   help='seconds between progress reports')
+
+
 def update_html():
+    args, config = process_cli(add_arguments=update_html_arguments)
+    Rebuild(config.get('DEFAULT', 'datadir'),
+            jobs=args.jobs,
+            force=args.force,
+            progress_interval=args.progress_interval).run()
+
+
+def rebuild_index():
     args, config = process_cli()
-    update_event = UpdateEventHTML()
-    update_eventlist = UpdateEventListHTML()
-    datadir = config.get('DEFAULT', 'datadir')
-
-    events = []
-    for root, dirs, files in os.walk(datadir):
-        root = Path(root)
-        relpath = root.relative_to(datadir)
-        if len(str(relpath).split('/')) != 4:
-            continue
-
-        event = date_from_path(relpath)
-
-        update_event({
-            'datadir': datadir,
-            'path': root,
-            'event': event,
-        })
-
-    update_eventlist({
-        'datadir': datadir,
-    })
+    index = EventIndex(config.get('DEFAULT', 'datadir'))
+    index.rebuild()
 
 
 def main():
@@ -1,5 +1,12 @@
+import collections
 import influxdb
+import influxdb.line_protocol
 import logging
+import os
+import threading
+import time
+
+from pathlib import Path
 
 from . import observer
 
@@ -21,12 +28,370 @@ class MetricListener(observer.Observer):
         if not isinstance(arg, dict):
             arg = {'value': arg}
 
-        LOG.debug('sending metric %s = %s', self.name, arg)
-        self.client.write_points([
+        LOG.debug('queueing metric %s = %s', self.name, arg)
+        self.client.write_point(
             dict(measurement=self.name,
                  tags=self.tags,
+                 time=int(time.time() * 1000),
                  fields=arg)
-        ])
+        )
+
+
+class MetricWriter(threading.Thread):
+
+    '''Collect points in a ring buffer and write them in batches.
+
+    Points are flushed from a background thread when `batch_size`
+    points are waiting or every `flush_interval` seconds, whichever
+    comes first.  When the buffer holds `buffer_size` points the
+    oldest points are discarded.  Each point carries the time at which
+    it was captured (in milliseconds), so batching does not affect
+    the recorded timestamps.'''
+
+    default_batch_size = 100
+    default_flush_interval = 5
+    default_buffer_size = 10000
+
+    def __init__(self, client,
+                 batch_size=None,
+                 flush_interval=None,
+                 buffer_size=None,
+                 spool=None,
+                 **kwargs):
+        super(MetricWriter, self).__init__(**kwargs)
+
+        self.client = client
+        self.spool = spool
+        self.batch_size = (batch_size if batch_size
+                           else self.default_batch_size)
+        self.flush_interval = (flush_interval if flush_interval
+                               else self.default_flush_interval)
+        self.buffer_size = (buffer_size if buffer_size
+                            else self.default_buffer_size)
+
+        self.buffer = collections.deque()
+        self.cond = threading.Condition()
+        self.flag_stop = False
+
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.flush_latency_last = 0.0
+        self.flush_latency_max = 0.0
+
+    def put(self, point):
+        with self.cond:
+            if len(self.buffer) >= self.buffer_size:
+                self.buffer.popleft()
+                self.dropped += 1
+
+            self.buffer.append(point)
+
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.flag_stop = True
+            self.cond.notify()
+
+    def run(self):
+        LOG.info('starting metric writer')
+
+        while True:
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: (self.flag_stop or
+                             len(self.buffer) >= self.batch_size),
+                    timeout=self.flush_interval)
+
+                batch = [self.buffer.popleft()
+                         for i in range(min(self.batch_size,
+                                            len(self.buffer)))]
+                stopping = self.flag_stop
+
+            if batch and not self.flush(batch):
+                self.requeue(batch)
+                if stopping:
+                    break
+
+                # back off before retrying
+                with self.cond:
+                    self.cond.wait_for(lambda: self.flag_stop,
+                                       timeout=self.flush_interval)
+                continue
+
+            if stopping and not self.buffer:
+                break
+
+        if self.spool is not None:
+            self.spool.sync()
+
+        LOG.info('stopping metric writer')
+
+    def flush(self, batch):
+        # While the server is known to be unavailable, go straight to
+        # the spool rather than waiting for another request to fail.
+        if self.spool is not None and self.client.offline:
+            LOG.debug('spooling %d points', len(batch))
+            self.spool.append(batch)
+            return True
+
+        LOG.debug('writing %d points', len(batch))
+        t0 = time.monotonic()
+
+        try:
+            self.client.ensure_database()
+            self.client.write_points(batch, time_precision='ms')
+        except Exception as err:
+            self.flush_failures += 1
+            LOG.error('failed to write %d points: %s', len(batch), err)
+
+            if self.spool is None:
+                return False
+
+            self.client.offline = True
+            self.spool.append(batch)
+            return True
+        finally:
+            latency = time.monotonic() - t0
+            self.flush_latency_last = latency
+            self.flush_latency_max = max(self.flush_latency_max, latency)
+
+        self.flushes += 1
+        self.written += len(batch)
+        return True
+
+    def requeue(self, batch):
+        '''Return a failed batch to the front of the buffer'''
+
+        with self.cond:
+            space = self.buffer_size - len(self.buffer)
+            if space < len(batch):
+                self.dropped += len(batch) - space
+                batch = batch[len(batch) - space:]
+
+            self.buffer.extendleft(reversed(batch))
+
+    def stats(self):
+        return dict(
+            queue_depth=len(self.buffer),
+            spooled=self.spool.pending() if self.spool is not None else 0,
+            written=self.written,
+            dropped=self.dropped,
+            flushes=self.flushes,
+            flush_failures=self.flush_failures,
+            flush_latency_last=self.flush_latency_last,
+            flush_latency_max=self.flush_latency_max,
+        )
+
+
+class MetricSpool(object):
+
+    '''An append-only file of line protocol records.
+
+    Records are appended in bulk and fsynced after `sync_every`
+    records or `sync_interval` seconds, whichever comes first.  The
+    reader position is kept in a separate `.offset` file so that
+    records that have been replayed are not sent again after a
+    restart.  The spool is truncated once it has been drained.'''
+
+    default_sync_every = 100
+    default_sync_interval = 5
+
+    def __init__(self, path, sync_every=None, sync_interval=None):
+        self.path = Path(path)
+        self.offset_path = self.path.with_name(self.path.name + '.offset')
+        self.sync_every = (sync_every if sync_every
+                           else self.default_sync_every)
+        self.sync_interval = (sync_interval if sync_interval
+                              else self.default_sync_interval)
+
+        self.mutex = threading.Lock()
+        self.fd = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.offset = self.read_offset()
+
+        # the spool was removed or truncated behind our back
+        if self.offset > self.size():
+            self.offset = 0
+
+    def read_offset(self):
+        try:
+            with self.offset_path.open('r') as fd:
+                return int(fd.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_offset(self, offset):
+        tmp = self.offset_path.with_name(self.offset_path.name + '.tmp')
+        with tmp.open('w') as fd:
+            fd.write('%d\n' % offset)
+        os.replace(str(tmp), str(self.offset_path))
+        self.offset = offset
+
+    def open(self):
+        if self.fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.fd = self.path.open('ab')
+
+        return self.fd
+
+    def append(self, points):
+        data = influxdb.line_protocol.make_lines(
+            {'points': points}, precision='ms').encode('utf-8')
+
+        with self.mutex:
+            fd = self.open()
+            fd.write(data)
+            self.unsynced += len(points)
+
+            if (self.unsynced >= self.sync_every or
+                    time.monotonic() - self.last_sync >= self.sync_interval):
+                self._sync()
+
+    def _sync(self):
+        if self.fd is not None and self.unsynced:
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        with self.mutex:
+            self._sync()
+
+    def size(self):
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def pending(self):
+        '''Return the number of bytes waiting to be replayed'''
+        with self.mutex:
+            if self.fd is not None:
+                self.fd.flush()
+            return max(0, self.size() - self.offset)
+
+    def read(self, max_records):
+        '''Return up to `max_records` unreplayed records and the
+        offset just past the last one'''
+
+        with self.mutex:
+            if self.fd is not None:
+                self.fd.flush()
+
+        records = []
+        offset = self.offset
+
+        try:
+            with self.path.open('rb') as fd:
+                fd.seek(offset)
+                for line in fd:
+                    # ignore a partially written final record
+                    if not line.endswith(b'\n'):
+                        break
+
+                    offset += len(line)
+                    records.append(line.decode('utf-8').rstrip('\n'))
+                    if len(records) >= max_records:
+                        break
+        except FileNotFoundError:
+            pass
+
+        return records, offset
+
+    def commit(self, offset):
+        '''Mark everything before `offset` as replayed'''
+
+        with self.mutex:
+            if self.fd is not None:
+                self.fd.flush()
+
+            if offset >= self.size():
+                self._sync()
+                if self.fd is not None:
+                    self.fd.truncate(0)
+                elif self.path.exists():
+                    with self.path.open('r+b') as fd:
+                        fd.truncate(0)
+                offset = 0
+
+            self.write_offset(offset)
+
+    def close(self):
+        with self.mutex:
+            self._sync()
+            if self.fd is not None:
+                self.fd.close()
+                self.fd = None
+
+
+class MetricReplay(threading.Thread):
+
+    '''Drain a `MetricSpool` once the metrics server is reachable'''
+
+    default_batch_size = 5000
+    default_retry_interval = 30
+
+    def __init__(self, client, spool,
+                 batch_size=None,
+                 retry_interval=None,
+                 **kwargs):
+        super(MetricReplay, self).__init__(daemon=True, **kwargs)
+
+        self.client = client
+        self.spool = spool
+        self.batch_size = (batch_size if batch_size
+                           else self.default_batch_size)
+        self.retry_interval = (retry_interval if retry_interval
+                               else self.default_retry_interval)
+        self.evt_stop = threading.Event()
+        self.replayed = 0
+
+    def stop(self):
+        self.evt_stop.set()
+
+    def run(self):
+        LOG.info('starting metric replay')
+
+        while True:
+            if self.spool.pending():
+                if self.replay():
+                    continue
+            elif self.client.offline:
+                self.client.offline = False
+
+            if self.evt_stop.wait(self.retry_interval):
+                break
+
+        self.spool.close()
+        LOG.info('stopping metric replay')
+
+    def replay(self):
+        records, offset = self.spool.read(self.batch_size)
+        if not records:
+            return False
+
+        LOG.info('replaying %d spooled points', len(records))
+        try:
+            self.client.ensure_database()
+            self.client.write_points(records,
+                                     time_precision='ms',
+                                     protocol='line')
+        except Exception as err:
+            self.client.offline = True
+            LOG.warning('failed to replay spooled points: %s', err)
+            return False
+
+        self.spool.commit(offset)
+        self.replayed += len(records)
+        self.client.offline = False
+        return True
 
 
 class MetricConnection(influxdb.InfluxDBClient):
@@ -36,6 +401,10 @@ class MetricConnection(influxdb.InfluxDBClient):
                  host=None,
                  port=None,
                  database=None,
+                 batch_size=None,
+                 flush_interval=None,
+                 buffer_size=None,
+                 spool=None,
                  **kwargs):
 
         if host:
@@ -45,9 +414,35 @@ class MetricConnection(influxdb.InfluxDBClient):
 
         super(MetricConnection, self).__init__(**kwargs)
 
-        database = database if database else self.default_database
-        self.create_database(database)
-        self.switch_database(database)
+        # Creating the database is deferred until the first write so
+        # that startup does not depend on the server being reachable.
+        self.database = database if database else self.default_database
+        self.database_ready = False
+        self.offline = False
+        self.switch_database(self.database)
+
+        self.spool = MetricSpool(spool) if spool else None
+        self.writer = MetricWriter(self,
+                                   batch_size=batch_size,
+                                   flush_interval=flush_interval,
+                                   buffer_size=buffer_size,
+                                   spool=self.spool)
+        self.replay = (MetricReplay(self, self.spool)
+                       if self.spool is not None else None)
+
+    @property
+    def threads(self):
+        return [thread for thread in (self.writer, self.replay)
+                if thread is not None]
+
+    def ensure_database(self):
+        if not self.database_ready:
+            self.create_database(self.database)
+            self.database_ready = True
+
+    def write_point(self, point):
+        '''Queue a single point for the background writer'''
+        self.writer.put(point)
 
     def create_observer(self, name, tags=None):
         return MetricListener(self, name, tags=tags)
@@ -0,0 +1,159 @@
+'''Read the duration of an MP4 file without decoding it.
+
+Files remuxed by EncodeVideo have the duration in the movie header.
+Fragmented files written by StreamingMuxer have an empty movie header,
+so for those the sample durations in each movie fragment are added
+up.'''
+
+import logging
+import struct
+
+LOG = logging.getLogger(__name__)
+
+# trun flags
+SAMPLE_DURATION_PRESENT = 0x100
+DATA_OFFSET_PRESENT = 0x01
+FIRST_SAMPLE_FLAGS_PRESENT = 0x04
+
+# tfhd flags
+BASE_DATA_OFFSET_PRESENT = 0x01
+SAMPLE_DESCRIPTION_INDEX_PRESENT = 0x02
+DEFAULT_SAMPLE_DURATION_PRESENT = 0x08
+
+CONTAINERS = [b'moov', b'trak', b'mdia', b'mvex', b'moof', b'traf']
+
+
+def boxes(fd, start, end):
+    '''Yield (type, offset of the payload, end) for each box between
+    `start` and `end`'''
+
+    offset = start
+    while end is None or offset + 8 <= end:
+        fd.seek(offset)
+        header = fd.read(8)
+        if len(header) < 8:
+            break
+
+        size, kind = struct.unpack('>I4s', header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack('>Q', fd.read(8))[0]
+            payload += 8
+        elif size == 0:
+            # the box extends to the end of the file
+            fd.seek(0, 2)
+            size = fd.tell() - offset
+
+        if size < payload - offset:
+            break
+
+        yield kind, payload, offset + size
+        offset += size
+
+
+def full_box(fd, offset):
+    fd.seek(offset)
+    version_flags, = struct.unpack('>I', fd.read(4))
+    return version_flags >> 24, version_flags & 0xffffff
+
+
+def read_mvhd(fd, offset):
+    '''Return (timescale, duration) from a movie or media header'''
+
+    version, flags = full_box(fd, offset)
+    if version == 1:
+        fd.seek(offset + 4 + 16)
+        return struct.unpack('>IQ', fd.read(12))
+
+    fd.seek(offset + 4 + 8)
+    return struct.unpack('>II', fd.read(8))
+
+
+def read_trex(fd, offset):
+    '''Return the default sample duration from a track extends box'''
+
+    fd.seek(offset + 4 + 8)
+    return struct.unpack('>I', fd.read(4))[0]
+
+
+def read_tfhd(fd, offset, default):
+    version, flags = full_box(fd, offset)
+    if not flags & DEFAULT_SAMPLE_DURATION_PRESENT:
+        return default
+
+    skip = 4
+    if flags & BASE_DATA_OFFSET_PRESENT:
+        skip += 8
+    if flags & SAMPLE_DESCRIPTION_INDEX_PRESENT:
+        skip += 4
+
+    fd.seek(offset + 4 + skip)
+    return struct.unpack('>I', fd.read(4))[0]
+
+
+def read_trun(fd, offset, default):
+    '''Return the total duration of the samples in a track run'''
+
+    version, flags = full_box(fd, offset)
+    count, = struct.unpack('>I', fd.read(4))
+
+    if not flags & SAMPLE_DURATION_PRESENT:
+        return count * default
+
+    if flags & DATA_OFFSET_PRESENT:
+        fd.read(4)
+    if flags & FIRST_SAMPLE_FLAGS_PRESENT:
+        fd.read(4)
+
+    # each sample has up to four 32 bit fields, of which the duration
+    # is always the first
+    fields = bin(flags & 0xf00).count('1')
+    data = fd.read(count * fields * 4)
+    return sum(struct.unpack_from('>I', data, i * fields * 4)[0]
+               for i in range(count))
+
+
+def duration(path):
+    '''Return the duration in seconds of an MP4 file containing a
+    single track, or None if it cannot be determined'''
+
+    try:
+        with open(str(path), 'rb') as fd:
+            return _duration(fd)
+    except (OSError, struct.error) as err:
+        LOG.warning('unable to read duration of %s: %s', path, err)
+
+
+def _duration(fd):
+    movie = None
+    timescale = None
+    default = 0
+    fragments = 0
+
+    def walk(start, end):
+        nonlocal movie, timescale, default, fragments
+
+        for kind, payload, box_end in boxes(fd, start, end):
+            if kind == b'mvhd':
+                movie = read_mvhd(fd, payload)
+            elif kind == b'mdhd' and timescale is None:
+                timescale = read_mvhd(fd, payload)[0]
+            elif kind == b'trex':
+                default = read_trex(fd, payload)
+            elif kind == b'traf':
+                traf_default = default
+                for subkind, subpayload, subend in boxes(fd, payload,
+                                                         box_end):
+                    if subkind == b'tfhd':
+                        traf_default = read_tfhd(fd, subpayload, default)
+                    elif subkind == b'trun':
+                        fragments += read_trun(fd, subpayload, traf_default)
+            elif kind in CONTAINERS:
+                walk(payload, box_end)
+
+    walk(0, None)
+
+    if movie is not None and movie[0] and movie[1]:
+        return movie[1] / movie[0]
+    if fragments and timescale:
+        return fragments / timescale
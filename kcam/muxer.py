@@ -0,0 +1,180 @@
+import logging
+import subprocess
+
+from pathlib import Path
+
+LOG = logging.getLogger(__name__)
+
+START_CODE = b'\x00\x00\x01'
+NAL_SPS = 7
+
+
+def find_sps(data):
+    '''Return the offset of the first SPS NAL unit in a chunk of an
+    H.264 byte stream, or None if there is none'''
+
+    offset = data.find(START_CODE)
+    while offset != -1 and offset + len(START_CODE) < len(data):
+        if data[offset + len(START_CODE)] & 0x1f == NAL_SPS:
+            # include the leading zero of a four byte start code
+            if offset > 0 and data[offset - 1] == 0:
+                offset -= 1
+            return offset
+
+        offset = data.find(START_CODE, offset + len(START_CODE))
+
+    return None
+
+
+class StreamingMuxer(object):
+    '''A file-like object that muxes a raw H.264 stream into a
+    fragmented MP4 file as it is written.
+
+    The stream is piped to ffmpeg, which copies (rather than
+    re-encodes) the video into `path`.  Because the MP4 is fragmented
+    at each keyframe, the file is playable while it is still being
+    recorded, and no separate remuxing step is needed afterwards.
+
+    If ffmpeg is not available, the stream is written to a raw `.h264`
+    file next to `path` instead, which EncodeVideo will remux once the
+    event is over.  If ffmpeg exits part way through, the rest of the
+    stream goes to `<stem>-continued.h264`, starting at the next SPS
+    header so that it can be decoded on its own, and the partial mp4
+    is left in place.'''
+
+    default_framerate = 30
+    default_ffmpeg = 'ffmpeg'
+    default_close_timeout = 30
+
+    def __init__(self, path,
+                 framerate=None,
+                 ffmpeg=None,
+                 close_timeout=None):
+        self.path = Path(path)
+        self.framerate = framerate if framerate else self.default_framerate
+        self.ffmpeg = ffmpeg if ffmpeg else self.default_ffmpeg
+        self.close_timeout = (close_timeout if close_timeout
+                              else self.default_close_timeout)
+
+        self.proc = None
+        self.fallback = None
+        self.wait_for_sps = False
+        self.bytes_skipped = 0
+        self.bytes_written = 0
+        self.closed = False
+
+    def command(self):
+        return [
+            self.ffmpeg,
+            '-nostats', '-loglevel', 'error',
+            '-f', 'h264', '-framerate', str(self.framerate),
+            '-i', 'pipe:0',
+            '-c:v', 'copy',
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            '-f', 'mp4', '-y', str(self.path),
+        ]
+
+    def open(self):
+        try:
+            self.proc = subprocess.Popen(self.command(),
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL)
+        except OSError as err:
+            LOG.error('failed to start ffmpeg: %s', err)
+            self.open_fallback()
+
+        return self
+
+    def open_fallback(self, resume=False):
+        if resume:
+            # EncodeVideo remuxes this to its own mp4 file, rather than
+            # on top of the one ffmpeg was writing
+            fallback = self.path.with_name(self.path.stem + '-continued.h264')
+        else:
+            fallback = self.path.with_suffix('.h264')
+
+        LOG.warning('writing raw video to %s', fallback)
+        self.proc = None
+        self.wait_for_sps = resume
+        self.fallback = fallback.open('wb')
+
+    def write(self, data):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.write(data)
+            except (BrokenPipeError, ValueError):
+                LOG.error('ffmpeg exited while muxing %s', self.path)
+                self.finish_proc()
+                self.open_fallback(resume=True)
+
+        if self.fallback is not None:
+            self.write_fallback(data)
+
+        self.bytes_written += len(data)
+        return len(data)
+
+    def write_fallback(self, data):
+        if self.wait_for_sps:
+            # a decoder cannot start in the middle of a group of
+            # pictures, so skip to the next SPS header
+            chunk = bytes(data)
+            start = find_sps(chunk)
+            if start is None:
+                self.bytes_skipped += len(chunk)
+                return
+
+            LOG.info('skipped %d bytes waiting for an SPS header',
+                     self.bytes_skipped + start)
+            self.bytes_skipped += start
+            self.wait_for_sps = False
+            data = chunk[start:]
+
+        self.fallback.write(data)
+
+    def flush(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                pass
+        elif self.fallback is not None:
+            self.fallback.flush()
+
+    def finish_proc(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        try:
+            ret = self.proc.wait(timeout=self.close_timeout)
+        except subprocess.TimeoutExpired:
+            LOG.error('timed out waiting for ffmpeg to finish %s', self.path)
+            self.proc.kill()
+            ret = self.proc.wait()
+
+        if ret != 0:
+            LOG.error('ffmpeg failed muxing %s (exit code %d)',
+                      self.path, ret)
+
+        self.proc = None
+        return ret == 0
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        if self.proc is not None:
+            self.finish_proc()
+        if self.fallback is not None:
+            self.fallback.close()
+
+        LOG.info('wrote %d bytes of video to %s', self.bytes_written,
+                 self.fallback.name if self.fallback else self.path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
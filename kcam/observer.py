@@ -1,6 +1,9 @@
 import abc
+import collections
 import logging
+import queue
 import threading
+import time
 
 LOG = logging.getLogger(__name__)
 
@@ -30,34 +33,264 @@ class Observer(object, metaclass=abc.ABCMeta):
         pass
 
 
+class Dispatcher(object):
+    '''Deliver notifications to a single observer callback.
+
+    The base dispatcher calls the callback inline on the notifying
+    thread.  Every dispatcher keeps simple counters that can be
+    inspected with the `stats` method.'''
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+    def __call__(self, arg):
+        self.deliver(arg, time.monotonic())
+
+    def deliver(self, arg, queued_at):
+        try:
+            self.callback(arg)
+        except Exception:
+            self.failures += 1
+            LOG.exception('observer %s failed', self.callback)
+            if not self.isolated:
+                raise
+        finally:
+            latency = time.monotonic() - queued_at
+            self.delivered += 1
+            self.latency_last = latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_total += latency
+
+    @property
+    def isolated(self):
+        '''True if callback exceptions should not reach the notifier'''
+        return False
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return dict(
+            delivered=self.delivered,
+            dropped=self.dropped,
+            coalesced=self.coalesced,
+            failures=self.failures,
+            pending=self.pending(),
+            latency_last=self.latency_last,
+            latency_max=self.latency_max,
+            latency_avg=(self.latency_total / self.delivered
+                         if self.delivered else 0.0),
+        )
+
+    def pending(self):
+        return 0
+
+    def __str__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.callback)
+
+
+class QueuedDispatcher(Dispatcher):
+    '''Deliver notifications from a dedicated worker thread.
+
+    Notifications are placed on a bounded queue.  When the queue is
+    full, `policy` decides what happens:
+
+    - `drop` discards the oldest queued notification
+    - `drop_new` discards the new notification
+    - `coalesce` replaces everything queued with the new notification
+    - `block` waits for the worker to catch up
+    '''
+
+    policies = ['drop', 'drop_new', 'coalesce', 'block']
+    default_maxsize = 100
+    default_policy = 'drop'
+
+    def __init__(self, callback, maxsize=None, policy=None):
+        super(QueuedDispatcher, self).__init__(callback)
+        self.maxsize = maxsize if maxsize else self.default_maxsize
+        self.policy = policy if policy else self.default_policy
+
+        if self.policy not in self.policies:
+            raise ValueError('unknown dispatch policy: %s' % self.policy)
+
+        self.q = collections.deque()
+        self.cond = threading.Condition()
+        self.flag_stop = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    @property
+    def isolated(self):
+        return True
+
+    def __call__(self, arg):
+        item = (arg, time.monotonic())
+
+        with self.cond:
+            if self.policy == 'coalesce' and self.q:
+                self.coalesced += len(self.q)
+                self.q.clear()
+            elif len(self.q) >= self.maxsize:
+                if self.policy == 'drop':
+                    self.q.popleft()
+                    self.dropped += 1
+                elif self.policy == 'drop_new':
+                    self.dropped += 1
+                    return
+                else:
+                    self.cond.wait_for(
+                        lambda: len(self.q) < self.maxsize or self.flag_stop)
+
+            self.q.append(item)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.q or self.flag_stop)
+                if self.flag_stop:
+                    break
+                arg, queued_at = self.q.popleft()
+                self.cond.notify()
+
+            self.deliver(arg, queued_at)
+
+    def pending(self):
+        return len(self.q)
+
+    def close(self):
+        with self.cond:
+            self.flag_stop = True
+            self.cond.notify_all()
+
+
+class ExecutorDispatcher(Dispatcher):
+    '''Deliver notifications on a shared executor.
+
+    `executor` is a `concurrent.futures.Executor` that may be shared by
+    many observers.  At most `maxsize` notifications for this observer
+    are outstanding at any time; the same policies as for
+    `QueuedDispatcher` apply (`block` is treated as `drop_new`, since
+    waiting on a shared executor from the notifying thread would
+    defeat the purpose).'''
+
+    default_maxsize = 100
+    default_policy = 'drop'
+
+    def __init__(self, callback, executor, maxsize=None, policy=None):
+        super(ExecutorDispatcher, self).__init__(callback)
+        self.executor = executor
+        self.maxsize = maxsize if maxsize else self.default_maxsize
+        self.policy = policy if policy else self.default_policy
+
+        if self.policy not in QueuedDispatcher.policies:
+            raise ValueError('unknown dispatch policy: %s' % self.policy)
+
+        self.q = collections.deque()
+        self.mutex = threading.Lock()
+        self.running = False
+
+    @property
+    def isolated(self):
+        return True
+
+    def __call__(self, arg):
+        item = (arg, time.monotonic())
+
+        with self.mutex:
+            if self.policy == 'coalesce' and self.q:
+                self.coalesced += len(self.q)
+                self.q.clear()
+            elif len(self.q) >= self.maxsize:
+                if self.policy == 'drop':
+                    self.q.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return
+
+            self.q.append(item)
+
+            # Only one drain task per observer is outstanding at a
+            # time, so notifications are delivered in order.
+            if not self.running:
+                self.running = True
+                self.executor.submit(self.drain)
+
+    def drain(self):
+        while True:
+            with self.mutex:
+                if not self.q:
+                    self.running = False
+                    return
+                arg, queued_at = self.q.popleft()
+
+            self.deliver(arg, queued_at)
+
+    def pending(self):
+        return len(self.q)
+
+    def close(self):
+        with self.mutex:
+            self.q.clear()
+
+
 class Observable(Synchronization):
 
     def __init__(self, *args, **kwargs):
         super(Observable, self).__init__(*args, **kwargs)
-        self.observers = set()
+        self.observers = {}
 
     @synchronized
-    def add_observer(self, who, callback=None):
+    def add_observer(self, who, callback=None, dispatcher=None):
+        '''Register `callback` (or `who.update`) for notifications.
+
+        `dispatcher` is an optional factory that is called with the
+        callback and returns a `Dispatcher`, for example
+        `functools.partial(QueuedDispatcher, policy='coalesce')`.  By
+        default callbacks are called inline on the notifying thread.'''
+
         if callback is None:
             callback = getattr(who, 'update')
 
-        self.observers.add(callback)
+        if dispatcher is None:
+            dispatcher = Dispatcher
+
+        if callback in self.observers:
+            self.observers[callback].close()
+
+        self.observers[callback] = dispatcher(callback)
 
     @synchronized
     def delete_observer(self, who, callback=None):
         if callback is None:
             callback = getattr(who, 'update')
 
-        self.observers.remove(callback)
+        self.observers.pop(callback).close()
 
     @synchronized
     def clear_observers(self):
-        self.observers = set()
+        for dispatcher in self.observers.values():
+            dispatcher.close()
+
+        self.observers = {}
+
+    @synchronized
+    def observer_stats(self):
+        return {callback: dispatcher.stats()
+                for callback, dispatcher in self.observers.items()}
 
     def notify_observers(self, arg=None):
         LOG.debug('sending notifications')
         with self.mutex:
-            obs = list(self.observers)
+            obs = list(self.observers.values())
 
         for observer in obs:
             LOG.debug('notifying %s', observer)
@@ -0,0 +1,213 @@
+import collections
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# These match the values of picamera.PiVideoFrameType
+FRAME = 0
+KEY_FRAME = 1
+SPS_HEADER = 2
+
+
+class Frame(object):
+    __slots__ = ('offset', 'size', 'frame_type', 'timestamp', 'complete')
+
+    def __init__(self, offset, frame_type, timestamp):
+        self.offset = offset
+        self.size = 0
+        self.frame_type = frame_type
+        self.timestamp = timestamp
+        self.complete = False
+
+
+class PreEventBuffer(object):
+    '''A ring buffer of recent H.264 video for the start of each event.
+
+    The buffer is a single preallocated bytearray of `max_bytes`, so
+    memory use does not depend on the bitrate.  The oldest frames are
+    discarded to make room for new ones.  Each frame is indexed as it
+    is written (using the frame information that picamera provides for
+    the encoder on `splitter_port`), so that `copy_to` can start output at the first
+    SPS header (which picamera emits immediately before each keyframe)
+    within the last `seconds` and the clip never begins mid-GOP.  If
+    there is no keyframe in that window, the most recent one before it
+    is used instead.'''
+
+    default_seconds = 10
+    default_max_bytes = 32 * 1024 * 1024
+
+    def __init__(self, camera=None, seconds=None, max_bytes=None,
+                 splitter_port=1):
+        self.camera = camera
+        self.splitter_port = splitter_port
+        self.seconds = seconds if seconds is not None else self.default_seconds
+        self.max_bytes = max_bytes if max_bytes else self.default_max_bytes
+
+        self.buf = bytearray(self.max_bytes)
+        self.view = memoryview(self.buf)
+        self.lock = threading.Lock()
+        self.frames = collections.deque()
+        self.current = None
+        self.head = 0
+        self.used = 0
+
+        self.dropped = 0
+        self.flushes = 0
+        self.flushed_bytes = 0
+
+    def frame_info(self):
+        '''Return the type of the frame being written and whether
+        this write completes it'''
+
+        # PiCamera.frame belongs to whichever encoder happens to be
+        # first, which may be the motion sensor or the live view, so
+        # look up our own encoder the way PiCameraCircularIO does.
+        try:
+            frame = self.camera._encoders[self.splitter_port].frame
+        except (AttributeError, KeyError):
+            frame = None
+
+        if frame is None:
+            return FRAME, True
+
+        return frame.frame_type, frame.complete
+
+    def write(self, data):
+        size = len(data)
+        frame_type, complete = self.frame_info()
+
+        with self.lock:
+            if self.current is None:
+                self.current = Frame(self.head, frame_type, time.monotonic())
+                self.frames.append(self.current)
+
+            frame = self.current
+            if frame.size + size > self.max_bytes:
+                # a single frame larger than the whole buffer
+                self.discard_current()
+            else:
+                self.make_room(size)
+                self.copy_in(data)
+                frame.size += size
+
+            if complete and self.current is not None:
+                self.current.complete = True
+                self.current = None
+
+        return size
+
+    def copy_in(self, data):
+        size = len(data)
+        first = min(size, self.max_bytes - self.head)
+        self.view[self.head:self.head + first] = data[:first]
+        if first < size:
+            self.view[:size - first] = data[first:]
+
+        self.head = (self.head + size) % self.max_bytes
+        self.used += size
+
+    def make_room(self, size):
+        while self.used + size > self.max_bytes:
+            oldest = self.frames[0]
+            if oldest is self.current:
+                break
+
+            self.frames.popleft()
+            self.used -= oldest.size
+
+    def discard_current(self):
+        self.dropped += 1
+        self.frames.pop()
+        self.used -= self.current.size
+        self.head = self.current.offset
+        self.current = None
+
+    def start_frame(self, since):
+        '''Return the index of the frame at which to start a flush'''
+
+        start = None
+        for i, frame in enumerate(self.frames):
+            if frame.frame_type != SPS_HEADER:
+                continue
+
+            start = i
+            if frame.timestamp >= since:
+                break
+
+        return start
+
+    def segments(self, frame):
+        '''Return memoryviews covering the data for `frame`, which may
+        wrap around the end of the buffer'''
+
+        end = frame.offset + frame.size
+        if end <= self.max_bytes:
+            return [self.view[frame.offset:end]]
+
+        return [self.view[frame.offset:],
+                self.view[:end - self.max_bytes]]
+
+    def flush(self):
+        # picamera flushes its outputs when a recording is split or
+        # stopped; there is nothing to do here.
+        pass
+
+    def copy_to(self, output):
+        '''Write the buffered video from the first keyframe in the last
+        `seconds` to `output`, then empty the buffer.  Returns the
+        number of bytes written.'''
+
+        with self.lock:
+            start = self.start_frame(time.monotonic() - self.seconds)
+            written = 0
+
+            if start is None:
+                LOG.warning('no keyframe in pre-event buffer')
+            else:
+                frames = list(self.frames)[start:]
+                for frame in frames:
+                    if not frame.complete:
+                        break
+
+                    for segment in self.segments(frame):
+                        output.write(segment)
+                        written += len(segment)
+
+                LOG.info('flushed %d bytes (%d frames, %.1f seconds) '
+                         'from pre-event buffer', written, len(frames),
+                         time.monotonic() - frames[0].timestamp)
+
+            self.flushes += 1
+            self.flushed_bytes += written
+            self.reset()
+
+        return written
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+
+    def reset(self):
+        self.frames.clear()
+        self.current = None
+        self.head = 0
+        self.used = 0
+
+    def stats(self):
+        with self.lock:
+            oldest = self.frames[0].timestamp if self.frames else None
+            return dict(
+                capacity=self.max_bytes,
+                used=self.used,
+                fill=self.used / self.max_bytes,
+                frames=len(self.frames),
+                keyframes=sum(1 for frame in self.frames
+                              if frame.frame_type == SPS_HEADER),
+                seconds=(time.monotonic() - oldest
+                         if oldest is not None else 0),
+                dropped=self.dropped,
+                flushes=self.flushes,
+                flushed_bytes=self.flushed_bytes,
+            )
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from pathlib import Path
+
+from kcam.eventindex import EventIndex, media_kind
+from kcam.tasks import (UpdateEventHTML,
+                        UpdateEventListHTML,
+                        init_templates,
+                        template_environment)
+
+LOG = logging.getLogger(__name__)
+
+# media that appears on an event page
+PAGE_MEDIA = ['image', 'thumb', 'video']
+
+
+def template_signature(templatedir=None):
+    '''Return a hash of the event page templates, so that changing a
+    template causes every event to be rendered again'''
+
+    env = template_environment(templatedir)
+    digest = hashlib.sha1()
+    for name in ['event.html', 'page.html']:
+        source, filename, uptodate = env.loader.get_source(env, name)
+        digest.update(source.encode())
+
+    return digest.hexdigest()
+
+
+def event_signature(path, base):
+    '''Return a hash of the names, sizes and modification times of the
+    media in an event directory'''
+
+    digest = hashlib.sha1(base.encode())
+    entries = sorted(os.scandir(str(path)), key=lambda entry: entry.name)
+
+    for entry in entries:
+        if media_kind(entry.name) not in PAGE_MEDIA:
+            continue
+
+        stat = entry.stat()
+        digest.update('{}\0{}\0{}\0'.format(
+            entry.name, stat.st_size, stat.st_mtime_ns).encode())
+
+    return digest.hexdigest()
+
+
+def render_event(arg):
+    '''Render index.html for an event unless its signature matches the
+    one it was last rendered with.  Returns a (path, signature,
+    rendered, error) tuple.'''
+
+    path = Path(arg['path'])
+
+    try:
+        signature = event_signature(path, arg['base'])
+        if (not arg['force'] and signature == arg['signature'] and
+                (path / 'index.html').is_file()):
+            return arg['path'], signature, False, None
+
+        UpdateEventHTML(templatedir=arg['templatedir'])(arg)
+        return arg['path'], signature, True, None
+    except Exception as err:
+        return arg['path'], None, False, '%s: %s' % (
+            err.__class__.__name__, err)
+
+
+class Progress(object):
+    '''Report progress and throughput every `interval` seconds'''
+
+    def __init__(self, total, interval=5, stream=None):
+        self.total = total
+        self.interval = interval
+        self.stream = stream if stream else sys.stderr
+        self.done = self.rendered = self.unchanged = self.failed = 0
+        self.started = self.last_report = time.monotonic()
+
+    def update(self, rendered, failed):
+        self.done += 1
+        if failed:
+            self.failed += 1
+        elif rendered:
+            self.rendered += 1
+        else:
+            self.unchanged += 1
+
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed else 0
+
+    def report(self):
+        rate = self.rate
+        eta = (self.total - self.done) / rate if rate else 0
+        print('{}/{} events ({:.0%}), {} rendered, {} unchanged, {} failed, '
+              '{:.1f} events/s, {:.0f}s remaining'.format(
+                  self.done, self.total,
+                  self.done / self.total if self.total else 1,
+                  self.rendered, self.unchanged, self.failed,
+                  rate, eta),
+              file=self.stream)
+
+    def summary(self):
+        print('processed {} events in {:.1f}s ({:.1f} events/s): '
+              '{} rendered, {} unchanged, {} failed'.format(
+                  self.done, time.monotonic() - self.started, self.rate,
+                  self.rendered, self.unchanged, self.failed),
+              file=self.stream)
+
+
+class Rebuild(object):
+    '''Regenerate the html for every event in a data directory.
+
+    Event pages are rendered by a pool of `jobs` processes.  The
+    signature of the media each page was rendered from is stored in
+    the event index, and events whose media have not changed since
+    are skipped unless `force` is set.  The event listing is rendered
+    afterwards if any event page changed.'''
+
+    default_progress_interval = 5
+
+    def __init__(self, datadir, jobs=None, force=False, templatedir=None,
+                 progress_interval=None, stream=None):
+        self.datadir = Path(datadir)
+        self.jobs = jobs if jobs else multiprocessing.cpu_count()
+        self.force = force
+        self.templatedir = templatedir
+        self.progress_interval = (progress_interval if progress_interval
+                                  else self.default_progress_interval)
+        self.stream = stream
+        self.index = EventIndex(self.datadir)
+
+    def chunksize(self, count):
+        return max(1, min(64, count // (self.jobs * 8)))
+
+    def run(self):
+        self.index.backfill()
+
+        base = template_signature(self.templatedir)
+        signatures = self.index.signatures()
+        args = [{
+            'datadir': str(self.datadir),
+            'path': str(path),
+            'event': event,
+            'base': base,
+            'signature': signatures.get(self.index.relpath(path)),
+            'force': self.force,
+            'templatedir': self.templatedir,
+        } for event, path in self.index.events()]
+
+        progress = Progress(len(args), interval=self.progress_interval,
+                            stream=self.stream)
+        rendered = []
+
+        LOG.info('rebuilding html for %d events with %d workers',
+                 len(args), self.jobs)
+        with multiprocessing.Pool(self.jobs, initializer=init_templates,
+                                  initargs=(self.templatedir,)) as pool:
+            results = pool.imap_unordered(render_event, args,
+                                          chunksize=self.chunksize(len(args)))
+            for path, signature, changed, error in results:
+                if error is not None:
+                    LOG.error('failed to render %s: %s', path, error)
+                elif changed:
+                    rendered.append((path, signature))
+
+                progress.update(changed, error is not None)
+
+        self.index.set_signatures(rendered)
+
+        if (rendered or self.force or
+                not (self.datadir / 'index.html').is_file()):
+            LOG.info('updating event list')
+            UpdateEventListHTML(templatedir=self.templatedir)({
+                'datadir': str(self.datadir),
+            })
+
+        progress.summary()
+        return progress
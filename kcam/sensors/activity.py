@@ -1,6 +1,6 @@
 import logging
 
-from kcam.timer import DynamicTimer
+from kcam import timer
 from kcam.stopwatch import Stopwatch
 from kcam import observer
 
@@ -22,6 +22,7 @@ class ActivitySensor(observer.Observable, observer.Observer):
                  extend=None,
                  limit=None,
                  cooldown=None,
+                 timers=None,
                  **kwargs):
 
         super(ActivitySensor, self).__init__(**kwargs)
@@ -30,6 +31,7 @@ class ActivitySensor(observer.Observable, observer.Observer):
         self.limit = limit if limit else self.default_limit
         self.extend = extend if extend else self.default_extend
         self.cooldown = cooldown if cooldown else self.default_cooldown
+        self.timers = timers if timers else timer.default_service()
         self.stopwatch = Stopwatch()
 
         self.active = STATE_IDLE
@@ -51,13 +53,17 @@ class ActivitySensor(observer.Observable, observer.Observer):
         self.stopwatch.start()
         self.notify_observers(1)
 
-        self.timer = DynamicTimer(
+        self.timer = self.timers.schedule(
             interval=self.interval,
             function=self.end_active,
             limit=self.limit)
-        self.timer.start()
 
     def continue_active(self):
+        # The timer may have fired while end_active has not yet
+        # switched to the cooldown state.
+        if not self.timer.is_alive():
+            return
+
         LOG.info('continue activity')
         self.timer.extend(self.extend)
 
@@ -68,10 +74,9 @@ class ActivitySensor(observer.Observable, observer.Observer):
         self.notify_observers(0)
 
         LOG.debug('cooldown for %d seconds', self.cooldown)
-        self.timer = DynamicTimer(
+        self.timer = self.timers.schedule(
             interval=self.cooldown,
             function=self.end_cooldown)
-        self.timer.start()
 
     def end_cooldown(self):
         LOG.info('end cooldown')
@@ -1,10 +1,10 @@
 import logging
 
-from RPi import GPIO
-
+from kcam import hardware
 from kcam import observer
 
 LOG = logging.getLogger(__name__)
+GPIO = hardware.gpio()
 
 
 class GPIOSensor(observer.Observable):
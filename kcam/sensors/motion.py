@@ -0,0 +1,176 @@
+import logging
+import time
+
+import numpy
+
+from kcam import observer
+
+LOG = logging.getLogger(__name__)
+
+
+def parse_zones(spec):
+    '''Parse a zone specification of the form
+    `x0,y0,x1,y1;x0,y0,x1,y1;...`, where each coordinate is a fraction
+    of the width or height of the frame.'''
+
+    zones = []
+    for zone in spec.split(';'):
+        zone = zone.strip()
+        if not zone:
+            continue
+
+        coords = [float(x) for x in zone.split(',')]
+        if len(coords) != 4:
+            raise ValueError('invalid zone: %s' % zone)
+
+        zones.append(tuple(coords))
+
+    return zones
+
+
+class VideoMotionSensor(observer.Observable):
+    '''Detect motion in low resolution frames from a camera splitter
+    port.
+
+    The sensor acts as a picamera output for unencoded YUV frames,
+    which the GPU scales down to `res_x` x `res_y`.  Only the luminance
+    plane is used.  Each processed frame is compared with a running
+    average of previous frames; a pixel has changed if it differs from
+    the background by more than `threshold`, and there is motion if
+    more than `min_area` of the pixels in any zone have changed.
+
+    To keep the cpu cost fixed, at most `fps` frames per second are
+    processed, and the rest are skipped.  Like GPIOSensor, observers
+    are notified with 1 when motion starts and 0 when it stops.'''
+
+    default_res_x = 160
+    default_res_y = 120
+    default_fps = 5
+    default_threshold = 25
+    default_min_area = 0.01
+    default_background_rate = 0.05
+    default_splitter_port = 2
+
+    def __init__(self, camera=None,
+                 res_x=None,
+                 res_y=None,
+                 fps=None,
+                 threshold=None,
+                 min_area=None,
+                 background_rate=None,
+                 zones=None,
+                 splitter_port=None,
+                 **kwargs):
+
+        super(VideoMotionSensor, self).__init__(**kwargs)
+
+        self.camera = camera
+        self.res_x = res_x if res_x else self.default_res_x
+        self.res_y = res_y if res_y else self.default_res_y
+        self.fps = fps if fps else self.default_fps
+        self.threshold = threshold if threshold else self.default_threshold
+        self.min_area = min_area if min_area else self.default_min_area
+        self.background_rate = (background_rate if background_rate
+                                else self.default_background_rate)
+        self.splitter_port = (splitter_port if splitter_port
+                              else self.default_splitter_port)
+        self.zones = self.zone_slices(zones if zones else [(0, 0, 1, 1)])
+
+        # picamera pads YUV frames to a multiple of 32 pixels wide and
+        # 16 pixels high
+        self.frame_x = (self.res_x + 31) // 32 * 32
+        self.frame_y = (self.res_y + 15) // 16 * 16
+
+        self.interval = 1.0 / self.fps
+        self.background = None
+        self.value = 0
+        self.next_frame = 0
+
+        self.processed = 0
+        self.skipped = 0
+        self.frame_time_last = 0.0
+        self.frame_time_max = 0.0
+        self.frame_time_total = 0.0
+
+    def zone_slices(self, zones):
+        slices = []
+        for x0, y0, x1, y1 in zones:
+            slices.append((slice(int(y0 * self.res_y), int(y1 * self.res_y)),
+                           slice(int(x0 * self.res_x), int(x1 * self.res_x))))
+
+        return slices
+
+    def start(self):
+        LOG.info('starting video motion sensor on splitter port %d',
+                 self.splitter_port)
+        self.camera.start_recording(self, format='yuv',
+                                    resize=(self.res_x, self.res_y),
+                                    splitter_port=self.splitter_port)
+
+    def stop(self):
+        LOG.info('stopping video motion sensor')
+        self.camera.stop_recording(splitter_port=self.splitter_port)
+
+    def write(self, data):
+        now = time.monotonic()
+        if now < self.next_frame:
+            self.skipped += 1
+        else:
+            # keep to the target rate, but don't try to catch up after
+            # falling behind
+            self.next_frame += self.interval
+            if self.next_frame < now:
+                self.next_frame = now + self.interval
+
+            self.process(data)
+            elapsed = time.monotonic() - now
+            self.processed += 1
+            self.frame_time_last = elapsed
+            self.frame_time_max = max(self.frame_time_max, elapsed)
+            self.frame_time_total += elapsed
+
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def luminance(self, data):
+        frame = numpy.frombuffer(data, dtype=numpy.uint8,
+                                 count=self.frame_x * self.frame_y)
+        frame = frame.reshape((self.frame_y, self.frame_x))
+        return frame[:self.res_y, :self.res_x].astype(numpy.float32)
+
+    def process(self, data):
+        if len(data) < self.frame_x * self.frame_y:
+            LOG.warning('ignoring short frame (%d bytes)', len(data))
+            return
+
+        frame = self.luminance(data)
+
+        if self.background is None:
+            self.background = frame
+            return
+
+        changed = numpy.abs(frame - self.background) > self.threshold
+        motion = any(changed[zone].mean() > self.min_area
+                     for zone in self.zones)
+
+        # update the running average in place
+        self.background *= 1 - self.background_rate
+        self.background += self.background_rate * frame
+
+        value = 1 if motion else 0
+        if value != self.value:
+            self.value = value
+            LOG.debug('video motion changed to %d', value)
+            self.notify_observers(value)
+
+    def stats(self):
+        return dict(
+            processed=self.processed,
+            skipped=self.skipped,
+            frame_time_last=self.frame_time_last,
+            frame_time_max=self.frame_time_max,
+            frame_time_avg=(self.frame_time_total / self.processed
+                            if self.processed else 0),
+        )
@@ -1,10 +1,11 @@
-import Adafruit_DHT
 import logging
 import threading
 
+from kcam import hardware
 from kcam import observer
 
 LOG = logging.getLogger(__name__)
+Adafruit_DHT = hardware.dht()
 
 
 devices = {
@@ -0,0 +1,80 @@
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+
+class Script(threading.Thread):
+    '''Play back a script of simulated hardware events.
+
+    Each line of the script is a delay in seconds followed by an
+    action:
+
+        <delay> gpio <pin> <value>   set a gpio input high or low
+        <delay> keys <text>          type on the virtual keypad (\\n
+                                     presses enter)
+        <delay> key <keyname>        press a single key (e.g. KEY_KPENTER)
+        <delay> motion on|off        start or stop motion in the video
+
+    Blank lines and lines starting with # are ignored.  If `loop` is
+    true the script repeats until the thread is stopped.'''
+
+    def __init__(self, lines, loop=False, **kwargs):
+        kwargs.setdefault('daemon', True)
+        super(Script, self).__init__(**kwargs)
+
+        self.steps = list(self.parse(lines))
+        self.loop = loop
+        self.evt_stop = threading.Event()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as fd:
+            return cls(fd.readlines(), **kwargs)
+
+    def parse(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            delay, action, *args = line.split()
+            if action not in ['gpio', 'keys', 'key', 'motion']:
+                raise ValueError('unknown action in script: %s' % line)
+
+            yield float(delay), action, args
+
+    def stop(self):
+        self.evt_stop.set()
+
+    def run(self):
+        LOG.info('starting simulation script')
+
+        while True:
+            for delay, action, args in self.steps:
+                if self.evt_stop.wait(delay):
+                    return
+
+                LOG.debug('simulation: %s %s', action, ' '.join(args))
+                getattr(self, 'do_%s' % action)(*args)
+
+            if not self.loop:
+                break
+
+        LOG.info('finished simulation script')
+
+    def do_gpio(self, pin, value):
+        from kcam.sim import gpio
+        gpio.set_input(int(pin), int(value))
+
+    def do_keys(self, text):
+        from kcam.sim import evdev
+        evdev.type_keys(text.replace('\\n', '\n'))
+
+    def do_key(self, keyname):
+        from kcam.sim import evdev
+        evdev.press(keyname)
+
+    def do_motion(self, state):
+        from kcam.sim import picamera
+        picamera.set_motion(state == 'on')
@@ -0,0 +1,19 @@
+'''A simulated Adafruit_DHT that reports slowly drifting readings'''
+
+import math
+import time
+
+DHT11 = 11
+DHT22 = 22
+AM2302 = 22
+
+
+def read_retry(sensor, pin, retries=15, delay_seconds=2):
+    return read(sensor, pin)
+
+
+def read(sensor, pin):
+    phase = time.time() / 3600
+    humidity = 50 + 10 * math.sin(phase)
+    temperature = 20 + 3 * math.cos(phase)
+    return humidity, temperature
@@ -0,0 +1,121 @@
+'''A simulated evdev with a single virtual keypad.
+
+Keys are pressed by calling `press` (or `type_keys`), which queues key
+down and key up events for any InputDevice reading from the keypad.'''
+
+import collections
+import queue
+import time
+
+DEVICE_PATH = '/dev/input/sim-keypad'
+DEVICE_NAME = 'kcam simulated keypad'
+
+
+class ecodes(object):
+    EV_SYN = 0x00
+    EV_KEY = 0x01
+
+    KEY_ENTER = 28
+    KEY_KPENTER = 96
+    KEY_KPASTERISK = 55
+    KEY_KPMINUS = 74
+    KEY_KPPLUS = 78
+    KEY_KPDOT = 83
+    KEY_KPSLASH = 98
+    KEY_BACKSPACE = 14
+
+    KEY_1, KEY_2, KEY_3, KEY_4, KEY_5 = 2, 3, 4, 5, 6
+    KEY_6, KEY_7, KEY_8, KEY_9, KEY_0 = 7, 8, 9, 10, 11
+
+    KEY_KP7, KEY_KP8, KEY_KP9 = 71, 72, 73
+    KEY_KP4, KEY_KP5, KEY_KP6 = 75, 76, 77
+    KEY_KP1, KEY_KP2, KEY_KP3 = 79, 80, 81
+    KEY_KP0 = 82
+
+
+KEY = {name: code for name, code in vars(ecodes).items()
+       if name.startswith('KEY_')}
+KEYNAME = {code: name for name, code in KEY.items()}
+
+# map characters for type_keys to keypad keys
+CHARS = dict((str(i), 'KEY_KP%d' % i) for i in range(10))
+CHARS.update({
+    '\n': 'KEY_KPENTER',
+    '*': 'KEY_KPASTERISK',
+    '-': 'KEY_KPMINUS',
+    '+': 'KEY_KPPLUS',
+    '.': 'KEY_KPDOT',
+    '/': 'KEY_KPSLASH',
+})
+
+_events = queue.Queue()
+
+InputEvent = collections.namedtuple('InputEvent',
+                                    ['sec', 'usec', 'type', 'code', 'value'])
+
+
+class KeyEvent(object):
+    key_up = 0
+    key_down = 1
+    key_hold = 2
+
+    def __init__(self, event):
+        self.event = event
+        self.scancode = event.code
+        self.keycode = KEYNAME.get(event.code, 'KEY_UNKNOWN')
+        self.keystate = event.value
+
+
+def categorize(event):
+    if event.type == ecodes.EV_KEY:
+        return KeyEvent(event)
+
+    return event
+
+
+def list_devices():
+    return [DEVICE_PATH]
+
+
+class InputDevice(object):
+    def __init__(self, path):
+        # every device path refers to the same virtual keypad
+        self.path = path
+        self.name = DEVICE_NAME
+
+    def __str__(self):
+        return 'device %s, name "%s"' % (self.path, self.name)
+
+    def capabilities(self):
+        return {ecodes.EV_KEY: sorted(KEY.values())}
+
+    def grab(self):
+        pass
+
+    def ungrab(self):
+        pass
+
+    def read_loop(self):
+        while True:
+            yield _events.get()
+
+
+def _event(code, value):
+    now = time.time()
+    return InputEvent(int(now), int(now % 1 * 1e6),
+                      ecodes.EV_KEY, code, value)
+
+
+def press(keyname):
+    '''Press and release a key'''
+
+    code = KEY[keyname]
+    _events.put(_event(code, KeyEvent.key_down))
+    _events.put(_event(code, KeyEvent.key_up))
+
+
+def type_keys(text):
+    '''Type a string on the keypad; a newline presses enter'''
+
+    for char in text:
+        press(CHARS[char])
@@ -0,0 +1,110 @@
+'''A simulated RPi.GPIO.
+
+Inputs are driven by calling `set_input` (directly, or from a
+simulation script), which calls any edge detection callbacks in the
+same way as the real module.  Outputs are simply recorded.'''
+
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+BCM = 11
+BOARD = 10
+
+IN = 1
+OUT = 0
+
+LOW = 0
+HIGH = 1
+
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+_mutex = threading.RLock()
+_mode = None
+_pins = {}
+_callbacks = {}
+
+
+class Pin(object):
+    def __init__(self, direction, value):
+        self.direction = direction
+        self.value = value
+
+
+def setwarnings(flag):
+    pass
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def getmode():
+    return _mode
+
+
+def setup(pin, direction, pull_up_down=PUD_OFF, initial=None):
+    if initial is None:
+        initial = HIGH if pull_up_down == PUD_UP else LOW
+
+    with _mutex:
+        _pins[pin] = Pin(direction, initial)
+
+
+def input(pin):
+    with _mutex:
+        return _pins[pin].value
+
+
+def output(pin, value):
+    with _mutex:
+        _pins[pin].value = int(value)
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    with _mutex:
+        _callbacks[pin] = (edge, callback)
+
+
+def remove_event_detect(pin):
+    with _mutex:
+        _callbacks.pop(pin, None)
+
+
+def cleanup(pin=None):
+    with _mutex:
+        if pin is None:
+            _pins.clear()
+            _callbacks.clear()
+        else:
+            _pins.pop(pin, None)
+            _callbacks.pop(pin, None)
+
+
+def set_input(pin, value):
+    '''Change the level of an input pin, calling its edge detection
+    callback if there is one'''
+
+    value = int(value)
+
+    with _mutex:
+        state = _pins.setdefault(pin, Pin(IN, LOW))
+        previous, state.value = state.value, value
+        edge, callback = _callbacks.get(pin, (None, None))
+
+    if callback is None or previous == value:
+        return
+
+    if (edge == BOTH or
+            (edge == RISING and value) or
+            (edge == FALLING and not value)):
+        LOG.debug('simulated edge on pin %d: %d -> %d', pin, previous, value)
+        callback(pin)
@@ -0,0 +1,382 @@
+'''A simulated picamera.
+
+Recordings run on a thread per splitter port that writes frames at the
+camera's framerate.  H.264 video is a short test pattern encoded once
+with ffmpeg at the requested bitrate and then repeated, so that the
+output can be muxed and played like real camera output.  If ffmpeg
+(with libx264) is not available, frames of the right sizes containing
+filler data are used instead.  Still images and MJPEG frames are JPEGs
+of a test pattern, and YUV frames are a flat image that contains a
+moving block while `motion` is set.'''
+
+import collections
+import datetime
+import io
+import logging
+import re
+import subprocess
+import threading
+import time
+import weakref
+
+LOG = logging.getLogger(__name__)
+
+_cache = {}
+_cache_mutex = threading.Lock()
+_cameras = weakref.WeakSet()
+
+
+def set_motion(value):
+    '''Start or stop simulated motion in the YUV output of every
+    camera'''
+
+    for camera in list(_cameras):
+        camera.motion = bool(value)
+
+
+class PiCameraError(Exception):
+    pass
+
+
+class PiVideoFrameType(object):
+    frame = 0
+    key_frame = 1
+    sps_header = 2
+    motion_data = 3
+
+
+PiVideoFrame = collections.namedtuple('PiVideoFrame', [
+    'index', 'frame_type', 'frame_size', 'video_size', 'split_size',
+    'timestamp', 'complete'])
+
+
+def cached(func):
+    def wrapper(*args):
+        key = (func.__name__,) + args
+        with _cache_mutex:
+            if key not in _cache:
+                _cache[key] = func(*args)
+            return _cache[key]
+
+    return wrapper
+
+
+def split_nals(data):
+    '''Split an annex B H.264 stream into (nal type, nal) tuples'''
+
+    starts = [m.start() for m in re.finditer(b'\x00\x00\x01', data)]
+    begins = [s - 1 if s > 0 and data[s - 1] == 0 else s for s in starts]
+    ends = begins[1:] + [len(data)]
+
+    return [(data[start + 3] & 0x1f, data[begin:end])
+            for start, begin, end in zip(starts, begins, ends)]
+
+
+def group_frames(nals):
+    '''Group NAL units into frames in the same way that picamera
+    reports them: SPS and PPS headers as a separate sps_header frame
+    before each keyframe.'''
+
+    frames = []
+    pending = []
+    has_sps = False
+
+    for nal_type, nal in nals:
+        if nal_type in (1, 5):
+            if has_sps:
+                frames.append((PiVideoFrameType.sps_header,
+                               b''.join(pending)))
+                pending = []
+                has_sps = False
+
+            frame_type = (PiVideoFrameType.key_frame if nal_type == 5
+                          else PiVideoFrameType.frame)
+            frames.append((frame_type, b''.join(pending) + nal))
+            pending = []
+        else:
+            has_sps = has_sps or nal_type == 7
+            pending.append(nal)
+
+    return frames
+
+
+@cached
+def h264_frames(resolution, framerate, bitrate, intra_period):
+    '''Return a list of (frame type, data) tuples covering a whole
+    number of GOPs'''
+
+    width, height = resolution
+    command = [
+        'ffmpeg', '-nostats', '-loglevel', 'error',
+        '-f', 'lavfi',
+        '-i', 'testsrc=size=%dx%d:rate=%d' % (width, height, framerate),
+        '-frames:v', str(intra_period * 2),
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-bf', '0',
+        '-g', str(intra_period), '-b:v', str(bitrate),
+        '-x264-params', 'repeat-headers=1',
+        '-f', 'h264', '-',
+    ]
+
+    try:
+        data = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+        frames = group_frames(split_nals(data))
+        if frames:
+            return frames
+    except (OSError, subprocess.CalledProcessError) as err:
+        LOG.warning('unable to generate h264 with ffmpeg: %s', err)
+
+    return synthetic_h264_frames(framerate, bitrate, intra_period)
+
+
+def synthetic_h264_frames(framerate, bitrate, intra_period):
+    '''Frames with the right structure and sizes but meaningless data'''
+
+    size = max(bitrate // 8 // framerate, 16)
+    header = (b'\x00\x00\x00\x01\x67' + bytes(8) +
+              b'\x00\x00\x00\x01\x68' + bytes(4))
+    keyframe = b'\x00\x00\x00\x01\x65' + bytes(size * 4)
+    frame = b'\x00\x00\x00\x01\x41' + bytes(size)
+
+    frames = [(PiVideoFrameType.sps_header, header),
+              (PiVideoFrameType.key_frame, keyframe)]
+    frames.extend((PiVideoFrameType.frame, frame)
+                  for i in range(intra_period - 1))
+
+    return frames
+
+
+@cached
+def jpeg_image(resolution, quality):
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8' + bytes(resolution[0] * resolution[1] // 10) + \
+            b'\xff\xd9'
+
+    image = Image.linear_gradient('L').resize(resolution).convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='jpeg', quality=quality)
+    return buf.getvalue()
+
+
+class Recording(threading.Thread):
+    '''Write frames from one splitter port to an output'''
+
+    def __init__(self, camera, output, format, resize=None,
+                 splitter_port=1, quality=None, bitrate=None,
+                 intra_period=None, **kwargs):
+        super(Recording, self).__init__(daemon=True)
+
+        self.camera = camera
+        self.format = format
+        self.resolution = tuple(resize if resize else camera.resolution)
+        self.splitter_port = splitter_port
+        self.quality = quality if quality else 85
+        self.bitrate = bitrate if bitrate else 17000000
+        self.intra_period = intra_period if intra_period else 60
+
+        self.output, self.opened = self.open(output)
+        self.frame = None
+        self.next_output = None
+        self.switched = threading.Event()
+        self.flag_stop = False
+
+    def open(self, output):
+        if isinstance(output, str):
+            return open(output, 'wb'), True
+
+        return output, False
+
+    def close_output(self):
+        if hasattr(self.output, 'flush'):
+            self.output.flush()
+        if self.opened:
+            self.output.close()
+
+    def split(self, output):
+        if self.format != 'h264':
+            raise PiCameraError('can only split h264 recordings')
+
+        self.switched.clear()
+        self.next_output = self.open(output)
+        if not self.switched.wait(10):
+            raise PiCameraError('timed out waiting for split')
+
+    def stop(self):
+        self.flag_stop = True
+        self.join()
+        self.close_output()
+
+    def frames(self):
+        if self.format == 'h264':
+            frames = h264_frames(self.resolution,
+                                 int(self.camera.framerate),
+                                 self.bitrate, self.intra_period)
+            while True:
+                yield from frames
+        elif self.format == 'mjpeg':
+            frame = jpeg_image(self.resolution, self.quality)
+            while True:
+                yield PiVideoFrameType.frame, frame
+        elif self.format == 'yuv':
+            while True:
+                yield PiVideoFrameType.frame, self.camera.yuv_frame(
+                    self.resolution)
+        else:
+            raise PiCameraError('unsupported format: %s' % self.format)
+
+    def run(self):
+        interval = 1.0 / float(self.camera.framerate)
+        next_frame = time.monotonic()
+        video_size = split_size = 0
+
+        for index, (frame_type, data) in enumerate(self.frames()):
+            if self.flag_stop:
+                break
+
+            if frame_type != PiVideoFrameType.sps_header:
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_frame = max(next_frame + interval,
+                                 time.monotonic() - interval)
+
+            if (self.next_output is not None and
+                    frame_type == PiVideoFrameType.sps_header):
+                self.close_output()
+                self.output, self.opened = self.next_output
+                self.next_output = None
+                split_size = 0
+                self.switched.set()
+
+            video_size += len(data)
+            split_size += len(data)
+
+            # like picamera's encoders, each recording has its own
+            # frame information
+            self.frame = PiVideoFrame(
+                index=index,
+                frame_type=frame_type,
+                frame_size=len(data),
+                video_size=video_size,
+                split_size=split_size,
+                timestamp=int(time.monotonic() * 1e6),
+                complete=True)
+
+            self.output.write(data)
+
+
+class PiCamera(object):
+    def __init__(self, *args, **kwargs):
+        self.resolution = (1280, 720)
+        self.framerate = 30
+        self.hflip = self.vflip = False
+        self.motion = False
+        self.recordings = {}
+        self.mutex = threading.Lock()
+        self.closed = False
+        _cameras.add(self)
+
+    @property
+    def _encoders(self):
+        return self.recordings
+
+    @property
+    def frame(self):
+        '''The frame information of the first active encoder, which
+        (as with picamera) is not necessarily the one on port 1'''
+
+        for recording in list(self.recordings.values()):
+            return recording.frame
+
+        raise PiCameraError('camera is not recording')
+
+    def start_recording(self, output, format=None, resize=None,
+                        splitter_port=1, **options):
+        format = format if format else 'h264'
+
+        with self.mutex:
+            if splitter_port in self.recordings:
+                raise PiCameraError('port %d is already in use' %
+                                    splitter_port)
+
+            LOG.debug('start %s recording on port %d', format, splitter_port)
+            recording = Recording(self, output, format, resize=resize,
+                                  splitter_port=splitter_port, **options)
+            self.recordings[splitter_port] = recording
+
+        recording.start()
+
+    def split_recording(self, output, splitter_port=1, **options):
+        self.recordings[splitter_port].split(output)
+
+    def stop_recording(self, splitter_port=1):
+        with self.mutex:
+            recording = self.recordings.pop(splitter_port)
+
+        LOG.debug('stop recording on port %d', splitter_port)
+        recording.stop()
+
+    def wait_recording(self, timeout=0, splitter_port=1):
+        time.sleep(timeout)
+
+    def capture(self, output, format=None, use_video_port=False,
+                resize=None, quality=None, **options):
+        resolution = tuple(resize if resize else self.resolution)
+
+        # a still takes about a frame on the video port, and much
+        # longer on the still port
+        time.sleep(1.0 / float(self.framerate) if use_video_port else 0.5)
+        data = jpeg_image(resolution, quality if quality else 85)
+
+        if isinstance(output, str):
+            with open(output, 'wb') as fd:
+                fd.write(data)
+        else:
+            output.write(data)
+            if hasattr(output, 'flush'):
+                output.flush()
+
+    def capture_sequence(self, outputs, format='jpeg', use_video_port=False,
+                         **options):
+        for output in outputs:
+            self.capture(output, format=format,
+                         use_video_port=use_video_port, **options)
+
+    def capture_continuous(self, output, format=None, use_video_port=False,
+                           **options):
+        for counter in range(1, 2 ** 31):
+            if isinstance(output, str):
+                filename = output.format(counter=counter,
+                                         timestamp=datetime.datetime.now())
+                self.capture(filename, format=format,
+                             use_video_port=use_video_port, **options)
+                yield filename
+            else:
+                self.capture(output, format=format,
+                             use_video_port=use_video_port, **options)
+                yield output
+
+    def yuv_frame(self, resolution):
+        '''Return a padded YUV420 frame, with a moving block in the
+        luminance plane if `motion` is set'''
+
+        width, height = resolution
+        fwidth = (width + 31) // 32 * 32
+        fheight = (height + 15) // 16 * 16
+        luma = bytearray(b'\x80' * (fwidth * fheight))
+
+        if self.motion:
+            size = max(width // 8, 1)
+            x = int(time.monotonic() * width / 4) % max(width - size, 1)
+            y = height // 2 - size // 2
+            for row in range(y, y + size):
+                start = row * fwidth + x
+                luma[start:start + size] = b'\xff' * size
+
+        return bytes(luma) + b'\x80' * (fwidth * fheight // 2)
+
+    def close(self):
+        for port in list(self.recordings):
+            self.stop_recording(splitter_port=port)
+        self.closed = True
@@ -0,0 +1,104 @@
+import io
+import logging
+import queue
+import threading
+import time
+
+from kcam.util import Latency
+
+LOG = logging.getLogger(__name__)
+
+
+class StillWriter(threading.Thread):
+    '''Write captured images to disk on a separate thread.
+
+    The camera captures each image into one of a fixed pool of
+    in-memory buffers, and hands it to the writer through a bounded
+    queue.  If every buffer is waiting to be written (because the
+    storage is slow), images are dropped rather than delaying the
+    camera.'''
+
+    default_buffers = 8
+
+    def __init__(self, buffers=None, **kwargs):
+        super(StillWriter, self).__init__(**kwargs)
+
+        buffers = buffers if buffers else self.default_buffers
+        self.free = queue.Queue()
+        for i in range(buffers):
+            self.free.put(io.BytesIO())
+
+        # every queued image holds a buffer, so this only needs room
+        # for one more entry to stop the thread
+        self.pending = queue.Queue(maxsize=buffers + 1)
+
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+        self.capture_latency = Latency()
+        self.write_latency = Latency()
+
+    def stop(self):
+        self.pending.put(None)
+
+    def get_buffer(self):
+        '''Return an empty buffer, or None if none are available'''
+
+        try:
+            buf = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            LOG.warning('no buffer available for image; dropping it')
+            return None
+
+        buf.seek(0)
+        buf.truncate()
+        return buf
+
+    def release(self, buf):
+        self.free.put(buf)
+
+    def put(self, buf, path, latency=None):
+        '''Queue the image in `buf` to be written to `path`.
+        `latency` is the time it took to capture the image.'''
+
+        self.captured += 1
+        if latency is not None:
+            self.capture_latency.add(latency)
+
+        self.pending.put((buf, path, time.monotonic()))
+
+    def run(self):
+        LOG.info('start still writer thread')
+
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+
+            buf, path, queued_at = item
+            try:
+                with open(str(path), 'wb') as fd, buf.getbuffer() as view:
+                    fd.write(view)
+                self.written += 1
+            except OSError as err:
+                LOG.error('failed to write image %s: %s', path, err)
+                self.failures += 1
+            finally:
+                self.release(buf)
+
+            self.write_latency.add(time.monotonic() - queued_at)
+
+        LOG.info('stop still writer thread')
+
+    def stats(self):
+        return dict(
+            captured=self.captured,
+            written=self.written,
+            dropped=self.dropped,
+            failures=self.failures,
+            queued=self.pending.qsize(),
+            capture_latency=self.capture_latency.stats(),
+            write_latency=self.write_latency.stats(),
+        )
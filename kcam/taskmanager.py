@@ -1,42 +1,285 @@
+import collections
+import functools
+import itertools
 import logging
 import multiprocessing
+import os
 import queue
 import signal
 import threading
+import time
 
 from kcam import observer
+from kcam.jobstore import JobStore
 
 LOG = logging.getLogger(__name__)
 
 
-def init_worker():
+# In pool workers, a queue on which we report the start of each task
+_started = None
+
+
+def init_worker(started=None, initializer=None, initargs=(), niceness=None):
+    global _started
+
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
+    # Under the CFQ and BFQ i/o schedulers a process's i/o priority
+    # follows its cpu priority, so this lowers both.
+    if niceness:
+        os.nice(niceness)
+
+    # Each worker leads its own process group, so that a hung task
+    # can be killed along with any processes (ffmpeg, convert) that it
+    # has started.
+    os.setpgid(0, 0)
+    _started = started
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_task(runid, task, args):
+    '''Run a task in a pool worker, first reporting which process is
+    running it'''
+
+    if _started is not None:
+        _started.put((runid, os.getpid(), time.monotonic()))
+
+    return task(*args)
+
 
 class TaskFailure(Exception):
     pass
 
 
+class TaskTimeout(TaskFailure):
+    pass
+
+
+class TaskCancelled(TaskFailure):
+    pass
+
+
+class WorkerLost(TaskFailure):
+    pass
+
+
+class TaskSpec(object):
+    '''A task in the pipeline and the constraints on when it runs.
+
+    A task runs once every task named in `requires` has completed for
+    the same job.  At most `limit` copies of a task run at once, and
+    when more work is ready than there are workers, tasks with a higher
+    `priority` are started first.
+
+    A `sink` task does global work (such as regenerating the event
+    list), so when it is ready for several jobs at once it runs only
+    once.  If the task has a `merge` method, it is called with the list
+    of job arguments and should return the arguments for the combined
+    run; otherwise the most recent arguments are used.  A sink waits
+    until it has been ready for `window` seconds before it starts, so
+    that a burst of jobs is handled by a single run.
+
+    If a task runs for longer than `timeout` seconds, the worker running
+    it is killed along with its children and the task fails.'''
+
+    default_sink_limit = 1
+    default_sink_priority = -10
+
+    def __init__(self, task,
+                 name=None,
+                 requires=None,
+                 limit=None,
+                 priority=None,
+                 sink=False,
+                 timeout=None,
+                 window=None):
+        self.task = task
+        self.timeout = timeout
+        self.window = window if window else 0
+        self.name = name if name else task.__class__.__name__
+        self.requires = tuple(requires) if requires else ()
+        self.sink = sink
+
+        if sink:
+            limit = limit if limit else self.default_sink_limit
+            if priority is None:
+                priority = self.default_sink_priority
+
+        self.limit = limit
+        self.priority = priority if priority is not None else 0
+
+    def merge(self, arglist):
+        if len(arglist) == 1:
+            return arglist[0]
+
+        merge = getattr(self.task, 'merge', None)
+        if merge is None:
+            return arglist[-1]
+
+        return merge(arglist)
+
+    def __str__(self):
+        return self.name
+
+
+class JobState(object):
+    '''Tracks the progress of a job that the task manager is working on'''
+
+    def __init__(self, job, seq):
+        self.job = job
+        self.seq = seq
+        self.running = set()
+        self.ready_since = {}
+        self.error = None
+        self.cancelled = False
+
+    @property
+    def completed(self):
+        return self.job.completed
+
+
+class TaskRun(object):
+    '''A single invocation of a task on behalf of one or more jobs.
+    `pid` and `started` are set once a worker picks up the task, and
+    `finished` once its result has arrived.'''
+
+    def __init__(self, spec, states):
+        self.spec = spec
+        self.states = states
+        self.pid = None
+        self.started = None
+        self.finished = False
+
+    @property
+    def expired(self):
+        return (self.spec.timeout is not None and
+                self.started is not None and
+                time.monotonic() - self.started > self.spec.timeout)
+
+
 class TaskManager(observer.Synchronization, threading.Thread):
-    '''Execute a list of (possibly parallel) tasks'''
+    '''Execute a graph of tasks for each job
+
+    Tasks are described by `TaskSpec`s, which declare which other tasks
+    they depend on.  Several jobs may be in flight at once; whenever a
+    worker is free, the highest priority task that is ready in any job
+    (subject to its concurrency limit) is started.
+
+    Pending work is tracked in a `JobStore`.  If that is backed by a
+    file, jobs that were interrupted by a restart resume without
+    repeating tasks that had already completed.
+
+    The task manager also supervises the pool: tasks that exceed their
+    timeout, or that belong to a cancelled job, are killed, and tasks
+    whose worker has died are recorded as failures rather than waited
+    for forever.  The pool replaces workers that exit.
+
+    While the camera is capturing (see `set_capturing`), or while the
+    load average is above `max_load`, at most `capture_workers` tasks
+    run at once and tasks with a priority below `capture_priority` are
+    held back.  Once the capture is over, concurrency returns to
+    `workers` one step every `ramp_interval` seconds.  Workers run at a
+    reduced cpu priority given by `niceness`.'''
+
+    default_capture_workers = 1
+    default_capture_priority = 0
+    default_ramp_interval = 10
+    default_niceness = 10
 
-    def __init__(self, workers=None, **kwargs):
+    def __init__(self, workers=None, initializer=None, initargs=(),
+                 jobstore=None, max_jobs=None,
+                 capture_workers=None,
+                 capture_priority=None,
+                 ramp_interval=None,
+                 max_load=None,
+                 niceness=None,
+                 **kwargs):
         super(TaskManager, self).__init__(**kwargs)
-        workers = workers if workers else multiprocessing.cpu_count()
+
+        self.workers = workers if workers else multiprocessing.cpu_count()
+        self.max_jobs = max_jobs if max_jobs else self.workers * 2
+        self.capture_workers = (capture_workers if capture_workers is not None
+                                else self.default_capture_workers)
+        self.capture_priority = (capture_priority
+                                 if capture_priority is not None
+                                 else self.default_capture_priority)
+        self.ramp_interval = (ramp_interval if ramp_interval is not None
+                              else self.default_ramp_interval)
+        self.max_load = max_load
+        niceness = niceness if niceness is not None else self.default_niceness
 
         self.tasks = []
-        self.pool = multiprocessing.Pool(processes=workers,
-                                         initializer=init_worker)
-        self.q = queue.Queue()
+        self.started = multiprocessing.Queue()
+        self.pool = multiprocessing.Pool(
+            processes=self.workers,
+            initializer=init_worker,
+            initargs=(self.started, initializer, initargs, niceness))
+        self.jobs = jobstore if jobstore else JobStore()
+        self.active = collections.OrderedDict()
+        self.running = {}
+        self.results = queue.Queue()
+        self.cancelled = set()
+        self.timeouts = 0
+        self.lost = 0
+        self.abandoned = False
+        self.capturing = False
+        self.idle_since = None
+        self.held = 0
+        self.sink_runs = 0
+        self.merged = 0
+        self.next_dispatch = None
+        self.counter = itertools.count()
+        self.wakeup = threading.Event()
         self.flag_stop = False
 
     @observer.synchronized
-    def add_task(self, task):
-        self.tasks.append(task)
+    def add_task(self, task,
+                 name=None,
+                 requires=None,
+                 limit=None,
+                 priority=None,
+                 sink=False,
+                 timeout=None,
+                 window=None):
+        '''Add a task to the graph.
+
+        For compatibility with the old linear pipeline, `task` may be a
+        tuple of tasks, which will run in parallel once every task
+        added before them has completed.'''
+
+        if isinstance(task, tuple):
+            requires = [spec.name for spec in self.tasks]
+            return [self.add_task(t, requires=requires) for t in task]
+
+        spec = TaskSpec(task,
+                        name=name,
+                        requires=requires,
+                        limit=limit,
+                        priority=priority,
+                        sink=sink,
+                        timeout=timeout,
+                        window=window)
+
+        names = set(other.name for other in self.tasks)
+        if spec.name in names:
+            raise ValueError('duplicate task name: %s' % spec.name)
+
+        # Requiring dependencies to be added first also guarantees
+        # that the graph has no cycles.
+        missing = set(spec.requires) - names
+        if missing:
+            raise ValueError('task %s requires unknown tasks: %s' % (
+                spec.name, ', '.join(sorted(missing))))
+
+        self.tasks.append(spec)
+        return spec
 
     @observer.synchronized
     def remove_task(self, task):
-        self.tasks.remove(task)
+        self.tasks = [spec for spec in self.tasks
+                      if spec.task is not task and spec.name != task]
 
     @observer.synchronized
     def clear_tasks(self):
@@ -44,61 +287,400 @@ class TaskManager(observer.Synchronization, threading.Thread):
 
     def stop(self):
         self.flag_stop = True
+        self.wakeup.set()
+
+    @observer.synchronized
+    def cancel(self, key):
+        '''Cancel the job identified by `key`.  Its running tasks are
+        killed, no further tasks are started, and the job is not
+        retried.'''
+
+        self.cancelled.add(str(key))
+        self.wakeup.set()
+
+    @observer.synchronized
+    def set_capturing(self, capturing):
+        '''Tell the task manager whether the camera is capturing, so
+        that post-processing can make way for it'''
+
+        if capturing:
+            LOG.info('capture started, throttling tasks')
+            self.idle_since = None
+        elif self.capturing:
+            LOG.info('capture finished, resuming tasks')
+            self.idle_since = time.monotonic()
+
+        self.capturing = bool(capturing)
+        self.wakeup.set()
+
+    def loadavg(self):
+        try:
+            return os.getloadavg()[0]
+        except OSError:
+            return 0
+
+    @observer.synchronized
+    def capacity(self):
+        '''Return the number of tasks that may run at the moment'''
+
+        if self.capturing:
+            limit = self.capture_workers
+        elif self.idle_since is not None and self.ramp_interval:
+            steps = int((time.monotonic() - self.idle_since) /
+                        self.ramp_interval)
+            limit = self.capture_workers + steps + 1
+            if limit >= self.workers:
+                self.idle_since = None
+        else:
+            limit = self.workers
+
+        if self.max_load and self.loadavg() > self.max_load:
+            limit = min(limit, self.capture_workers)
+
+        return max(0, min(limit, self.workers))
+
+    def is_held(self, spec):
+        '''True if a task must wait for the current capture to finish'''
+        return self.capturing and spec.priority < self.capture_priority
+
+    def wait_for_work(self):
+        timeout = 1
+
+        if len(self.active) < self.max_jobs:
+            next_wakeup = self.jobs.next_wakeup()
+            if next_wakeup is not None:
+                timeout = min(timeout, max(0, next_wakeup - time.time()))
+
+        if self.next_dispatch is not None:
+            timeout = min(timeout,
+                          max(0, self.next_dispatch - time.monotonic()))
+
+        self.wakeup.wait(timeout)
 
     def run(self):
         LOG.info('starting task manager')
+        self.jobs.recover()
 
         while not self.flag_stop:
+            self.wakeup.clear()
+            self.poll()
+            self.admit()
+            self.dispatch()
+            self.wait_for_work()
+
+        LOG.info('waiting for active tasks to complete')
+        while self.running:
+            self.wakeup.clear()
+            self.poll()
+            self.wakeup.wait(1)
+
+        # The pool waits forever for the results of tasks whose worker
+        # we killed, so in that case it has to be terminated.
+        if self.abandoned:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.reap()
+
+        for state in self.active.values():
+            self.jobs.release(state.job)
+
+        LOG.info('stop task manager')
+
+    def poll(self):
+        # Results that have already arrived are reaped before looking
+        # for tasks to kill, so that a task is never killed after it
+        # has finished.  Anything killed is then reaped straight away.
+        self.reap()
+        self.supervise()
+        self.reap()
+
+    def admit(self):
+        '''Start working on new jobs'''
+
+        while len(self.active) < self.max_jobs:
+            job = self.jobs.next_job()
+            if job is None:
+                break
+
+            LOG.info('starting pipeline for %s', job)
+            self.active[job.key] = JobState(job, next(self.counter))
+
+    def is_ready(self, state, spec):
+        return (state.error is None and
+                spec.name not in state.completed and
+                spec.name not in state.running and
+                all(name in state.completed for name in spec.requires))
+
+    def dispatch(self):
+        '''Start every ready task for which there is capacity'''
+
+        with self.mutex:
+            specs = self.tasks[:]
+
+        ready = [(spec, state)
+                 for state in self.active.values()
+                 for spec in specs
+                 if self.is_ready(state, spec)]
+        ready.sort(key=lambda item: (-item[0].priority, item[1].seq))
+
+        now = time.monotonic()
+        for spec, state in ready:
+            state.ready_since.setdefault(spec.name, now)
+
+        busy = collections.Counter(run.spec.name
+                                   for run in self.running.values())
+        started_sinks = set()
+        capacity = self.capacity()
+        self.held = 0
+        self.next_dispatch = None
+
+        for spec, state in ready:
+            if len(self.running) >= capacity:
+                break
+
+            if self.is_held(spec):
+                self.held += 1
+                continue
+
+            if busy[spec.name] >= (spec.limit if spec.limit
+                                   else self.workers):
+                continue
+
+            if spec.sink:
+                if spec.name in started_sinks:
+                    continue
+
+                states = [other for otherspec, other in ready
+                          if otherspec is spec]
+                started_sinks.add(spec.name)
+
+                # wait for the window to pass before starting a sink,
+                # in case more jobs become ready in the meantime
+                start_at = min(other.ready_since[spec.name]
+                               for other in states) + spec.window
+                if start_at > now:
+                    self.next_dispatch = min(self.next_dispatch or start_at,
+                                             start_at)
+                    continue
+
+                self.sink_runs += 1
+                self.merged += len(states) - 1
+            else:
+                states = [state]
+
+            self.launch(spec, states)
+            busy[spec.name] += 1
+
+    def launch(self, spec, states):
+        args = spec.merge([state.job.args for state in states])
+        runid = next(self.counter)
+
+        LOG.debug('starting task %s for %s', spec,
+                  ', '.join(str(state.job) for state in states))
+
+        for state in states:
+            state.running.add(spec.name)
+            state.ready_since.pop(spec.name, None)
+
+        self.running[runid] = TaskRun(spec, states)
+        self.pool.apply_async(
+            run_task, (runid, spec.task, args),
+            callback=functools.partial(self.task_done, runid),
+            error_callback=functools.partial(self.task_error, runid))
+
+    def supervise(self):
+        '''Kill expired or cancelled tasks and notice lost ones'''
+
+        while True:
             try:
-                args = self.q.get(timeout=1)
+                runid, pid, started = self.started.get_nowait()
             except queue.Empty:
+                break
+
+            run = self.running.get(runid)
+            if run is not None and not run.finished:
+                run.pid, run.started = pid, started
+
+        with self.mutex:
+            cancelled = set(self.cancelled)
+
+        # A cancellation is kept until the job has been retired by
+        # reap, so that tasks that have not yet reported a pid are
+        # killed once they start.
+        for key in cancelled:
+            state = self.active.get(key)
+            if state is not None:
+                state.cancelled = True
+                state.error = 'cancelled'
+            else:
+                self.jobs.cancel(key)
+                with self.mutex:
+                    self.cancelled.discard(key)
+
+        for runid, run in list(self.running.items()):
+            # Once a task has finished, its worker may be running
+            # something else (or waiting on the pool's task queue), so
+            # it must not be killed.
+            if run.finished:
                 continue
 
-            with self.mutex:
-                taskiter = iter(self.tasks[:])
+            # a sink run shared with other jobs carries on without the
+            # cancelled ones
+            if not all(state.cancelled for state in run.states):
+                self.detach_cancelled(run)
 
-            while not self.flag_stop:
-                try:
-                    taskspec = next(taskiter)
-                except StopIteration:
-                    break
+            if run.pid is None:
+                continue
 
-                LOG.debug('running taskspec %s', taskspec)
-                if not self.run_parallel_tasks(taskspec, args):
-                    LOG.error('aborting pipeline')
-                    break
+            if all(state.cancelled for state in run.states):
+                self.kill(runid, run, TaskCancelled('cancelled'))
+            elif run.expired:
+                self.timeouts += 1
+                self.kill(runid, run, TaskTimeout(
+                    'timed out after %ds' % run.spec.timeout))
+            elif not self.worker_alive(run.pid):
+                self.lost += 1
+                self.abandon(runid, WorkerLost(
+                    'worker %d exited unexpectedly' % run.pid))
 
-        LOG.info('waiting for active tasks to complete')
-        self.pool.close()
-        self.pool.join()
-        LOG.info('stop task manager')
+    def detach_cancelled(self, run):
+        '''Remove cancelled jobs from a run, so that they can be retired
+        without waiting for it'''
 
-    def run_parallel_tasks(self, tasks, args):
-        '''Run a list of tasks in parallel using apply_async'''
+        for state in run.states:
+            if state.cancelled:
+                state.running.discard(run.spec.name)
 
-        res = [self.pool.apply_async(task, args)
-               for task in tasks]
+        run.states = [state for state in run.states if not state.cancelled]
 
-        has_failures = False
-        resiter = enumerate(res)
-        while not self.flag_stop:
+    def worker_alive(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+
+        return True
+
+    def kill(self, runid, run, err):
+        if run.finished:
+            return
+
+        LOG.error('killing task %s in worker %d: %s', run.spec, run.pid, err)
+        try:
+            os.killpg(run.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        self.abandon(runid, err)
+
+    def abandon(self, runid, err):
+        '''Stop waiting for a task and record it as failed.  If a
+        result turns up later it is ignored.'''
+
+        self.running[runid].pid = None
+        self.abandoned = True
+        self.results.put((runid, None, err))
+
+    def finish_run(self, runid):
+        run = self.running.get(runid)
+        if run is not None:
+            run.finished = True
+            run.pid = None
+
+    def task_done(self, runid, result):
+        self.finish_run(runid)
+        self.results.put((runid, result, None))
+        self.wakeup.set()
+
+    def task_error(self, runid, err):
+        self.finish_run(runid)
+        self.results.put((runid, None, err))
+        self.wakeup.set()
+
+    def reap(self):
+        '''Process finished tasks and retire finished jobs'''
+
+        while True:
             try:
-                i, taskresult = next(resiter)
-            except StopIteration:
+                runid, result, err = self.results.get_nowait()
+            except queue.Empty:
                 break
 
-            try:
-                res = taskresult.get()
-                if not res:
-                    raise TaskFailure(res)
-            except Exception as err:
+            run = self.running.pop(runid, None)
+            if run is None:
+                continue
+
+            if err is None and not result:
+                err = TaskFailure(result)
+
+            if isinstance(err, (TaskTimeout, TaskCancelled, WorkerLost)):
+                LOG.error('task %s execution failed: %s', run.spec, err)
+            elif err is not None:
                 LOG.error('task %s execution failed: %s',
-                          tasks[i], err, exc_info=True)
-                has_failures = True
+                          run.spec, err, exc_info=err)
+
+            for state in run.states:
+                state.running.discard(run.spec.name)
+
+                if err is None:
+                    self.jobs.complete_step(state.job, run.spec.name)
+                else:
+                    state.error = 'task %s failed: %s' % (run.spec, err)
+
+        with self.mutex:
+            names = [spec.name for spec in self.tasks]
+
+        for key, state in list(self.active.items()):
+            if state.running:
+                continue
+
+            if state.cancelled:
+                LOG.info('cancelled pipeline for %s', state.job)
+                self.jobs.cancel(key)
+                with self.mutex:
+                    self.cancelled.discard(key)
+            elif state.error is not None:
+                LOG.error('aborting pipeline for %s', state.job)
+                self.jobs.fail(state.job, state.error)
+            elif all(name in state.completed for name in names):
+                LOG.info('finished pipeline for %s', state.job)
+                self.jobs.finish(state.job)
+            else:
+                continue
+
+            del self.active[key]
+
+    def stats(self):
+        '''Return a summary of the work in progress.  `queued` is the
+        number of tasks that are ready but waiting to start, `merged`
+        the number of jobs whose sink tasks were folded into another
+        run, and `deduplicated` the number of submissions for jobs that
+        were already queued.'''
+
+        jobs = self.jobs.counts()
 
-        return not has_failures
+        return dict(
+            active_jobs=len(self.active),
+            pending_jobs=jobs.get('pending', 0),
+            queued=sum(len(state.ready_since)
+                       for state in list(self.active.values())),
+            running=dict(collections.Counter(
+                run.spec.name for run in list(self.running.values()))),
+            jobs=jobs,
+            sink_runs=self.sink_runs,
+            merged=self.merged,
+            deduplicated=self.jobs.deduplicated,
+            timeouts=self.timeouts,
+            lost=self.lost,
+            capturing=self.capturing,
+            capacity=self.capacity(),
+            held=self.held,
+        )
 
     def update(self, *args):
         '''Queue up new arguments to pass to the task pipeline'''
 
-        self.q.put(args)
+        self.jobs.submit(args)
+        self.wakeup.set()
@@ -1,13 +1,54 @@
+import datetime
 import jinja2
 import logging
-import os
 import subprocess
 from pathlib import Path
 
-from kcam.util import date_from_path
+from kcam.eventindex import EventIndex
+from kcam.thumbnail import Thumbnailer
+from kcam.util import atomic_write
 
 LOG = logging.getLogger(__name__)
 
+TEMPLATES = ['event.html', 'eventlist.html', 'archive.html']
+
+# jinja2 environments, keyed on template directory.  These are created
+# at most once per process (normally by init_templates in each pool
+# worker) rather than every time a task runs.
+_environments = {}
+
+
+def template_environment(templatedir=None, cachedir=None):
+    '''Return the jinja2 environment for `templatedir`, creating it
+    the first time it is requested in this process.  Compiled templates
+    are also stored in a filesystem bytecode cache in `cachedir` (or in
+    a per-user temporary directory), so new worker processes can skip
+    compilation entirely.'''
+
+    env = _environments.get(templatedir)
+
+    if env is None:
+        loaders = []
+        if templatedir:
+            loaders.append(jinja2.FileSystemLoader(templatedir))
+        loaders.append(jinja2.PackageLoader('kcam', 'templates'))
+
+        env = jinja2.Environment(
+            loader=jinja2.ChoiceLoader(loaders),
+            bytecode_cache=jinja2.FileSystemBytecodeCache(cachedir),
+        )
+        _environments[templatedir] = env
+
+    return env
+
+
+def init_templates(templatedir=None, cachedir=None):
+    '''Pool initializer that loads and compiles all the templates'''
+
+    env = template_environment(templatedir, cachedir=cachedir)
+    for name in TEMPLATES:
+        env.get_template(name)
+
 
 def thumbnail_path(path):
     return path.parent / (path.stem + '-thumb' + path.suffix)
@@ -21,6 +62,7 @@ class EncodeVideo(object):
         failures = 0
         for video in path.glob('*.h264'):
             outpath = video.with_suffix('.mp4')
+            existed = outpath.exists()
             try:
                 subprocess.check_call([
                     'ffmpeg', '-f', 'h264', '-i', str(video),
@@ -30,7 +72,7 @@ class EncodeVideo(object):
                 video.unlink()
             except subprocess.CalledProcessError as err:
                 LOG.error('failed to encode file %s: %s', video, err)
-                if outpath.is_file():
+                if not existed and outpath.is_file():
                     outpath.unlink()
                 failures += 1
 
@@ -49,16 +91,18 @@ class GenerateThumbnails(object):
         LOG.info('start generate thumbnail task @ %s', arg['path'])
         path = Path(arg['path'])
 
+        thumbnailer = Thumbnailer(self.res_x, self.res_y)
+
         failures = 0
         for image in path.glob('*.jpg'):
+            if 'thumb' in image.name:
+                continue
+
             thumb = thumbnail_path(image)
             try:
-                subprocess.check_call([
-                    'convert',
-                    str(image),
-                    '-geometry', '{}x{}'.format(self.res_x, self.res_y),
-                    str(thumb)])
-            except subprocess.CalledProcessError as err:
+                thumbnailer.generate(image, thumb)
+            except (subprocess.CalledProcessError, OSError) as err:
+                # OSError covers convert not being installed
                 LOG.error('failed to generate thumbnail for %s: %s',
                           image, err)
                 failures += 1
@@ -67,6 +111,17 @@ class GenerateThumbnails(object):
         return failures == 0
 
 
+class IndexEvent(object):
+    '''Record the media for a single event in the event index'''
+
+    def __call__(self, arg):
+        LOG.info('start index event task @ %s', arg['path'])
+        index = EventIndex(arg['datadir'])
+        index.scan_event(arg['path'], event=arg.get('event'))
+        LOG.info('finished index event task')
+        return True
+
+
 class TemplateProcessor(object):
     def __init__(self, templatedir=None):
         self.templatedir = templatedir
@@ -74,15 +129,9 @@ class TemplateProcessor(object):
     def create_env(self):
         # Doing this in __init__ was causing problems with
         # multiprocessing apparently due to the weakref's
-        # that are used in jinja2.
-        loaders = []
-        if self.templatedir:
-            loaders.append(jinja2.FileSystemLoader(self.templatedir))
-        loaders.append(jinja2.PackageLoader('kcam', 'templates'))
-
-        self.env = jinja2.Environment(
-            loader=jinja2.ChoiceLoader(loaders),
-        )
+        # that are used in jinja2, so we look up the per-process
+        # environment when the task runs.
+        self.env = template_environment(self.templatedir)
 
 
 class UpdateEventHTML(TemplateProcessor):
@@ -101,11 +150,10 @@ class UpdateEventHTML(TemplateProcessor):
 
         return media_info
 
-    def __call__(self, arg):
-        LOG.info('start update event html task @ %s', arg['path'])
-        path = Path(arg['path'])
-        datadir = Path(arg['datadir'])
+    def render(self, path, event, datadir):
+        '''Return the html for the event in `path`'''
 
+        path = Path(path)
         videos = path.glob('*.mp4')
         images = [x for x in path.glob('*.jpg')
                   if 'thumb' not in str(x)]
@@ -116,46 +164,195 @@ class UpdateEventHTML(TemplateProcessor):
         self.create_env()
         self.template = self.env.get_template('event.html')
 
-        with (path / 'index.html').open('w') as fd:
-            fd.write(self.template.render(
-                datadir=arg['datadir'],
-                event=arg['event'],
-                videos=sorted(video_info, key=lambda x: x['stat'].st_mtime),
-                images=sorted(image_info, key=lambda x: x['stat'].st_mtime),
-            ))
+        return self.template.render(
+            datadir=datadir,
+            event=event,
+            videos=sorted(video_info, key=lambda x: x['stat'].st_mtime),
+            images=sorted(image_info, key=lambda x: x['stat'].st_mtime),
+        )
+
+    def __call__(self, arg):
+        LOG.info('start update event html task @ %s', arg['path'])
+        path = Path(arg['path'])
+
+        atomic_write(path / 'index.html',
+                     self.render(path, arg['event'], arg['datadir']))
 
         LOG.info('finished update event html task')
         return True
 
 
 class UpdateEventListHTML(TemplateProcessor):
-    '''Generate the main event listing'''
+    '''Generate the event listing.
 
-    def __call__(self, arg):
-        LOG.info('start update event list html task')
-        datadir = Path(arg['datadir'])
-        events = []
+    The listing is split into shards: a page for each day and for each
+    month, numbered pages of `page_size` events in chronological order
+    (so adding a new event only changes the last one, or the last two
+    when it starts a new page), and a front page
+    showing the most recent events.  When the task argument names one
+    or more events, only the shards containing those events are
+    regenerated; otherwise every shard is.'''
 
-        for root, dirs, files in os.walk(str(datadir)):
-            root = Path(root)
-            relpath = root.relative_to(datadir)
-            LOG.debug('checking %s (%s)', root, relpath)
+    default_page_size = 50
 
-            if len(str(relpath).split('/')) != 4:
-                continue
+    def __init__(self, page_size=None, **kwargs):
+        super(UpdateEventListHTML, self).__init__(**kwargs)
+        self.page_size = page_size if page_size else self.default_page_size
 
-            event = date_from_path(relpath)
-            events.append((event, root))
+    def setup(self, datadir):
+        '''Prepare to render the listing for `datadir`'''
 
         self.create_env()
+        self.datadir = Path(datadir)
+        self.index = EventIndex(self.datadir)
         self.template = self.env.get_template('eventlist.html')
+        self.template_archive = self.env.get_template('archive.html')
+
+    def __call__(self, arg):
+        LOG.info('start update event list html task')
+
+        if 'events' in arg:
+            events = arg['events']
+        elif 'event' in arg:
+            events = [arg['event']]
+        else:
+            events = None
 
-        with (datadir / 'index.html').open('w') as fd:
-            fd.write(self.template.render(
-                datadir=datadir,
-                title='Event list',
-                events=sorted(events),
-            ))
+        self.setup(arg['datadir'])
+
+        if events is None:
+            self.render_all()
+        else:
+            self.render_changed(events)
+
+        self.render_recent()
 
         LOG.info('finished update event list html task')
         return True
+
+    def merge(self, arglist):
+        '''Combine the arguments of several pending runs into one'''
+
+        args = [arg[0] for arg in arglist]
+        events = []
+
+        for arg in args:
+            if 'events' in arg:
+                events.extend(arg['events'])
+            elif 'event' in arg:
+                events.append(arg['event'])
+            else:
+                # one of the runs asked for everything
+                return ({'datadir': arg['datadir']},)
+
+        return ({'datadir': args[-1]['datadir'], 'events': events},)
+
+    def page_count(self):
+        return -(-self.index.count() // self.page_size)
+
+    def page_href(self, page):
+        return '/pages/{}.html'.format(page)
+
+    def render_all(self):
+        for month, count in self.index.months():
+            self.render_month(month)
+
+        for day, count in self.index.days():
+            self.render_day(day)
+
+        self.render_pages(1)
+
+    def render_changed(self, events):
+        days = set(event.replace(hour=0, minute=0, second=0, microsecond=0)
+                   for event in events)
+        months = set(day.replace(day=1) for day in days)
+
+        for month in sorted(months):
+            self.render_month(month)
+
+        for day in sorted(days):
+            self.render_day(day)
+
+        # Pages are numbered from the oldest event, so only the pages
+        # from the first changed one onwards are affected, along with
+        # the page before it: if the events opened a new page, that
+        # page was the last one and has no link to it.
+        first = min(self.index.position(event) for event in events)
+        self.render_pages(max(1, first // self.page_size))
+
+    def html(self, template, context):
+        return template.render(datadir=self.datadir, **context)
+
+    def render(self, path, template, context):
+        LOG.debug('writing %s', path)
+        atomic_write(path, self.html(template, context))
+
+    # Each of the *_page methods returns the template and the context
+    # for one page of the listing, so that pages can be either written
+    # to the data directory or served directly.
+
+    def day_page(self, day):
+        events = self.index.events(start=day,
+                                   end=day + datetime.timedelta(days=1))
+        return self.template, dict(
+            title=day.strftime('Events for %B %d, %Y'),
+            parent=dict(href=day.strftime('/%Y/%m/'),
+                        label=day.strftime('%B %Y')),
+            events=events)
+
+    def month_page(self, month):
+        if month.month == 12:
+            end = month.replace(year=month.year + 1, month=1)
+        else:
+            end = month.replace(month=month.month + 1)
+
+        return self.template_archive, dict(
+            title=month.strftime('Events for %B %Y'),
+            parent=dict(href='/', label='Event list'),
+            days=self.index.days(start=month, end=end))
+
+    def numbered_page(self, page, pages=None):
+        if pages is None:
+            pages = self.page_count()
+
+        events = self.index.events(offset=(page - 1) * self.page_size,
+                                   limit=self.page_size)
+        return self.template, dict(
+            title='Events (page {})'.format(page),
+            parent=dict(href='/', label='Event list'),
+            newer=self.page_href(page + 1) if page < pages else None,
+            older=self.page_href(page - 1) if page > 1 else None,
+            events=events)
+
+    def recent_page(self):
+        events = self.index.events(limit=self.page_size, reverse=True)
+        total = self.index.count()
+
+        older = None
+        if total > self.page_size:
+            older = self.page_href((total - self.page_size - 1) //
+                                   self.page_size + 1)
+
+        return self.template, dict(
+            title='Event list',
+            older=older,
+            months=self.index.months(),
+            events=list(reversed(events)))
+
+    def render_day(self, day):
+        self.render(self.datadir / day.strftime('%Y/%m/%d') / 'index.html',
+                    *self.day_page(day))
+
+    def render_month(self, month):
+        self.render(self.datadir / month.strftime('%Y/%m') / 'index.html',
+                    *self.month_page(month))
+
+    def render_pages(self, first):
+        pages = self.page_count()
+
+        for page in range(first, pages + 1):
+            self.render(self.datadir / 'pages' / '{}.html'.format(page),
+                        *self.numbered_page(page, pages))
+
+    def render_recent(self):
+        self.render(self.datadir / 'index.html', *self.recent_page())
@@ -0,0 +1,61 @@
+import logging
+import subprocess
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+LOG = logging.getLogger(__name__)
+
+
+def convert_thumbnail(src, dest, res_x, res_y):
+    '''Generate a thumbnail using ImageMagick's convert'''
+    subprocess.check_call([
+        'convert',
+        str(src),
+        '-geometry', '{}x{}'.format(res_x, res_y),
+        str(dest)])
+
+
+class Thumbnailer(object):
+
+    '''Generate thumbnails in-process using Pillow.
+
+    JPEG images are opened in draft mode, which lets the decoder scale
+    the image by 1/2, 1/4 or 1/8 while decoding the DCT coefficients,
+    so a full resolution frame is never decoded or held in memory.  If
+    Pillow is not available or cannot handle an image we fall back to
+    running ImageMagick's convert.  A single Thumbnailer is meant to
+    be used for all the images in an event.'''
+
+    default_quality = 75
+
+    def __init__(self, res_x, res_y, quality=None, use_pil=True):
+        self.res_x = res_x
+        self.res_y = res_y
+        self.quality = quality if quality else self.default_quality
+        self.use_pil = use_pil and Image is not None
+
+        if use_pil and Image is None:
+            LOG.info('Pillow is not available; using convert '
+                     'to generate thumbnails')
+
+    def generate(self, src, dest):
+        if self.use_pil:
+            try:
+                return self.generate_pil(src, dest)
+            except (OSError, ValueError) as err:
+                LOG.warning('failed to generate thumbnail for %s '
+                            'in-process (%s); falling back to convert',
+                            src, err)
+
+        convert_thumbnail(src, dest, self.res_x, self.res_y)
+
+    def generate_pil(self, src, dest):
+        size = (self.res_x, self.res_y)
+
+        with Image.open(str(src)) as img:
+            img.draft('RGB', size)
+            img.thumbnail(size)
+            img.save(str(dest), 'JPEG', quality=self.quality)
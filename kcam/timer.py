@@ -1,3 +1,5 @@
+import heapq
+import itertools
 import threading
 import time
 import logging
@@ -65,3 +67,154 @@ class DynamicTimer(threading.Thread):
                                  time.localtime(self.expires_at))
 
         return '<DynamicTimer %s>' % (when,)
+
+
+class TimerHandle(object):
+
+    '''A cancellable timer scheduled on a `TimerService`.  Like
+    `DynamicTimer`, the interval can be extended while the timer is
+    pending, but never beyond `limit` seconds from when it started.'''
+
+    def __init__(self, service, interval, function, limit=None):
+        now = time.monotonic()
+
+        self.service = service
+        self.function = function
+        self.interval = interval
+        self.limit = limit
+        self.started_at = now
+        self.expires_at = now + interval
+        self.expires_limit = now + limit if limit else None
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def deadline(self):
+        if self.expires_limit is None:
+            return self.expires_at
+
+        return min(self.expires_at, self.expires_limit)
+
+    def is_alive(self):
+        return not (self.cancelled or self.fired)
+
+    def extend(self, extra):
+        if not self.is_alive():
+            raise ValueError('attempt to update idle timer')
+
+        # The service re-checks the deadline when the original entry
+        # comes due, so extending does not need to touch the heap.
+        self.expires_at = max(self.expires_at,
+                              time.monotonic() + extra)
+        LOG.debug('extended timer %s', self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    # for compatibility with DynamicTimer
+    stop = cancel
+
+    def __str__(self):
+        if not self.is_alive():
+            when = 'idle'
+        else:
+            when = 'in %.1fs' % (self.deadline - time.monotonic())
+
+        return '<TimerHandle %s>' % (when,)
+
+
+class TimerService(threading.Thread):
+
+    '''Run many timers from a single thread.
+
+    Pending timers are kept in a heap ordered by deadline.  Timer
+    functions are called on the service thread, so they should be
+    quick; they may schedule new timers.'''
+
+    def __init__(self, **kwargs):
+        super(TimerService, self).__init__(daemon=True, **kwargs)
+        self.heap = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.flag_stop = False
+
+    def schedule(self, interval, function, limit=None):
+        handle = TimerHandle(self, interval, function, limit=limit)
+        self.push(handle)
+        LOG.debug('scheduled timer %s', handle)
+        return handle
+
+    def push(self, handle):
+        with self.cond:
+            heapq.heappush(self.heap,
+                           (handle.deadline, next(self.counter), handle))
+            if self.heap[0][2] is handle:
+                self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.flag_stop = True
+            self.cond.notify()
+
+    def pending(self):
+        with self.cond:
+            return sum(1 for entry in self.heap if entry[2].is_alive())
+
+    def run(self):
+        LOG.info('starting timer service')
+
+        while True:
+            with self.cond:
+                while not self.flag_stop:
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+
+                    sleeptime = self.heap[0][0] - time.monotonic()
+                    if sleeptime <= 0:
+                        break
+
+                    self.cond.wait(sleeptime)
+
+                if self.flag_stop:
+                    break
+
+                _, _, handle = heapq.heappop(self.heap)
+
+                if handle.cancelled:
+                    continue
+
+                if handle.deadline > time.monotonic():
+                    heapq.heappush(self.heap,
+                                   (handle.deadline, next(self.counter),
+                                    handle))
+                    continue
+
+                handle.fired = True
+
+            # Call outside the lock so the function can schedule new
+            # timers.
+            LOG.debug('timer %s expired', handle)
+            try:
+                handle.function()
+            except Exception:
+                LOG.exception('timer function %s failed', handle.function)
+
+        LOG.info('stopping timer service')
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def default_service():
+    '''Return the shared `TimerService`, starting it if necessary.'''
+
+    global _default_service
+
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = TimerService(name='timer-service')
+            _default_service.start()
+
+        return _default_service
@@ -1,4 +1,8 @@
 import datetime
+import os
+import tempfile
+
+from pathlib import Path
 
 
 def date_from_path(path):
@@ -11,3 +15,41 @@ def date_from_path(path):
         year=year, month=month, day=day,
         hour=hour, minute=minute, second=second
     )
+
+
+def atomic_write(path, content):
+    '''Replace the contents of `path` with `content` so that readers
+    never see a partially written file.'''
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, tmppath = tempfile.mkstemp(dir=str(path.parent),
+                                   prefix='.' + path.name,
+                                   suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        os.chmod(tmppath, 0o644)
+        os.replace(tmppath, str(path))
+    except BaseException:
+        os.unlink(tmppath)
+        raise
+
+
+class Latency(object):
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.last = value
+        self.max = max(self.max, value)
+        self.total += value
+
+    def stats(self):
+        return dict(last=self.last, max=self.max,
+                    avg=self.total / self.count if self.count else 0)
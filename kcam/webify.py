@@ -2,22 +2,18 @@ import datetime
 import jinja2
 import logging
 import multiprocessing
-import os
 import subprocess
 
 from pathlib import Path
 
+from kcam.eventindex import EventIndex
+from kcam.thumbnail import Thumbnailer
+
 LOG = logging.getLogger(__name__)
 
 
 def generate_thumbnail(src, dest, res_x=375, res_y=500):
-    out = subprocess.check_output([
-        'convert',
-        str(src),
-        '-geometry', '{}x{}'.format(res_x, res_y),
-        str(dest)])
-
-    out
+    Thumbnailer(res_x, res_y).generate(src, dest)
 
 
 def date_from_path(path):
@@ -67,16 +63,11 @@ class Webify(multiprocessing.Process):
             ))
 
     def discover_events(self):
-        events = []
-        for root, dirs, files in os.walk(str(self.datadir)):
-            root = Path(root).relative_to(self.datadir)
-            if len(str(root).split('/')) != 4:
-                continue
+        index = EventIndex(self.datadir)
+        index.backfill()
 
-            event = date_from_path(root)
-            events.append((event, root))
-
-        return events
+        return [(event, path.relative_to(self.datadir))
+                for event, path in index.events()]
 
     def get_media_info(self, media):
         media_info = []
@@ -97,13 +88,15 @@ class Webify(multiprocessing.Process):
             img['thumb_fspath'] = thumb
             img['thumb'] = thumb.relative_to(self.datadir)
 
-    def generate_thumbnails(self, image_info):
+    def generate_thumbnails(self, image_info, res_x=375, res_y=500):
+        thumbnailer = Thumbnailer(res_x, res_y)
+
         for img in image_info:
             if img['thumb_fspath'].is_file():
                 continue
 
             try:
-                generate_thumbnail(img['fspath'], img['thumb_fspath'])
+                thumbnailer.generate(img['fspath'], img['thumb_fspath'])
             except subprocess.CalledProcessError:
                 LOG.warning('failed to create thumbnail for %s',
                             img['fspath'])
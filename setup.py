@@ -11,6 +11,8 @@ setup(
         'console_scripts': [
             'kcam = kcam.main:main',
             'kcam-update-html = kcam.main:update_html',
+            'kcam-rebuild-index = kcam.main:rebuild_index',
+            'kcam-gendata = kcam.cmd.gendata:main',
             'kcam-tempd = kcam.cmd.tempd:main',
             'kcam-test-keypad = kcam.cmd.test_keypad:main',
             'kcam-test-buzzer = kcam.cmd.test_buzzer:main',
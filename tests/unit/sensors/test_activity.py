@@ -4,6 +4,7 @@ import unittest.mock
 
 from kcam.sensors import activity
 from kcam import observer
+from kcam import timer
 
 
 class FakeSensor(observer.Observable):
@@ -64,3 +65,24 @@ class TestActivity (unittest.TestCase):
         assert r1 and r2
         expected = [unittest.mock.call(True), unittest.mock.call(False)]
         assert self.observer.update.call_args_list == expected
+
+
+class TestActivityTimer (unittest.TestCase):
+
+    def setUp(self):
+        self.service = timer.TimerService()
+        self.service.start()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_continue_after_fired(self):
+        a = activity.ActivitySensor(interval=5, timers=self.service)
+        a.update(True)
+
+        # the timer service marks the timer as fired before it calls
+        # end_active
+        a.timer.fired = True
+        a.update(True)
+
+        assert a.active == activity.STATE_ACTIVE
@@ -0,0 +1,72 @@
+import unittest
+import unittest.mock
+
+import numpy
+
+from kcam.sensors import motion
+
+
+class TestVideoMotionSensor (unittest.TestCase):
+
+    def setUp(self):
+        # 100x100 frames are padded to 128x112
+        self.sensor = self.create_sensor()
+        self.observer = unittest.mock.MagicMock()
+        self.sensor.add_observer(self.observer)
+
+    def create_sensor(self, **kwargs):
+        sensor = motion.VideoMotionSensor(res_x=100, res_y=100, **kwargs)
+        # process every frame
+        sensor.interval = 0
+        return sensor
+
+    def frame(self, value=0, area=None):
+        frame = numpy.zeros((112, 128), dtype=numpy.uint8)
+        if area is not None:
+            frame[area] = value
+
+        # append the chrominance planes
+        return frame.tobytes() + bytes(128 * 112 // 2)
+
+    def test_parse_zones(self):
+        assert motion.parse_zones('0,0,1,0.5; 0.5,0.5,1,1;') == [
+            (0, 0, 1, 0.5), (0.5, 0.5, 1, 1)]
+
+        with self.assertRaises(ValueError):
+            motion.parse_zones('0,0,1')
+
+    def test_motion(self):
+        self.sensor.write(self.frame())
+        self.sensor.write(self.frame(200, (slice(0, 20), slice(0, 20))))
+        self.observer.update.assert_called_once_with(1)
+
+        # the change has not yet become part of the background
+        self.sensor.write(self.frame())
+        self.observer.update.assert_called_with(0)
+        assert self.sensor.stats()['processed'] == 3
+
+    def test_small_change(self):
+        self.sensor.write(self.frame())
+        self.sensor.write(self.frame(200, (slice(0, 5), slice(0, 1))))
+        self.observer.update.assert_not_called()
+
+    def test_zones(self):
+        sensor = self.create_sensor(zones=[(0.5, 0.5, 1, 1)])
+        sensor.add_observer(self.observer)
+
+        sensor.write(self.frame())
+        sensor.write(self.frame(200, (slice(0, 20), slice(0, 20))))
+        self.observer.update.assert_not_called()
+
+        sensor.write(self.frame(200, (slice(60, 80), slice(60, 80))))
+        self.observer.update.assert_called_once_with(1)
+
+    def test_frame_skipping(self):
+        sensor = motion.VideoMotionSensor(res_x=100, res_y=100, fps=1)
+
+        for i in range(10):
+            sensor.write(self.frame())
+
+        stats = sensor.stats()
+        assert stats['processed'] == 1
+        assert stats['skipped'] == 9
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import api
+from kcam.eventindex import EventIndex
+from kcam.gendata import DataGenerator
+
+
+class TestEventAPI (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        DataGenerator(self.datadir, interval=3600, images=2, videos=1,
+                      image_size=100, video_size=100).generate(25)
+        self.api = api.EventAPI(EventIndex(self.datadir))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fetch(self, parts, **query):
+        return self.api.route(parts, query)()
+
+    def test_pagination(self):
+        seen = []
+        cursor = None
+        while True:
+            query = dict(limit='10')
+            if cursor is not None:
+                query['cursor'] = cursor
+            res = self.fetch(['events'], **query)
+            seen.extend(event['id'] for event in res['events'])
+            cursor = res['next']
+            if cursor is None:
+                break
+
+        assert len(seen) == 25
+        assert seen == sorted(seen, reverse=True)
+
+        res = self.fetch(['events'], order='asc', limit='25')
+        assert [event['id'] for event in res['events']] == seen[::-1]
+        assert res['next'] is None
+
+    def test_event(self):
+        summary = self.fetch(['events'], limit='1')['events'][0]
+        assert summary['cover'].endswith('-thumb.jpg')
+
+        res = self.fetch(['events'] + summary['id'].split('/'))
+        assert res['id'] == summary['id']
+        assert [item['kind'] for item in res['media']].count('image') == 2
+        for item in res['media']:
+            assert item['url'].startswith(summary['url'])
+            if item['kind'] == 'image':
+                assert item['thumb'].endswith('-thumb.jpg')
+
+        with self.assertRaises(api.NotFound):
+            self.fetch(['events', '1999', '01', '01', '00:00:00'])
+
+    def test_days(self):
+        res = self.fetch(['days'])
+        assert sum(day['count'] for day in res['days']) == 25
+
+    def test_bad_request(self):
+        for query in [dict(limit='0'), dict(limit='x'),
+                      dict(cursor='not a cursor'), dict(order='up'),
+                      dict(start='yesterday')]:
+            with self.assertRaises(api.BadRequest):
+                self.fetch(['events'], **query)
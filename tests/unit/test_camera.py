@@ -0,0 +1,88 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from pathlib import Path
+
+with unittest.mock.patch.dict(os.environ, KCAM_HARDWARE='sim'):
+    from kcam import camera
+
+
+class TestCamera (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        self.camera = camera.Camera(res_x=64, res_y=48,
+                                    datadir=str(self.datadir),
+                                    stream_mp4=False)
+
+    def tearDown(self):
+        if self.camera.is_alive():
+            self.camera.stop()
+            self.camera.join()
+
+        self.camera.camera.close()
+        self.tmpdir.cleanup()
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.05)
+
+        return False
+
+    def test_discard_images(self):
+        # when the still writer has no free buffers, images are thrown
+        # away rather than accumulating in memory
+        with unittest.mock.patch.object(self.camera.stills, 'get_buffer',
+                                        return_value=None):
+            outputs = self.camera.image_outputs(self.datadir / 'img.jpg')
+            output = next(outputs)
+            outputs.close()
+
+        assert output is self.camera.discard
+        assert output.write(b'x' * 1000) == 1000
+        assert not hasattr(output, 'getvalue')
+
+    def test_capture(self):
+        captures = []
+        finished = threading.Event()
+
+        def capture_finished(arg):
+            captures.append(arg)
+            finished.set()
+
+        self.camera.add_observer(unittest.mock.Mock(update=capture_finished))
+        self.camera.start()
+
+        # give the pre-event buffer time to see a keyframe
+        time.sleep(1)
+        self.camera.update(1)
+        assert self.wait_for(lambda: self.camera.capturing.value)
+        time.sleep(0.5)
+
+        self.camera.update(0)
+        assert finished.wait(10)
+        assert not self.camera.recording
+
+        # the recording was split to the event's video file and back
+        # to the pre-event buffer
+        event = captures[0]['path']
+        video = next(event.glob('*.h264'))
+        assert video.read_bytes()[:4] == b'\x00\x00\x00\x01'
+        assert self.wait_for(lambda: self.camera.stream.stats()['frames'])
+
+        # stills were taken on their own thread
+        assert self.wait_for(lambda: list(event.glob('img-*.jpg')))
+
+        stats = self.camera.stats()
+        assert stats['start_latency']['max'] < 5
+        assert self.camera.start_latency.count == 1
+        assert self.camera.stop_latency.count == 1
+        assert captures[0]['duration'] > 0
@@ -0,0 +1,75 @@
+import datetime
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import eventindex
+
+
+class TestEventIndex (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        self.index = eventindex.EventIndex(self.datadir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_event(self, when, images=2, videos=1):
+        path = self.datadir / when.strftime('%Y/%m/%d/%H:%M:%S')
+        path.mkdir(parents=True)
+
+        for i in range(images):
+            (path / ('img-%d.jpg' % i)).write_bytes(b'x' * 10)
+            (path / ('img-%d-thumb.jpg' % i)).write_bytes(b'x')
+        for i in range(videos):
+            (path / ('vid-%d.mp4' % i)).write_bytes(b'x' * 100)
+
+        return path
+
+    def test_add_event(self):
+        when = datetime.datetime(2017, 1, 2, 3, 4, 5)
+        path = self.create_event(when)
+        self.index.add_event(path, when, duration=12.5)
+
+        assert self.index.events() == [(when, path)]
+
+    def test_scan_event(self):
+        when = datetime.datetime(2017, 1, 2, 3, 4, 5)
+        path = self.create_event(when, images=3, videos=2)
+        self.index.scan_event(path)
+
+        with self.index.connection() as conn:
+            images, videos, size = conn.execute(
+                'SELECT images, videos, size FROM events').fetchone()
+
+        assert (images, videos, size) == (3, 2, 233)
+
+    def test_rebuild(self):
+        events = [datetime.datetime(2017, 1, 2, 3, 4, 5),
+                  datetime.datetime(2016, 12, 31, 23, 59, 59),
+                  datetime.datetime(2017, 2, 1, 0, 0, 0)]
+        for when in events:
+            self.create_event(when)
+
+        stale = datetime.datetime(2015, 1, 1)
+        self.index.add_event('2015/01/01/00:00:00', stale)
+
+        assert self.index.rebuild() == 3
+        assert [e[0] for e in self.index.events()] == sorted(events)
+
+    def test_backfill(self):
+        events = [datetime.datetime(2017, 1, 2, 3, 4, 5),
+                  datetime.datetime(2017, 2, 1, 0, 0, 0)]
+        paths = [self.create_event(when) for when in events]
+
+        # the camera adds the events it captures to a new index
+        self.index.add_event(paths[-1], events[-1])
+        assert not self.index.is_complete()
+
+        assert self.index.backfill() == 2
+        assert [e[0] for e in self.index.events()] == events
+        assert self.index.is_complete()
+        assert self.index.backfill() is None
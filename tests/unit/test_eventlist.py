@@ -0,0 +1,84 @@
+import datetime
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam.eventindex import EventIndex
+from kcam.tasks import UpdateEventListHTML
+
+
+class TestUpdateEventListHTML (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        self.index = EventIndex(self.datadir)
+        self.start = datetime.datetime(2017, 1, 30, 12)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add_event(self, n):
+        event = self.start + datetime.timedelta(days=n)
+        path = self.datadir / event.strftime('%Y/%m/%d/%H:%M:%S')
+        path.mkdir(parents=True)
+        self.index.add_event(path, event)
+        return event
+
+    def update(self, **arg):
+        arg['datadir'] = str(self.datadir)
+        UpdateEventListHTML(page_size=2)(arg)
+
+    def page(self, *parts):
+        return self.datadir.joinpath(*parts).read_text()
+
+    def test_render_all(self):
+        for n in range(5):
+            self.add_event(n)
+        self.update()
+
+        assert sorted(p.name for p in (self.datadir / 'pages').iterdir()) == [
+            '1.html', '2.html', '3.html']
+        assert 'Events for January 2017' in self.page('2017', '01',
+                                                      'index.html')
+        assert 'Events for February 03, 2017' in self.page(
+            '2017', '02', '03', 'index.html')
+
+        page = self.page('pages', '2.html')
+        assert '/pages/1.html' in page and '/pages/3.html' in page
+        assert '/pages/2.html' in self.page('index.html')
+
+    def test_new_page(self):
+        for n in range(4):
+            self.add_event(n)
+        self.update()
+        assert '/pages/3.html' not in self.page('pages', '2.html')
+
+        self.update(event=self.add_event(4))
+        assert '/pages/3.html' in self.page('pages', '2.html')
+        assert '/pages/2.html' in self.page('pages', '3.html')
+
+    def test_render_changed(self):
+        for n in range(4):
+            self.add_event(n)
+        self.update()
+
+        for path in self.datadir.glob('**/*.html'):
+            path.unlink()
+
+        self.update(event=self.add_event(4))
+        rendered = sorted(str(path.relative_to(self.datadir))
+                          for path in self.datadir.glob('**/*.html'))
+        assert rendered == ['2017/02/03/index.html', '2017/02/index.html',
+                            'index.html', 'pages/2.html', 'pages/3.html']
+
+    def test_merge(self):
+        task = UpdateEventListHTML()
+        datadir = str(self.datadir)
+        assert task.merge([({'datadir': datadir, 'event': 1},),
+                           ({'datadir': datadir, 'events': [2, 3]},)]) == (
+            {'datadir': datadir, 'events': [1, 2, 3]},)
+        assert task.merge([({'datadir': datadir, 'event': 1},),
+                           ({'datadir': datadir},)]) == (
+            {'datadir': datadir},)
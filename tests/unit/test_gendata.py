@@ -0,0 +1,67 @@
+import datetime
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam.cmd.gendata import GenerateDataApplication
+from kcam.eventindex import EventIndex
+from kcam.gendata import DataGenerator
+
+
+class TestDataGenerator (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def listing(self, datadir):
+        return sorted((str(path.relative_to(datadir)),
+                       path.stat().st_size)
+                      for path in datadir.rglob('*')
+                      if path.is_file() and not path.name.startswith('.'))
+
+    def test_generate(self):
+        gen = DataGenerator(self.datadir, images=3, videos=1, h264=1,
+                            start=datetime.datetime(2020, 1, 1))
+        assert gen.generate(10) == 10
+
+        index = EventIndex(self.datadir)
+        assert index.count() == 10
+
+        event, path = index.events(limit=1)[0]
+        assert event == datetime.datetime(2020, 1, 1)
+        names = sorted(p.name for p in path.iterdir())
+        assert names == [
+            'img-00:00:00-1-thumb.jpg', 'img-00:00:00-1.jpg',
+            'img-00:00:00-2-thumb.jpg', 'img-00:00:00-2.jpg',
+            'img-00:00:00-3-thumb.jpg', 'img-00:00:00-3.jpg',
+            'vid-00:00:00.h264', 'vid-00:00:00.mp4',
+        ]
+        assert (path / 'img-00:00:00-1.jpg').stat().st_mtime == \
+            event.timestamp() + 1
+
+    def test_deterministic(self):
+        with tempfile.TemporaryDirectory() as other:
+            DataGenerator(self.datadir, seed=1, index=False).generate(5)
+            DataGenerator(other, seed=1, index=False).generate(5)
+
+            assert self.listing(self.datadir) == self.listing(Path(other))
+
+    def test_real_images(self):
+        gen = DataGenerator(self.datadir, images=1, videos=0,
+                            thumbnails=False, media='real', index=False)
+        gen.generate(1)
+
+        image = next(self.datadir.rglob('*.jpg'))
+        assert image.read_bytes().startswith(b'\xff\xd8')
+
+    def test_command(self):
+        # runs without KCAM_HARDWARE=sim or RPi.GPIO
+        GenerateDataApplication().run(['--config', '/dev/null',
+                                       '--datadir', str(self.datadir),
+                                       '--events', '3'])
+        assert EventIndex(self.datadir).count() == 3
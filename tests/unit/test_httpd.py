@@ -0,0 +1,150 @@
+import http.client
+import json
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import httpd
+from kcam.gendata import DataGenerator
+
+
+class TestParseRange (unittest.TestCase):
+
+    def test_ranges(self):
+        assert httpd.parse_range('bytes=0-9', 100) == (0, 10)
+        assert httpd.parse_range('bytes=90-', 100) == (90, 10)
+        assert httpd.parse_range('bytes=-10', 100) == (90, 10)
+        assert httpd.parse_range('bytes=50-500', 100) == (50, 50)
+        assert httpd.parse_range('bytes=0-1,5-6', 100) is None
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(httpd.HTTPError):
+            httpd.parse_range('bytes=100-', 100)
+
+
+class TestPageCache (unittest.TestCase):
+
+    def test_lru(self):
+        cache = httpd.PageCache(size=2)
+        cache.put('a', 1, 'page a')
+        cache.put('b', 1, 'page b')
+        assert cache.get('a', 1) == 'page a'
+
+        cache.put('c', 1, 'page c')
+        assert cache.get('b', 1) is None
+        assert cache.get('a', 1) == 'page a'
+        assert cache.get('a', 2) is None
+
+
+class TestHTTPServer (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        DataGenerator(self.datadir, images=1, videos=1, thumbnails=False,
+                      image_size=100, video_size=1000).generate(3)
+        self.event = sorted(self.datadir.glob('*/*/*/*/'))[0]
+        self.video = next(self.event.glob('*.mp4'))
+        self.video.write_bytes(bytes(range(256)) * 4)
+
+        self.server = httpd.HTTPServer(self.datadir, address='127.0.0.1',
+                                       port=0)
+        self.server.start()
+        self.server.ready.wait(5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join()
+        self.tmpdir.cleanup()
+
+    def request(self, path, method='GET', headers=None):
+        conn = http.client.HTTPConnection(*self.server.server_address,
+                                          timeout=5)
+        conn.request(method, path, headers=headers if headers else {})
+        res = conn.getresponse()
+        body = res.read()
+        conn.close()
+        return res, body
+
+    def url(self, path):
+        return '/' + str(path.relative_to(self.datadir)) + '/'
+
+    def test_pages(self):
+        res, body = self.request('/')
+        assert res.status == 200
+        assert b'Event list' in body
+
+        res, body = self.request(self.url(self.event))
+        assert res.status == 200
+        assert b'vid-00%3A00%3A00.mp4' in body
+
+        res, body = self.request('/2020/01/')
+        assert res.status == 200
+
+        res, body = self.request('/pages/9.html')
+        assert res.status == 404
+
+    def test_page_etag(self):
+        res, body = self.request('/')
+        etag = res.getheader('ETag')
+
+        res, body = self.request('/', headers={'If-None-Match': etag})
+        assert res.status == 304
+        assert body == b''
+        assert self.server.pages.cache.hits == 1
+
+    def test_media(self):
+        path = '/' + str(self.video.relative_to(self.datadir))
+        res, body = self.request(path)
+        assert res.status == 200
+        assert res.getheader('Content-Type') == 'video/mp4'
+        assert body == self.video.read_bytes()
+
+        res, body = self.request(path, headers={
+            'If-None-Match': res.getheader('ETag')})
+        assert res.status == 304
+
+        res, body = self.request(path, method='HEAD')
+        assert res.status == 200
+        assert res.getheader('Content-Length') == '1024'
+
+    def test_range(self):
+        path = '/' + str(self.video.relative_to(self.datadir))
+        res, body = self.request(path, headers={'Range': 'bytes=256-511'})
+        assert res.status == 206
+        assert res.getheader('Content-Range') == 'bytes 256-511/1024'
+        assert body == bytes(range(256))
+
+        res, body = self.request(path, headers={'Range': 'bytes=2000-'})
+        assert res.status == 416
+
+    def test_not_found(self):
+        for path in ['/nonexistent.jpg', '/.kcam-index.sqlite',
+                     '/../../etc/passwd', '/2020/01/01/23:59:59/']:
+            res, body = self.request(path)
+            assert res.status == 404, path
+
+    def test_keepalive(self):
+        conn = http.client.HTTPConnection(*self.server.server_address,
+                                          timeout=5)
+        for i in range(3):
+            conn.request('GET', '/')
+            res = conn.getresponse()
+            res.read()
+            assert res.status == 200
+
+        conn.close()
+        assert self.server.requests == 3
+
+    def test_api(self):
+        res, body = self.request('/api/events?limit=2')
+        assert res.status == 200
+        assert res.getheader('Content-Type') == 'application/json'
+        assert len(json.loads(body.decode())['events']) == 2
+
+        res, body = self.request('/api/events?limit=1000')
+        assert res.status == 400
+
+        res, body = self.request('/api/nothing')
+        assert res.status == 404
@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import jobstore
+
+
+class TestJobStore (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'jobs.sqlite'
+        self.jobs = jobstore.JobStore(self.path, backoff=60)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_submit(self):
+        self.jobs.submit(({'path': 'a'},))
+        job = self.jobs.next_job()
+
+        assert job.key == 'a'
+        assert job.args == ({'path': 'a'},)
+        assert self.jobs.next_job() is None
+
+    def test_deduplicate(self):
+        assert self.jobs.submit(({'path': 'a', 'n': 1},))
+        assert not self.jobs.submit(({'path': 'a', 'n': 2},))
+
+        job = self.jobs.next_job()
+        assert job.args[0]['n'] == 2
+        assert self.jobs.next_job() is None
+        assert self.jobs.counts() == {'running': 1}
+
+    def test_resubmit_while_running(self):
+        self.jobs.submit(({'path': 'a'},))
+        job = self.jobs.next_job()
+        self.jobs.complete_step(job, '0')
+        self.jobs.submit(({'path': 'a'},))
+        self.jobs.finish(job)
+
+        job = self.jobs.next_job()
+        assert job is not None
+        assert job.completed == set()
+
+    def test_resume(self):
+        self.jobs.submit(({'path': 'a'},))
+        job = self.jobs.next_job()
+        self.jobs.complete_step(job, '0')
+
+        jobs = jobstore.JobStore(self.path)
+        jobs.recover()
+        job = jobs.next_job()
+
+        assert job.key == 'a'
+        assert job.completed == {'0'}
+
+    def test_fail(self):
+        self.jobs.submit(({'path': 'a'},))
+        job = self.jobs.next_job()
+        self.jobs.fail(job, 'oops')
+
+        assert self.jobs.next_job() is None
+        assert self.jobs.counts() == {'pending': 1}
+        assert self.jobs.next_wakeup() > 0
+
+    def test_cancel(self):
+        self.jobs.submit(({'path': 'a'},))
+        self.jobs.submit(({'path': 'b'},))
+        job = self.jobs.next_job()
+
+        assert self.jobs.cancel('a')
+        assert self.jobs.cancel('b')
+        assert not self.jobs.cancel('c')
+        assert self.jobs.next_job() is None
+
+        self.jobs.recover()
+        assert self.jobs.next_job() is None
+        assert self.jobs.counts() == {'cancelled': 2}
+
+        # a new submission runs again
+        self.jobs.submit(({'path': 'a'},))
+        assert self.jobs.next_job().key == job.key
@@ -0,0 +1,83 @@
+import threading
+import unittest
+import unittest.mock
+import urllib.error
+import urllib.request
+
+from kcam import live
+
+
+class TestFrameBroadcaster (unittest.TestCase):
+
+    def test_frames(self):
+        b = live.FrameBroadcaster()
+        b.write(b'\xff\xd8one')
+        b.write(b'-more')
+        assert b.wait_for_frame(timeout=0) == (0, None)
+
+        b.write(b'\xff\xd8two')
+        seq, frame = b.wait_for_frame(timeout=0)
+        assert frame == b'\xff\xd8one-more'
+
+        assert b.wait_for_frame(seq, timeout=0) == (seq, None)
+
+    def test_close(self):
+        b = live.FrameBroadcaster()
+        t = threading.Timer(0.1, b.close)
+        t.start()
+        assert b.wait_for_frame(timeout=5) == (0, None)
+
+
+class TestLiveView (unittest.TestCase):
+
+    def setUp(self):
+        self.camera = unittest.mock.MagicMock()
+        self.live = live.LiveView(self.camera, address='127.0.0.1', port=0,
+                                  max_clients=1, frame_timeout=1)
+        self.live.start()
+        self.url = 'http://127.0.0.1:%d' % self.live.server.server_address[1]
+
+    def tearDown(self):
+        self.live.stop()
+        self.live.join()
+
+    def publish(self):
+        self.live.broadcaster.publish(b'\xff\xd8frame')
+
+    def test_snapshot(self):
+        t = threading.Timer(0.2, self.publish)
+        t.start()
+
+        with urllib.request.urlopen(self.url + '/snapshot.jpg') as fd:
+            assert fd.read() == b'\xff\xd8frame'
+
+        t.join()
+        assert self.camera.start_recording.call_count == 1
+        assert self.camera.stop_recording.call_count == 1
+        assert self.live.clients == 0
+
+    def test_no_frame(self):
+        with self.assertRaises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(self.url + '/snapshot.jpg')
+
+        assert err.exception.code == 503
+
+    def test_start_failure(self):
+        self.camera.start_recording.side_effect = [
+            RuntimeError('port busy'), None]
+
+        with self.assertRaises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(self.url + '/snapshot.jpg')
+
+        assert err.exception.code == 503
+        assert self.live.clients == 0
+
+        # the next client starts the stream again
+        t = threading.Timer(0.2, self.publish)
+        t.start()
+
+        with urllib.request.urlopen(self.url + '/snapshot.jpg') as fd:
+            assert fd.read() == b'\xff\xd8frame'
+
+        t.join()
+        assert self.camera.start_recording.call_count == 2
@@ -0,0 +1,195 @@
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+
+from kcam import metrics
+
+
+class StubClient(object):
+    '''Record the batches written by a MetricWriter or MetricReplay'''
+
+    def __init__(self):
+        self.offline = False
+        self.fail = False
+        self.batches = []
+        self.written = threading.Event()
+
+    def ensure_database(self):
+        pass
+
+    def write_points(self, points, **kwargs):
+        if self.fail:
+            raise IOError('server unavailable')
+
+        self.batches.append(list(points))
+        self.written.set()
+
+
+def point(value):
+    return dict(measurement='test', tags={}, time=1000 + value,
+                fields={'value': value})
+
+
+class TestMetricWriter (unittest.TestCase):
+
+    def setUp(self):
+        self.client = StubClient()
+
+    def tearDown(self):
+        if hasattr(self, 'writer') and self.writer.is_alive():
+            self.writer.stop()
+            self.writer.join()
+
+    def start_writer(self, **kwargs):
+        self.writer = metrics.MetricWriter(self.client, **kwargs)
+        self.writer.start()
+        return self.writer
+
+    def test_ring_buffer(self):
+        writer = metrics.MetricWriter(self.client, buffer_size=3)
+        for i in range(5):
+            writer.put(point(i))
+
+        assert [p['fields']['value'] for p in writer.buffer] == [2, 3, 4]
+        assert writer.stats()['dropped'] == 2
+        assert writer.stats()['queue_depth'] == 3
+
+    def test_batch_flush(self):
+        writer = self.start_writer(batch_size=3, flush_interval=60)
+        for i in range(3):
+            writer.put(point(i))
+
+        assert self.client.written.wait(5)
+        assert self.client.batches == [[point(0), point(1), point(2)]]
+
+    def test_interval_flush(self):
+        writer = self.start_writer(batch_size=100, flush_interval=0.2)
+        writer.put(point(0))
+
+        t0 = time.monotonic()
+        assert self.client.written.wait(5)
+        assert time.monotonic() - t0 < 2
+        assert self.client.batches == [[point(0)]]
+
+    def test_stop_drains_buffer(self):
+        writer = self.start_writer(batch_size=2, flush_interval=60)
+        for i in range(5):
+            writer.put(point(i))
+
+        writer.stop()
+        writer.join(5)
+
+        assert sum(self.client.batches, []) == [point(i) for i in range(5)]
+        assert writer.stats()['written'] == 5
+
+    def test_requeue_on_failure(self):
+        writer = metrics.MetricWriter(self.client, buffer_size=4)
+        writer.put(point(3))
+        writer.put(point(4))
+
+        self.client.fail = True
+        batch = [point(0), point(1), point(2)]
+        assert not writer.flush(batch)
+        writer.requeue(batch)
+
+        # the failed batch goes back in front of newer points, losing
+        # the oldest points that do not fit
+        assert [p['fields']['value'] for p in writer.buffer] == [1, 2, 3, 4]
+
+        stats = writer.stats()
+        assert stats['flush_failures'] == 1
+        assert stats['dropped'] == 1
+        assert stats['written'] == 0
+
+    def test_stats(self):
+        writer = metrics.MetricWriter(self.client)
+        assert writer.flush([point(0), point(1)])
+
+        stats = writer.stats()
+        assert stats['written'] == 2
+        assert stats['flushes'] == 1
+        assert stats['spooled'] == 0
+        assert stats['flush_latency_max'] >= stats['flush_latency_last']
+
+
+class TestMetricSpool (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'spool' / 'metrics.spool'
+        self.spool = metrics.MetricSpool(self.path)
+        self.client = StubClient()
+
+    def tearDown(self):
+        self.spool.close()
+        self.tmpdir.cleanup()
+
+    def values(self):
+        return [int(line.split('value=')[1].split('i')[0])
+                for batch in self.client.batches for line in batch]
+
+    def test_spool_on_failure(self):
+        writer = metrics.MetricWriter(self.client, spool=self.spool)
+
+        self.client.fail = True
+        assert writer.flush([point(0), point(1)])
+        assert self.client.offline
+        assert not writer.buffer
+
+        # while offline, batches go straight to the spool
+        self.client.fail = False
+        assert writer.flush([point(2)])
+        assert not self.client.batches
+
+        records, offset = self.spool.read(10)
+        assert len(records) == 3
+        assert writer.stats()['spooled'] == offset
+
+    def test_replay_order(self):
+        for i in range(5):
+            self.spool.append([point(i)])
+
+        replay = metrics.MetricReplay(self.client, self.spool, batch_size=2)
+        while replay.replay():
+            pass
+
+        assert [len(batch) for batch in self.client.batches] == [2, 2, 1]
+        assert self.values() == [0, 1, 2, 3, 4]
+        assert replay.replayed == 5
+
+    def test_commit_after_write(self):
+        self.spool.append([point(0), point(1)])
+        size = self.spool.pending()
+
+        self.client.fail = True
+        replay = metrics.MetricReplay(self.client, self.spool)
+        assert not replay.replay()
+        assert self.client.offline
+        assert self.spool.size() == size
+        assert self.spool.pending() == size
+
+        self.client.fail = False
+        assert replay.replay()
+        assert not self.client.offline
+        assert self.values() == [0, 1]
+
+        # the drained spool is truncated
+        assert self.spool.size() == 0
+        assert self.spool.pending() == 0
+
+    def test_resume_offset(self):
+        for i in range(3):
+            self.spool.append([point(i)])
+
+        metrics.MetricReplay(self.client, self.spool, batch_size=2).replay()
+        self.spool.close()
+
+        # records that were replayed before a restart are not sent again
+        spool = metrics.MetricSpool(self.path)
+        metrics.MetricReplay(self.client, spool).replay()
+        spool.close()
+
+        assert self.values() == [0, 1, 2]
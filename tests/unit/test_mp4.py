@@ -0,0 +1,71 @@
+import struct
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import mp4
+
+
+def box(kind, *payload):
+    data = b''.join(payload)
+    return struct.pack('>I4s', len(data) + 8, kind) + data
+
+
+def full_box(kind, flags, *payload):
+    return box(kind, struct.pack('>I', flags), *payload)
+
+
+def mvhd(timescale, duration):
+    return full_box(b'mvhd', 0, bytes(8),
+                    struct.pack('>II', timescale, duration), bytes(80))
+
+
+def mdhd(timescale, duration):
+    return full_box(b'mdhd', 0, bytes(8),
+                    struct.pack('>II', timescale, duration), bytes(4))
+
+
+def moov(duration, trex_default=None):
+    trak = box(b'trak', box(b'mdia', mdhd(90000, duration)))
+    boxes = [mvhd(1000, duration * 1000 // 90000), trak]
+    if trex_default is not None:
+        boxes.append(box(b'mvex', full_box(
+            b'trex', 0, struct.pack('>IIIII', 1, 1, trex_default, 0, 0))))
+    return box(b'moov', *boxes)
+
+
+def moof(durations):
+    trun = full_box(b'trun', mp4.SAMPLE_DURATION_PRESENT | 0x200,
+                    struct.pack('>I', len(durations)),
+                    *[struct.pack('>II', d, 100) for d in durations])
+    tfhd = full_box(b'tfhd', 0, struct.pack('>I', 1))
+    return box(b'moof', box(b'traf', tfhd, trun))
+
+
+class TestDuration (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'video.mp4'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_movie_header(self):
+        self.path.write_bytes(box(b'ftyp', b'isom') + moov(90000 * 12) +
+                              box(b'mdat', bytes(100)))
+        assert mp4.duration(self.path) == 12
+
+    def test_fragmented(self):
+        self.path.write_bytes(
+            box(b'ftyp', b'isom') + moov(0, trex_default=3000) +
+            moof([3000] * 30) + box(b'mdat', bytes(100)) +
+            moof([3000] * 15) + box(b'mdat', bytes(100)))
+        assert mp4.duration(self.path) == 1.5
+
+    def test_invalid(self):
+        self.path.write_bytes(b'not an mp4 file')
+        assert mp4.duration(self.path) is None
+
+        assert mp4.duration(self.path.with_name('missing.mp4')) is None
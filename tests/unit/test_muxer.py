@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import muxer
+
+
+class TestStreamingMuxer (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'vid.mp4'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_missing_ffmpeg(self):
+        with muxer.StreamingMuxer(self.path,
+                                  ffmpeg='/nonexistent/ffmpeg') as fd:
+            fd.write(b'frame1')
+            fd.write(b'frame2')
+
+        assert self.path.with_suffix('.h264').read_bytes() == b'frame1frame2'
+        assert fd.bytes_written == 12
+
+    def test_ffmpeg_exits(self):
+        # `true` exits without reading its input, so writes eventually
+        # fail and the rest of the stream goes to a separate fallback
+        # file, starting at the next SPS header
+        gop = b'\x00\x00\x00\x01\x27sps' + b'x' * 65536
+        with muxer.StreamingMuxer(self.path, ffmpeg='true') as fd:
+            for i in range(64):
+                fd.write(gop[:10])
+                fd.write(memoryview(gop)[10:])
+
+        fallback = self.path.with_name('vid-continued.h264')
+        assert fd.fallback is not None
+        assert not self.path.with_suffix('.h264').exists()
+        assert fallback.read_bytes().startswith(b'\x00\x00\x00\x01\x27')
+        assert len(fallback.read_bytes()) % len(gop) == 0
+        assert fd.bytes_written == 64 * len(gop)
+
+    def test_find_sps(self):
+        assert muxer.find_sps(b'xx\x00\x00\x00\x01\x27sps') == 2
+        assert muxer.find_sps(b'\x00\x00\x01\x25\x00\x00\x01\x67') == 4
+        assert muxer.find_sps(b'\x00\x00\x01\x25idr') is None
+        assert muxer.find_sps(b'xx\x00\x00\x01') is None
@@ -1,3 +1,5 @@
+import functools
+import threading
 import unittest
 
 from kcam import observer
@@ -47,3 +49,70 @@ class TestObserver (unittest.TestCase):
 
         assert f.update_called
         assert f.update_called_with is self
+
+    def test_queued_dispatch(self):
+        done = threading.Event()
+        received = []
+
+        def callback(arg):
+            received.append(arg)
+            if arg == 2:
+                done.set()
+
+        obs = observer.Observable()
+        obs.add_observer(None, callback,
+                         dispatcher=observer.QueuedDispatcher)
+        obs.notify_observers(1)
+        obs.notify_observers(2)
+
+        assert done.wait(5)
+        assert received == [1, 2]
+        assert obs.observer_stats()[callback]['delivered'] == 2
+
+    def test_queued_dispatch_drop(self):
+        release = threading.Event()
+        received = []
+
+        def callback(arg):
+            release.wait(5)
+            received.append(arg)
+
+        obs = observer.Observable()
+        obs.add_observer(None, callback,
+                         dispatcher=functools.partial(
+                             observer.QueuedDispatcher,
+                             maxsize=1, policy='drop_new'))
+
+        # the first notification may already be in the worker, so
+        # send enough to guarantee that the queue overflows.
+        for i in range(4):
+            obs.notify_observers(i)
+
+        stats = obs.observer_stats()[callback]
+        release.set()
+
+        assert stats['dropped'] >= 2
+
+    def test_queued_dispatch_coalesce(self):
+        release = threading.Event()
+        done = threading.Event()
+        received = []
+
+        def callback(arg):
+            release.wait(5)
+            received.append(arg)
+            if arg == 9:
+                done.set()
+
+        obs = observer.Observable()
+        obs.add_observer(None, callback,
+                         dispatcher=functools.partial(
+                             observer.QueuedDispatcher, policy='coalesce'))
+
+        for i in range(10):
+            obs.notify_observers(i)
+
+        release.set()
+        assert done.wait(5)
+        assert received[-1] == 9
+        assert len(received) < 10
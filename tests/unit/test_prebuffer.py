@@ -0,0 +1,84 @@
+import io
+import time
+import types
+import unittest
+
+from kcam import prebuffer
+
+
+class FakeCamera(object):
+    def __init__(self):
+        self.video = types.SimpleNamespace(frame_type=prebuffer.FRAME,
+                                           complete=True)
+
+        # The motion sensor's encoder comes first, so PiCamera.frame
+        # would describe its frames rather than the video's.
+        motion = types.SimpleNamespace(frame_type=prebuffer.FRAME,
+                                       complete=True)
+        self._encoders = {2: types.SimpleNamespace(frame=motion),
+                          1: types.SimpleNamespace(frame=self.video)}
+        self.frame = motion
+
+
+class TestPreEventBuffer (unittest.TestCase):
+
+    def setUp(self):
+        self.camera = FakeCamera()
+        self.buf = prebuffer.PreEventBuffer(self.camera, seconds=10,
+                                            max_bytes=100)
+
+    def write_frame(self, data, frame_type=prebuffer.FRAME):
+        self.camera.video.frame_type = frame_type
+        self.buf.write(data)
+
+    def write_gop(self, name, frames=2):
+        self.write_frame(b'S' + name, prebuffer.SPS_HEADER)
+        self.write_frame(b'K' + name, prebuffer.KEY_FRAME)
+        for i in range(frames):
+            self.write_frame(b'P' + name)
+
+    def test_starts_at_keyframe(self):
+        self.write_frame(b'Pxx')
+        self.write_gop(b'1')
+
+        out = io.BytesIO()
+        self.buf.copy_to(out)
+        assert out.getvalue() == b'S1K1P1P1'
+        assert self.buf.stats()['used'] == 0
+
+    def test_wraps(self):
+        for name in b'abcdefghijklmnopqrstuvwxyz':
+            self.write_gop(bytes([name]), frames=4)
+
+        stats = self.buf.stats()
+        assert stats['used'] <= 100
+        assert stats['frames'] == stats['used'] // 2
+
+        out = io.BytesIO()
+        self.buf.copy_to(out)
+        data = out.getvalue()
+        assert data.startswith(b'S')
+        assert data.endswith(b'SzKzPzPzPzPz')
+
+    def test_lead_window(self):
+        self.write_gop(b'1')
+        for frame in self.buf.frames:
+            frame.timestamp -= 20
+        self.write_gop(b'2')
+
+        out = io.BytesIO()
+        self.buf.copy_to(out)
+        assert out.getvalue() == b'S2K2P2P2'
+
+    def test_oversized_frame(self):
+        self.write_gop(b'1')
+        self.camera.video.complete = False
+        for i in range(20):
+            self.buf.write(b'x' * 10)
+
+        assert self.buf.stats()['dropped'] == 1
+
+    def test_seconds_buffered(self):
+        self.write_gop(b'1')
+        time.sleep(0.01)
+        assert self.buf.stats()['seconds'] > 0
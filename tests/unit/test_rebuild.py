@@ -0,0 +1,58 @@
+import io
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam.gendata import DataGenerator
+from kcam.rebuild import Rebuild
+
+
+class TestRebuild (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        DataGenerator(self.datadir, images=2, image_size=10,
+                      video_size=10).generate(20)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def rebuild(self, **kwargs):
+        return Rebuild(self.datadir, jobs=2, stream=io.StringIO(),
+                       **kwargs).run()
+
+    def test_rebuild(self):
+        progress = self.rebuild()
+        assert (progress.rendered, progress.unchanged) == (20, 0)
+        assert (self.datadir / 'index.html').is_file()
+        assert len(list(self.datadir.glob('*/*/*/*/index.html'))) == 20
+
+    def test_unchanged(self):
+        self.rebuild()
+        (self.datadir / 'index.html').unlink()
+
+        progress = self.rebuild()
+        assert (progress.rendered, progress.unchanged) == (0, 20)
+
+        # the event list is still rendered if it is missing
+        assert (self.datadir / 'index.html').is_file()
+
+    def test_changed(self):
+        self.rebuild()
+
+        events = sorted(self.datadir.glob('*/*/*/*/'))
+        image = next(events[0].glob('*.jpg'))
+        os.utime(str(image), (0, 0))
+        (events[1] / 'index.html').unlink()
+
+        progress = self.rebuild()
+        assert (progress.rendered, progress.unchanged) == (2, 18)
+
+    def test_force(self):
+        self.rebuild()
+
+        progress = self.rebuild(force=True)
+        assert (progress.rendered, progress.unchanged) == (20, 0)
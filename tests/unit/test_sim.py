@@ -0,0 +1,94 @@
+import io
+import time
+import unittest
+
+from kcam import prebuffer
+from kcam import sim
+from kcam.sim import evdev
+from kcam.sim import gpio
+from kcam.sim import picamera
+
+
+class TestSimGPIO (unittest.TestCase):
+
+    def tearDown(self):
+        gpio.cleanup()
+
+    def test_edge_callback(self):
+        edges = []
+        gpio.setup(4, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+        gpio.add_event_detect(4, gpio.RISING, callback=edges.append)
+
+        gpio.set_input(4, 1)
+        gpio.set_input(4, 1)
+        gpio.set_input(4, 0)
+
+        assert edges == [4]
+        assert gpio.input(4) == 0
+
+
+class TestSimEvdev (unittest.TestCase):
+
+    def test_type_keys(self):
+        evdev.type_keys('12\n')
+        device = evdev.InputDevice(evdev.list_devices()[0])
+        events = device.read_loop()
+
+        keys = [evdev.categorize(next(events)) for i in range(6)]
+        assert [k.keycode for k in keys if k.keystate == 1] == [
+            'KEY_KP1', 'KEY_KP2', 'KEY_KPENTER']
+
+
+class TestSimPiCamera (unittest.TestCase):
+
+    def test_synthetic_frames(self):
+        frames = picamera.synthetic_h264_frames(30, 1000000, 30)
+        data = b''.join(frame for frame_type, frame in frames)
+
+        assert picamera.group_frames(picamera.split_nals(data)) == frames
+
+    def test_recording(self):
+        camera = picamera.PiCamera()
+        camera.framerate = 100
+        buf = io.BytesIO()
+
+        camera.start_recording(buf, format='mjpeg', resize=(64, 48))
+        time.sleep(0.2)
+        assert camera.frame is not None
+        camera.stop_recording()
+
+        assert buf.getvalue().startswith(b'\xff\xd8')
+
+    def test_prebuffer_port(self):
+        camera = picamera.PiCamera()
+        camera.resolution = (64, 48)
+        camera.framerate = 100
+
+        # the motion sensor starts recording before the camera thread
+        camera.start_recording(io.BytesIO(), format='yuv', splitter_port=2)
+        buf = prebuffer.PreEventBuffer(camera, seconds=10)
+        camera.start_recording(buf, format='h264', intra_period=5)
+        time.sleep(0.5)
+
+        out = io.BytesIO()
+        buf.copy_to(out)
+        camera.stop_recording()
+        camera.stop_recording(splitter_port=2)
+
+        # output starts at an SPS header
+        data = out.getvalue()
+        assert data[:4] == b'\x00\x00\x00\x01'
+        assert data[4] & 0x1f == 7
+
+
+class TestScript (unittest.TestCase):
+
+    def test_parse(self):
+        script = sim.Script(['# comment', '', '1 gpio 4 1',
+                             '0.5 keys 1234\\n'])
+        assert script.steps == [(1.0, 'gpio', ['4', '1']),
+                                (0.5, 'keys', ['1234\\n'])]
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            sim.Script(['1 explode'])
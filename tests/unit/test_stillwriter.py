@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from kcam import stillwriter
+
+
+class TestStillWriter (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+        self.writer = stillwriter.StillWriter(buffers=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write(self):
+        self.writer.start()
+
+        for i in range(5):
+            buf = self.writer.get_buffer()
+            if buf is None:
+                continue
+
+            buf.write(b'image %d' % i)
+            self.writer.put(buf, self.path / ('img-%d.jpg' % i), latency=0.1)
+
+        self.writer.stop()
+        self.writer.join()
+
+        stats = self.writer.stats()
+        assert stats['captured'] + stats['dropped'] == 5
+        assert stats['written'] == stats['captured']
+        assert (self.path / 'img-0.jpg').read_bytes() == b'image 0'
+        assert stats['capture_latency']['max'] == 0.1
+
+    def test_drop(self):
+        # without a writer running, buffers are never returned
+        assert self.writer.get_buffer() is not None
+        assert self.writer.get_buffer() is not None
+        assert self.writer.get_buffer() is None
+        assert self.writer.stats()['dropped'] == 1
+
+    def test_reuse(self):
+        self.writer.start()
+
+        buf = self.writer.get_buffer()
+        buf.write(b'a longer image')
+        self.writer.put(buf, self.path / 'a.jpg')
+        self.writer.stop()
+        self.writer.join()
+
+        # buffers are emptied when they are reused
+        while True:
+            reused = self.writer.get_buffer()
+            if reused is buf:
+                break
+
+        assert reused.getvalue() == b''
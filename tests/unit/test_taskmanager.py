@@ -0,0 +1,281 @@
+import subprocess
+import tempfile
+import time
+import unittest
+
+from pathlib import Path
+
+from kcam import taskmanager
+
+
+class RecordTask(object):
+    '''Record when the task ran by creating a file'''
+
+    def __init__(self, name, result=True):
+        self.name = name
+        self.result = result
+
+    def __call__(self, arg):
+        path = Path(arg['path'])
+        time.sleep(0.1)
+        (path / self.name).write_text('%f' % time.time())
+        return self.result
+
+
+class HangTask(object):
+    '''Start a child process that never exits, and wait for it'''
+
+    def __call__(self, arg):
+        pidfile = Path(arg['path']) / 'child.pid'
+        child = subprocess.Popen(['sleep', '60'])
+        pidfile.write_text('%d' % child.pid)
+        child.wait()
+        return True
+
+
+class SinkTask(object):
+    def __call__(self, arg):
+        with (Path(arg['datadir']) / 'sink').open('a') as fd:
+            fd.write('%d\n' % len(arg.get('paths', [arg.get('path')])))
+        return True
+
+    def merge(self, arglist):
+        return ({'datadir': arglist[0][0]['datadir'],
+                 'paths': [arg[0]['path'] for arg in arglist]},)
+
+
+class SlowSinkTask(SinkTask):
+    def __call__(self, arg):
+        time.sleep(3)
+        return super(SlowSinkTask, self).__call__(arg)
+
+
+class TestTaskManager (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.datadir = Path(self.tmpdir.name)
+        self.tm = taskmanager.TaskManager(workers=2)
+
+    def tearDown(self):
+        if self.tm.is_alive():
+            self.tm.stop()
+            self.tm.join()
+        else:
+            self.tm.pool.terminate()
+
+        self.tmpdir.cleanup()
+
+    def wait_for_jobs(self, count, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            counts = self.tm.jobs.counts()
+            if counts.get('done', 0) + counts.get('failed', 0) >= count:
+                return counts
+            time.sleep(0.1)
+
+        return self.tm.jobs.counts()
+
+    def wait_for_exit(self, pid, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with open('/proc/%d/stat' % pid) as fd:
+                    # a zombie has exited but not yet been reaped
+                    if fd.read().split(')')[-1].split()[0] == 'Z':
+                        return True
+            except FileNotFoundError:
+                return True
+            time.sleep(0.1)
+
+        return False
+
+    def submit(self, name):
+        path = self.datadir / name
+        path.mkdir()
+        self.tm.update({'datadir': str(self.datadir), 'path': str(path)})
+        return path
+
+    def ran_at(self, path, name):
+        return float((path / name).read_text())
+
+    def test_dependencies(self):
+        self.tm.add_task(RecordTask('a'), name='a')
+        self.tm.add_task(RecordTask('b'), name='b')
+        self.tm.add_task(RecordTask('c'), name='c', requires=['a', 'b'])
+        self.tm.start()
+
+        path = self.submit('event')
+
+        assert self.wait_for_jobs(1) == {'done': 1}
+        assert self.ran_at(path, 'c') > self.ran_at(path, 'a')
+        assert self.ran_at(path, 'c') > self.ran_at(path, 'b')
+
+    def test_failure(self):
+        self.tm.add_task(RecordTask('a', result=False), name='a')
+        self.tm.add_task(RecordTask('b'), name='b', requires=['a'])
+        self.tm.start()
+
+        path = self.submit('event')
+        time.sleep(1)
+
+        assert (path / 'a').exists()
+        assert not (path / 'b').exists()
+        assert self.tm.jobs.counts() == {'pending': 1}
+
+    def test_unknown_requirement(self):
+        with self.assertRaises(ValueError):
+            self.tm.add_task(RecordTask('a'), requires=['missing'])
+
+    def test_sink(self):
+        self.tm.add_task(RecordTask('a'), name='a', limit=2)
+        self.tm.add_task(SinkTask(), name='sink', requires=['a'],
+                         sink=True)
+
+        for i in range(4):
+            self.submit('event-%d' % i)
+
+        self.tm.start()
+
+        assert self.wait_for_jobs(4) == {'done': 4}
+        runs = [int(x) for x in
+                (self.datadir / 'sink').read_text().split()]
+        assert sum(runs) == 4
+        assert len(runs) < 4
+
+    def test_sink_window(self):
+        self.tm.add_task(RecordTask('a'), name='a', limit=2)
+        self.tm.add_task(SinkTask(), name='sink', requires=['a'],
+                         sink=True, window=1)
+        self.tm.start()
+
+        for i in range(3):
+            self.submit('event-%d' % i)
+            time.sleep(0.2)
+
+        assert self.wait_for_jobs(3) == {'done': 3}
+        assert (self.datadir / 'sink').read_text().split() == ['3']
+
+        stats = self.tm.stats()
+        assert stats['sink_runs'] == 1
+        assert stats['merged'] == 2
+
+    def test_timeout(self):
+        self.tm.add_task(HangTask(), name='hang', timeout=1)
+        self.tm.start()
+
+        path = self.submit('event')
+        deadline = time.time() + 10
+        while time.time() < deadline and not self.tm.stats()['timeouts']:
+            time.sleep(0.1)
+
+        assert self.tm.stats()['timeouts'] == 1
+        assert self.tm.jobs.counts() == {'pending': 1}
+
+        # the task's child process should have been killed too
+        child = int((path / 'child.pid').read_text())
+        assert self.wait_for_exit(child)
+
+    def test_cancel_before_start(self):
+        self.tm.add_task(RecordTask('0'))
+        path = self.submit('event')
+        self.tm.cancel(path)
+        self.tm.start()
+
+        deadline = time.time() + 5
+        while (time.time() < deadline and
+               'cancelled' not in self.tm.jobs.counts()):
+            time.sleep(0.1)
+
+        assert self.tm.jobs.counts() == {'cancelled': 1}
+        assert not (path / '0').exists()
+        assert not self.tm.cancelled
+
+    def test_cancel_running(self):
+        self.tm.add_task(HangTask(), name='hang')
+        self.tm.start()
+
+        path = self.submit('event')
+        deadline = time.time() + 10
+        while time.time() < deadline and not (path / 'child.pid').exists():
+            time.sleep(0.1)
+
+        self.tm.cancel(path)
+        while (time.time() < deadline and
+               'cancelled' not in self.tm.jobs.counts()):
+            time.sleep(0.1)
+
+        # the job is not retried
+        assert self.tm.jobs.counts() == {'cancelled': 1}
+        child = int((path / 'child.pid').read_text())
+        assert self.wait_for_exit(child)
+
+    def test_cancel_sink(self):
+        self.tm.add_task(SlowSinkTask(), name='sink', sink=True)
+        paths = [self.submit('event-%d' % i) for i in range(3)]
+        self.tm.start()
+
+        deadline = time.time() + 10
+        while time.time() < deadline and not any(
+                run.pid for run in list(self.tm.running.values())):
+            time.sleep(0.1)
+
+        # the other jobs sharing the run are not affected
+        self.tm.cancel(paths[0])
+        assert self.wait_for_jobs(2) == {'done': 2, 'cancelled': 1}
+        assert (self.datadir / 'sink').read_text().split() == ['3']
+
+    def test_finished_run_not_killed(self):
+        child = subprocess.Popen(['sleep', '60'], start_new_session=True)
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+
+        spec = self.tm.add_task(RecordTask('a'), name='a', timeout=1)
+        self.submit('event')
+        self.tm.admit()
+        state = list(self.tm.active.values())[0]
+
+        run = taskmanager.TaskRun(spec, [state])
+        run.pid, run.started = child.pid, time.monotonic() - 10
+        self.tm.running[0] = run
+
+        # the worker reported a result, but it has not been reaped yet
+        self.tm.task_done(0, True)
+        self.tm.cancel(state.job.key)
+        self.tm.supervise()
+
+        assert run.pid is None
+        with self.assertRaises(subprocess.TimeoutExpired):
+            child.wait(1)
+        assert self.tm.stats()['timeouts'] == 0
+
+    def test_capacity(self):
+        self.tm.workers = 4
+        self.tm.ramp_interval = 1
+        self.tm.set_capturing(True)
+        assert self.tm.capacity() == 1
+
+        self.tm.set_capturing(False)
+        assert self.tm.capacity() == 2
+        self.tm.idle_since -= 1
+        assert self.tm.capacity() == 3
+        self.tm.idle_since -= 10
+        assert self.tm.capacity() == 4
+        assert self.tm.idle_since is None
+
+    def test_capturing(self):
+        self.tm.add_task(RecordTask('a'), name='a')
+        self.tm.add_task(RecordTask('b'), name='b', requires=['a'],
+                         priority=-1)
+        self.tm.set_capturing(True)
+        self.tm.start()
+
+        path = self.submit('event')
+        time.sleep(1)
+
+        assert (path / 'a').exists()
+        assert not (path / 'b').exists()
+        assert self.tm.stats()['held'] == 1
+
+        self.tm.set_capturing(False)
+        assert self.wait_for_jobs(1) == {'done': 1}
@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+import unittest.mock
+
+from pathlib import Path
+
+from kcam import tasks
+
+
+class TestTemplateEnvironment (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+
+        # start each test without any cached environments
+        patcher = unittest.mock.patch.dict(tasks._environments, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_environment_cached(self):
+        templatedir = str(self.path / 'templates')
+
+        env = tasks.template_environment(cachedir=str(self.path))
+        assert tasks.template_environment() is env
+        assert tasks.template_environment(templatedir) is not env
+        assert (tasks.template_environment(templatedir) is
+                tasks.template_environment(templatedir))
+
+    def test_bytecode_cache(self):
+        cachedir = self.path / 'cache'
+        cachedir.mkdir()
+
+        tasks.init_templates(cachedir=str(cachedir))
+        assert len(list(cachedir.iterdir())) >= len(tasks.TEMPLATES)
+
+        # a new process (simulated by dropping the environment) loads
+        # the compiled templates from the cache
+        tasks._environments.clear()
+        env = tasks.template_environment(cachedir=str(cachedir))
+        with unittest.mock.patch.object(env, 'compile',
+                                        side_effect=AssertionError):
+            for name in tasks.TEMPLATES:
+                env.get_template(name)
+
+    def test_templatedir_override(self):
+        templatedir = self.path / 'templates'
+        templatedir.mkdir()
+        (templatedir / 'event.html').write_text('custom {{ title }}')
+
+        env = tasks.template_environment(str(templatedir),
+                                         cachedir=str(self.path))
+        assert env.get_template('event.html').render(title='x') == 'custom x'
+
+        # templates that are not overridden come from the package
+        assert 'Event list' in env.get_template('eventlist.html').render(
+            title='Event list', events=[], datadir=self.path)
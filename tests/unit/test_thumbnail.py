@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+import unittest.mock
+
+from pathlib import Path
+
+from PIL import Image, JpegImagePlugin
+
+from kcam import thumbnail
+from kcam.tasks import GenerateThumbnails
+
+
+class TestThumbnailer (unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+        self.thumbnailer = thumbnail.Thumbnailer(180, 240)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_image(self, name, size=(1296, 972)):
+        path = self.path / name
+        Image.new('RGB', size, (200, 100, 50)).save(str(path), 'JPEG')
+        return path
+
+    def test_draft_mode(self):
+        src = self.create_image('img.jpg')
+        dest = self.path / 'img-thumb.jpg'
+
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with unittest.mock.patch.object(
+                JpegImagePlugin.JpegImageFile, 'draft', autospec=True,
+                side_effect=draft) as mock_draft, \
+                unittest.mock.patch.object(
+                    thumbnail, 'convert_thumbnail') as mock_convert:
+            self.thumbnailer.generate(src, dest)
+
+        mock_draft.assert_any_call(unittest.mock.ANY, 'RGB', (180, 240))
+        mock_convert.assert_not_called()
+
+        with Image.open(str(dest)) as img:
+            assert img.format == 'JPEG'
+            assert img.size == (180, 135)
+
+    def test_fallback(self):
+        src = self.path / 'img.jpg'
+        src.write_bytes(b'not a jpeg')
+        dest = self.path / 'img-thumb.jpg'
+
+        with unittest.mock.patch.object(
+                thumbnail, 'convert_thumbnail') as mock_convert:
+            self.thumbnailer.generate(src, dest)
+
+        mock_convert.assert_called_once_with(src, dest, 180, 240)
+
+    def test_task_continues_after_failure(self):
+        self.create_image('img-1.jpg')
+        (self.path / 'img-2.jpg').write_bytes(b'not a jpeg')
+        self.create_image('img-3.jpg')
+
+        # convert is usually not installed now that Pillow is used
+        with unittest.mock.patch.object(
+                thumbnail, 'convert_thumbnail',
+                side_effect=FileNotFoundError('convert')):
+            assert not GenerateThumbnails()({'path': str(self.path)})
+
+        assert (self.path / 'img-1-thumb.jpg').is_file()
+        assert (self.path / 'img-3-thumb.jpg').is_file()
@@ -44,3 +44,43 @@ class TestTimer (unittest.TestCase):
         t1 = time.time()
 
         assert int(interval) * 2 == int(t1-t0)
+
+
+class TestTimerService (unittest.TestCase):
+
+    def setUp(self):
+        self.service = timer.TimerService()
+        self.service.start()
+        self.condition = threading.Event()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_schedule(self):
+        self.service.schedule(0.2, self.condition.set)
+
+        t0 = time.monotonic()
+        assert self.condition.wait(2)
+        assert time.monotonic() - t0 >= 0.2
+
+    def test_extend(self):
+        t = self.service.schedule(0.2, self.condition.set)
+        t.extend(0.6)
+
+        t0 = time.monotonic()
+        assert not self.condition.wait(0.4)
+        assert self.condition.wait(2)
+        assert time.monotonic() - t0 >= 0.6
+
+    def test_limit(self):
+        t = self.service.schedule(0.2, self.condition.set, limit=0.4)
+        t.extend(5)
+
+        assert self.condition.wait(2)
+
+    def test_cancel(self):
+        t = self.service.schedule(0.2, self.condition.set)
+        t.cancel()
+
+        assert not self.condition.wait(0.5)
+        assert not t.is_alive()